@@ -1,141 +1,398 @@
 from termcolor import colored
-import re
-import docker
-import tempfile
-import os
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import ValidationError
-from langchain_ollama import ChatOllama
-from models import CodeReviewResult, AgentState
-from utils import pretty_print_state_enhanced
+from langchain_core.messages import AIMessage, AIMessageChunk
+from models import CodeReviewResult, BatchedCodeReviewResult, AgentState
+from utils import debug_state
+from llm_cache import CachedChain, get_chain_cache
+from extraction import extract_best_code, StreamingCodeExtractor
+from static_check import check_code, available_modules
+from sandbox_images import installable_modules, image_for
+from exec_cache import get_execution_cache, normalize_code
+from review_batch import review_programs, get_review_batcher
+from tracing import llm_callbacks
+from prompt_layout import compile_prompt, PromptCacheCallback
+from model_registry import load_registry, stage_model
+from request_cache import get_request_cache, is_actionable
+import config
 
 
 # Import the prompt templates from the new file
-from prompts import preprocessor_prompt_template, code_generation_prompt_template, code_review_prompt_template
-
-# Define model
-model = ChatOllama(
-    base_url="http://localhost:11434",
-    model="llama3.2" #deepseek-coder-v2 nemotron qwen2.5-coder:32b llama3.2
-)
-
-# Define model
-model_json = ChatOllama(
-    base_url="http://localhost:11434",
-    model="llama3.2",
-    format="json"
-)
-
-# Initialize models for preprocessor, code generation, and code review agents
-preprocessor_model = model
-code_generator_model = model
-code_review_model = model_json.with_structured_output(CodeReviewResult)
-
-# Initialize chains for preprocessor, code generation, and code review agents
-preprocessor_agent_generator = preprocessor_prompt_template | preprocessor_model
-agent_code_generator = code_generation_prompt_template | code_generator_model
-code_review_agent_generator = code_review_prompt_template | code_review_model
+from prompts import preprocessor_prompt_template, code_generation_prompt_template, code_review_prompt_template, code_repair_prompt_template, code_review_batch_prompt_template
+
+
+class AgentChains:
+    # Models and chains for the preprocessor, code generation, repair and code review agents.
+    # Built on first use by get_chains() so importing this module stays cheap.
+    def __init__(self, registry=None):
+        # Model, host, options and latency budget of every stage come from the model registry
+        # (MODEL_REGISTRY_PATH); a stage that runs over its budget falls back to its smaller model.
+        # Stages on the same model should share num_ctx: a different value makes Ollama reload
+        # the model and drop its prompt cache.
+        registry = registry or load_registry()
+        self.registry = registry
+
+        # Set on the model rather than bound to the call, so the chain cache keys on it
+        stop = {"stop": config.CODEGEN_STOP_SEQUENCES} if config.CODEGEN_STOP_SEQUENCES else {}
+
+        def with_schema(schema):
+            return lambda model: model.with_structured_output(schema)
+
+        # Initialize models for preprocessor, code generation, and code review agents
+        preprocessor_model, preprocessor_runnable = stage_model(registry["preprocessor"])
+        code_generator_model, code_generator_runnable = stage_model(registry["generator"], **stop)
+        code_repair_model, code_repair_runnable = stage_model(registry["repair"], **stop)
+        code_review_model, code_review_runnable = stage_model(registry["reviewer"], with_schema(CodeReviewResult), format="json")
+        batch_review_model, batch_review_runnable = stage_model(
+            registry["reviewer_batch"], with_schema(BatchedCodeReviewResult), format="json"
+        )
+        self.batch_review_num_ctx = registry["reviewer_batch"].num_ctx
+
+        # Initialize chains for preprocessor, code generation, and code review agents.
+        # Each chain is wrapped in a persistent cache keyed on template, variables, model, generation options and format,
+        # checks whether its prompt kept the fixed prefix of the previous prompt on the same model,
+        # records Ollama's prompt evaluation counts per stage, and reports token counts and Ollama
+        # timings to the tracing spans when tracing is on.
+        chain_cache = get_chain_cache()
+        callbacks = llm_callbacks()
+
+        def chain(stage, prompt, model_runnable):
+            compiled = compile_prompt(stage, prompt)
+            return (prompt | model_runnable).with_config(callbacks=callbacks + [PromptCacheCallback(compiled)])
+
+        self.preprocessor = CachedChain(
+            "preprocessor", chain("preprocessor", preprocessor_prompt_template, preprocessor_runnable),
+            preprocessor_prompt_template, preprocessor_model, cache=chain_cache
+        )
+        self.generator = CachedChain(
+            "generator", chain("generator", code_generation_prompt_template, code_generator_runnable),
+            code_generation_prompt_template, code_generator_model, cache=chain_cache
+        )
+        self.repairer = CachedChain(
+            "repair", chain("repair", code_repair_prompt_template, code_repair_runnable),
+            code_repair_prompt_template, code_repair_model, cache=chain_cache
+        )
+        self.reviewer = CachedChain(
+            "reviewer", chain("reviewer", code_review_prompt_template, code_review_runnable),
+            code_review_prompt_template, code_review_model, output_model=CodeReviewResult, cache=chain_cache
+        )
+        # Not cached itself: its verdicts are stored per program in batch_verdicts
+        self.batch_reviewer = CachedChain(
+            "reviewer_batch", chain("reviewer_batch", code_review_batch_prompt_template, batch_review_runnable),
+            code_review_batch_prompt_template, batch_review_model, output_model=BatchedCodeReviewResult
+        )
+        # Lookup and store only: one verdict per program, keyed on the batch model and template,
+        # so batched verdicts are never served as the single reviewer's answers
+        self.batch_verdicts = CachedChain(
+            "reviewer_batch", None, code_review_batch_prompt_template, batch_review_model,
+            output_model=CodeReviewResult, cache=chain_cache
+        )
+
+        # Speculative generation: one generator and repairer per candidate, each sampling with
+        # its own temperature and seed so the candidates differ
+        self.candidate_generators = []
+        self.candidate_repairers = []
+        for index in range(config.CODEGEN_CANDIDATES if config.CODEGEN_CANDIDATES > 1 else 0):
+            sampling = {
+                "temperature": config.CODEGEN_CANDIDATE_TEMPERATURES[index % len(config.CODEGEN_CANDIDATE_TEMPERATURES)],
+                "seed": index,
+            }
+            candidate_model, candidate_runnable = stage_model(registry["generator"], **stop, **sampling)
+            self.candidate_generators.append(CachedChain(
+                "generator", chain("generator", code_generation_prompt_template, candidate_runnable),
+                code_generation_prompt_template, candidate_model, cache=chain_cache
+            ))
+            candidate_model, candidate_runnable = stage_model(registry["repair"], **stop, **sampling)
+            self.candidate_repairers.append(CachedChain(
+                "repair", chain("repair", code_repair_prompt_template, candidate_runnable),
+                code_repair_prompt_template, candidate_model, cache=chain_cache
+            ))
+
+    def all(self):
+        return ([self.preprocessor, self.generator, self.repairer, self.reviewer, self.batch_verdicts]
+                + self.candidate_generators + self.candidate_repairers)
+
+
+_chains = None
+_chains_lock = threading.Lock()
+
+def get_chains() -> AgentChains:
+    # One set of models and chains per process, created by the first request
+    global _chains
+    with _chains_lock:
+        if _chains is None:
+            _chains = AgentChains()
+        return _chains
+
+def chain_cache_stats():
+    if _chains is None:
+        return {}
+    # Candidate chains share their stage with the main generator and repairer
+    stats = {}
+    for chain in _chains.all():
+        totals = stats.setdefault(chain.stage, {"hits": 0, "misses": 0, "bypassed": 0})
+        for key, value in chain.stats().items():
+            if key in totals:
+                totals[key] += value
+    return stats
+
+def count_llm_call(state: AgentState, from_cache: bool):
+    # Cache hits don't reach the model, so they don't count as LLM calls
+    if not from_cache:
+        state["llm_calls"] = state.get("llm_calls", 0) + 1
 
 def agent_preprocessor(state: AgentState):
     print(colored("DEBUG: Preprocessing User Request...", "magenta"))
-    result = preprocessor_agent_generator.invoke({"user_request": state["initial_request"]})
-    # print(colored(f"DEBUG: Preprocessor Result: {result.content}", "magenta"))
-    state["preprocessor_agent_result"] = result.content
-    print(colored("DEBUG: agent_preprocessor state", "magenta"))
-    pretty_print_state_enhanced(state)
+    request = state["initial_request"]
+    request_cache = get_request_cache() if config.PREPROCESSOR_FAST_PATH else None
+    # Refinements are only reused while the preprocessor's model and prompt stay the same
+    refiner = get_chains().preprocessor.fingerprint()
+    task, source = request_cache.lookup(request, refiner) if request_cache else (None, None)
+    if task is None and config.PREPROCESSOR_FAST_PATH and is_actionable(request):
+        # Already a specific coding instruction; refining it would only restate it
+        task, source = request, "bypass"
+    if task is None:
+        result, from_cache = get_chains().preprocessor.invoke_with_cache_info({"user_request": request})
+        count_llm_call(state, from_cache)
+        task, source = result.content, "cache" if from_cache else "llm"
+        if request_cache:
+            request_cache.store(request, task, refiner)
+    else:
+        print(colored(f"DEBUG: Preprocessor fast path ({source})", "magenta"))
+    # print(colored(f"DEBUG: Preprocessor Result: {task}", "magenta"))
+    state["preprocessor_agent_result"] = task
+    state["preprocessor_source"] = source
+    debug_state("agent_preprocessor", state)
     return state
 
 def agent_code_generation(state: AgentState):
     print(colored("DEBUG: Generating Python Code...", "blue"))
+
+    # Speculative candidates from the last generation are tried before paying for a new one
+    if state.get("pending_candidates"):
+        candidate = state["pending_candidates"].pop(0)
+        print(colored(f"DEBUG: Trying the next speculative candidate ({len(state['pending_candidates'])} left)...", "yellow"))
+        reset_attempt_state(state)
+        state["generated_code_result"] = candidate["response"]
+        state["generation_stats"] = candidate["stats"]
+        if candidate.get("review"):
+            # Reviewed in one batch together with an earlier candidate
+            state["code_review_result"] = CodeReviewResult(**candidate["review"])
+        debug_state("agent_code_generation", state)
+        return state
     
-    # Check and reset the state at the beginning of the method if needed
-    if (state["generated_code_result"] == "regenerate" or 
-        state["code_review_result"] == "regenerate"):
-        print(colored("DEBUG: Resetting agent state due to regenerate flag...", "yellow"))
-        reset_keys = [
-            "generated_code_result", 
-            "extracted_python_code", 
-            "code_review_result", 
-            "final_output"
-        ]
-        for key in reset_keys:
-            state[key] = ""
+    # A previous attempt was rejected: keep its code and the reason it failed for the
+    # repair prompt, then reset the state. A cached completion must not be reused.
+    regenerating = state.get("attempts", 0) > 0
+    if regenerating:
+        print(colored(f"DEBUG: Repairing code, attempt {state['attempts'] + 1} of {config.MAX_ATTEMPTS}...", "yellow"))
+        previous_code = state["extracted_python_code"] or state["generated_code_result"]
+        feedback = state.get("repair_feedback") or "The previous attempt was rejected."
+        reset_attempt_state(state)
+        chain = get_chains().repairer
+        candidate_chains = get_chains().candidate_repairers
+        inputs = {"task": state["preprocessor_agent_result"], "previous_code": previous_code, "feedback": feedback}
     else:
         print(colored("DEBUG: Initial Generation of code. No need to reset agent state.", "green"))
+        chain = get_chains().generator
+        candidate_chains = get_chains().candidate_generators
+        inputs = {"task": state["preprocessor_agent_result"]}
+    state["attempts"] = state.get("attempts", 0) + 1
     
     # Continue with the rest of your code generation logic...
-    result = agent_code_generator.invoke({"task": state["preprocessor_agent_result"]})
-    # print(colored(f"DEBUG: Code Generation Result: {result.content}", "blue"))
-    state["generated_code_result"] = result.content
+    if candidate_chains:
+        candidates = generate_candidates(state, candidate_chains, inputs, refresh=regenerating)
+        content, state["generation_stats"] = candidates[0]["response"], candidates[0]["stats"]
+        state["pending_candidates"] = candidates[1:]
+    else:
+        content, state["generation_stats"] = generate_code(chain, inputs, refresh=regenerating)
+        count_llm_call(state, state["generation_stats"]["cache_hit"])
+    # print(colored(f"DEBUG: Code Generation Result: {content}", "blue"))
+    state["generated_code_result"] = content
     
     # Continue with the rest of your code generation logic...
-    print(colored("DEBUG: agent_code_generation state", "magenta"))
-    pretty_print_state_enhanced(state)
+    debug_state("agent_code_generation", state)
     return state
 
+def reset_attempt_state(state: AgentState):
+    reset_keys = [
+        "generated_code_result", 
+        "extracted_python_code", 
+        "static_check_result",
+        "code_review_result", 
+        "repair_feedback",
+        "final_output",
+        "execution_result"
+    ]
+    for key in reset_keys:
+        state[key] = ""
+
+def generate_code(chain: CachedChain, inputs: dict, refresh: bool = False):
+    # Returns (content, stats)
+    if config.CODEGEN_STREAM:
+        return stream_code_generation(chain, inputs, refresh=refresh)
+    result, from_cache = chain.invoke_with_cache_info(inputs, refresh=refresh)
+    return result.content, {"cache_hit": from_cache}
+
+def generate_candidates(state: AgentState, chains, inputs: dict, refresh: bool = False):
+    # Sample one candidate per chain (each has its own temperature and seed) concurrently,
+    # then check them locally and rank them: distinct programs that pass the static checks
+    # first, in chain order. Failing candidates are dropped unless nothing passes, in which
+    # case the first one is kept so the repair prompt gets its static check feedback.
+    # Each worker runs in a copy of this context so its LLM calls land on this node's tracing span
+    with ThreadPoolExecutor(max_workers=config.CODEGEN_CANDIDATE_CONCURRENCY) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, generate_code, chain, inputs, refresh)
+            for chain in chains
+        ]
+        results = [future.result() for future in futures]
+
+    modules = available_modules() | installable_modules()
+    passing, failing, seen = [], [], set()
+    for content, stats in results:
+        count_llm_call(state, stats["cache_hit"])
+        extracted = extract_best_code(content)
+        code = extracted.code if extracted else ""
+        key = normalize_code(code)
+        if key in seen:
+            continue
+        seen.add(key)
+        candidate = {"response": content, "stats": stats}
+        if code and (not config.STATIC_CHECK_ENABLED or check_code(code, modules)["status"] == "pass"):
+            passing.append(candidate)
+        else:
+            failing.append(candidate)
+
+    print(colored(f"DEBUG: {len(results)} candidates, {len(seen)} distinct, {len(passing)} pass the static checks", "blue"))
+    return passing or failing[:1]
+
+def stream_code_generation(chain: CachedChain, inputs: dict, refresh: bool = False):
+    # Stream the completion and (with CODEGEN_EARLY_STOP) stop reading once the first
+    # code block is closed. Closing the stream drops the HTTP response, which cancels
+    # the rest of the generation on the Ollama side.
+    extractor = StreamingCodeExtractor()
+    start = time.perf_counter()
+    first_token_at = None
+    from_cache = False
+    tokens_received = 0
+    tokens_after_fence = 0
+    fallback_models = []
+    restarts = 0
+    stream = chain.stream(inputs, refresh=refresh, fallback_models=fallback_models)
+    try:
+        for chunk in stream:
+            if len(fallback_models) > restarts:
+                # Over the latency budget: the fallback model starts the answer over
+                restarts = len(fallback_models)
+                extractor = StreamingCodeExtractor()
+                tokens_received = tokens_after_fence = 0
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            # A cache hit arrives as one complete message instead of chunks
+            from_cache = from_cache or not isinstance(chunk, AIMessageChunk)
+            tokens_received += 1
+            if extractor.result is not None:
+                tokens_after_fence += 1
+            elif extractor.feed(chunk.content) and config.CODEGEN_EARLY_STOP:
+                break
+    finally:
+        stream.close()
+
+    truncated = extractor.end is not None and config.CODEGEN_EARLY_STOP
+    content = extractor.text[:extractor.end] if truncated else extractor.text
+    # A fallback model's answer is not stored under the primary model's key
+    if not from_cache and not fallback_models:
+        chain.store(inputs, AIMessage(content=content))
+    stats = {
+        "cache_hit": from_cache,
+        "ttft_seconds": round(first_token_at - start, 3) if first_token_at else None,
+        "generation_seconds": round(time.perf_counter() - start, 3),
+        "tokens_received": tokens_received,
+        "stopped_early": truncated and not from_cache,
+        # Only non-zero when the stream ran to the end: the decode an early stop would have saved
+        "tokens_after_fence": tokens_after_fence,
+        "fallback_model": fallback_models[-1] if fallback_models else None,
+    }
+    print(colored(f"DEBUG: Code generation stream stats: {stats}", "blue"))
+    return content, stats
+
 def agent_extract_code(state: AgentState):
     print(colored("DEBUG: Extracting Python Code...", "magenta"))
     # print(colored(f"DEBUG: Generated Code Result: {state['generated_code_result']}", "green"))
 
     code_result = state["generated_code_result"]
 
-    code_block = re.search(r"```(?!python)(.*?)```", code_result, re.DOTALL)
-    code_block_with_lang = re.search(r"```python(.*?)```", code_result, re.DOTALL)
-    single_backtick_code = re.search(r"`(.*?)`", code_result, re.DOTALL)
-    
-    # 1. Try to extract code from triple backticks without the word 'python'
-    if code_block:
-        extracted_code = code_block.group(1).strip()
-        state["extracted_python_code"] = extracted_code
-        # print(colored(f"DEBUG: Extracted Python Code from triple backticks: {state['extracted_python_code']}", "green"))
-        print(colored("DEBUG: Extracted Python Code from triple backticks", "green"))
-        state["code_extraction_status"] = "continue"
-    
-    # 2. If that fails, try to extract from triple backticks with 'python'
-    elif code_block_with_lang:
-        extracted_code = code_block_with_lang.group(1).strip()
-        state["extracted_python_code"] = extracted_code
-        # print(colored(f"DEBUG: Extracted Python Code from triple backticks with 'python': {state['extracted_python_code']}", "green"))
-        print(colored("DEBUG: Extracted Python Code from triple backticks with 'python'", "green"))
-    
-        state["code_extraction_status"] = "continue"
-    
-    # 3. If that fails, try to extract from single backticks
-    elif single_backtick_code:
-        extracted_code = single_backtick_code.group(1).strip()
-        state["extracted_python_code"] = extracted_code
-        # print(colored(f"DEBUG: Extracted Python Code from single backticks: {state['extracted_python_code']}", "green"))
-        print(colored("DEBUG: Extracted Python Code from single backtick", "green"))
-        state["code_extraction_status"] = "continue"
-    
-    # 4. Fallback: Assume the entire result is the code if no backticks are found
-    elif code_result:
-        print(colored("DEBUG: No backticks found. Assuming entire result is the code.", "yellow"))
-        state["extracted_python_code"] = code_result.strip()
-        # print(colored(f"DEBUG: Fallback Extracted Python Code: {state['extracted_python_code']}", "yellow"))
-        print(colored("DEBUG: Fallback Extraction", "green"))
+    # Single pass over the response: every fenced/inline candidate is collected and the
+    # best one wins (fenced over inline, Python that parses over anything else, then size).
+    # If there are no backticks at all, the entire result is assumed to be the code.
+    candidate = extract_best_code(code_result)
+    if candidate:
+        state["extracted_python_code"] = candidate.code
+        # print(colored(f"DEBUG: Extracted Python Code: {state['extracted_python_code']}", "green"))
+        print(colored(f"DEBUG: Extracted Python Code ({candidate.kind}, parses={candidate.parses})", "green"))
         state["code_extraction_status"] = "continue"
     else:
         state["code_extraction_status"] = "regenerate"  # Extraction failed, regenerate
+        state["repair_feedback"] = "The response did not contain any code."
     
-    print(colored("DEBUG: agent_extract_code state", "magenta"))
-    pretty_print_state_enhanced(state)
+    debug_state("agent_extract_code", state)
 
     return state  # Always return state
 
+def retry_or_give_up(state: AgentState):
+    # Remaining speculative candidates are free to try; otherwise regenerate while the
+    # per-request attempt budget lasts
+    if state.get("pending_candidates"):
+        return "regenerate"
+    if state.get("attempts", 0) >= config.MAX_ATTEMPTS:
+        return "give_up"
+    return "regenerate"
+
 def conditional_should_continue_after_extraction(state: AgentState):
     # Check if the extraction was successful and we have some code to work with
     if state["code_extraction_status"] == "continue":
         return "continue"
     else:
-        return "regenerate"
+        return retry_or_give_up(state)
+
+def agent_static_check(state: AgentState):
+    print(colored("DEBUG: Running local static checks...", "magenta"))
+
+    # Syntax, markdown leftovers, sandbox imports and undefined names are checked locally
+    # in milliseconds, so only plausible programs pay for an LLM review round trip
+    if config.STATIC_CHECK_ENABLED:
+        # Third-party imports pass when their package can be installed from the wheelhouse
+        result = check_code(state["extracted_python_code"], available_modules() | installable_modules())
+    else:
+        result = {"status": "pass", "reason": None, "detail": "static checks disabled"}
+    state["static_check_result"] = result
+
+    if result["status"] == "pass":
+        state["static_check_status"] = "continue"
+    else:
+        print(colored(f"DEBUG: Static check failed ({result['reason']}): {result['detail']}", "yellow"))
+        state["static_check_status"] = "regenerate"
+        state["repair_feedback"] = f"Static check failed ({result['reason']}): {result['detail']}"
+
+    debug_state("agent_static_check", state)
+
+    return state
+
+def conditional_should_continue_after_static_check(state: AgentState):
+    if state["static_check_status"] == "continue":
+        return "continue"
+    else:
+        return retry_or_give_up(state)
 
 def agent_code_review(state: AgentState):
     print(colored("DEBUG: Reviewing Python Code...", "magenta"))
     
-    code_review_result = code_review_agent_generator.invoke({"generated_code": state["extracted_python_code"], "initial_request": state["preprocessor_agent_result"]})
-
     try:
-        
+        code_review_result = review_code(state)
+
         # Print and store in agent state
         # print(colored("Reviewed Code:", "yellow"))
         if isinstance(code_review_result, CodeReviewResult):
@@ -150,6 +407,7 @@ def agent_code_review(state: AgentState):
             state["code_review_status"] = "continue"
         else:
             state["code_review_status"] = "regenerate"
+            state["repair_feedback"] = code_review_result.message
 
     except ValidationError as e:
         print(colored(f"ERROR: Code review validation failed with error: {e}", "red"))
@@ -159,46 +417,120 @@ def agent_code_review(state: AgentState):
         print(colored(f"ERROR: Error parsing JSON: {e}", "red"))
         state["code_review_status"] = "regenerate"
     
-    print(colored("DEBUG: agent_code_review state", "magenta"))
-    pretty_print_state_enhanced(state)
+    debug_state("agent_code_review", state)
 
 
     return state  # Always return state
 
+def review_code(state: AgentState) -> CodeReviewResult:
+    inputs = {"generated_code": state["extracted_python_code"], "initial_request": state["preprocessor_agent_result"]}
+    if isinstance(state.get("code_review_result"), CodeReviewResult):
+        return state["code_review_result"]
+
+    review, calls, batched = None, 0, False
+    if state.get("pending_candidates") and config.REVIEW_BATCH_ENABLED:
+        # Review the pending speculative candidates in the same call; their verdicts are
+        # kept on the candidates in case this program is rejected
+        candidates = [c for c in state["pending_candidates"] if extract_best_code(c["response"])]
+        items = [inputs] + [
+            {"generated_code": extract_best_code(c["response"]).code, "initial_request": inputs["initial_request"]}
+            for c in candidates
+        ]
+        reviews = review_programs(get_chains(), items)
+        for candidate, (candidate_review, _) in zip(candidates, reviews[1:]):
+            if candidate_review is not None:
+                candidate["review"] = candidate_review.model_dump()
+        review, calls = reviews[0][0], sum(c for _, c in reviews)
+        batched = True
+    elif config.REVIEW_BATCH_WINDOW_MS > 0:
+        # Share the review call with whatever other requests are reviewing right now
+        review, calls = get_review_batcher(get_chains()).review(inputs)
+        batched = True
+    state["llm_calls"] = state.get("llm_calls", 0) + calls
+
+    if review is None:
+        if batched:
+            # review_programs already fell back to a single review of this program, and it failed
+            raise RuntimeError("The code review failed")
+        review, from_cache = get_chains().reviewer.invoke_with_cache_info(inputs)
+        count_llm_call(state, from_cache)
+    return review
+
 def conditional_should_continue_after_code_review(state: AgentState):
     # Check if the extraction was successful and we have some code to work with
     if state["code_review_status"] == "continue":
         return "continue"
     else:
-        return "regenerate"
+        return retry_or_give_up(state)
 
 def agent_execute_code_in_docker(state: AgentState):
     print(colored("DEBUG: Running code in Docker...", "magenta"))
     # print(colored(f"DEBUG: Final Python Code to run: {state['extracted_python_code']}", "cyan"))
 
-    with tempfile.NamedTemporaryFile(suffix=".py", delete=False) as temp_code_file:
-        temp_code_file.write(state["extracted_python_code"].encode('utf-8'))
-        temp_code_filename = temp_code_file.name
+    # The Docker SDK is only imported once code actually has to run
+    from sandbox import get_sandbox_pool_for, SandboxError
 
-    client = docker.from_env()
+    code = state["extracted_python_code"]
+    execution_cache = get_execution_cache()
+    pool = None
     try:
-        container_output = client.containers.run(
-            image="python:3.9-slim",
-            command=f"python {os.path.basename(temp_code_filename)}",
-            volumes={os.path.dirname(temp_code_filename): {'bind': '/usr/src/app', 'mode': 'rw'}},
-            working_dir="/usr/src/app",
-            remove=True,
-            stdout=True,
-            stderr=True
-        )
-        state["final_output"] = container_output.decode('utf-8')
-        # print(colored("DEBUG: Docker Output:", "cyan"), state["final_output"])
-    except docker.errors.ContainerError as e:
+        # Deterministic programs that already ran in the same image are not run again
+        image = image_for(code)
+        result = execution_cache.lookup(code, image)
+        if result is None:
+            # Programs with third-party imports run in an image that has their packages
+            pool = get_sandbox_pool_for(code)
+            result = pool.run_code(code)
+            result["image"] = pool.image
+            execution_cache.store(code, image, result)
+        result["cache_hit"] = pool is None
+        output = result.pop("output")
+        result.pop("stdout")
+        result.pop("stderr")
+        state["execution_result"] = result
+        if result["exit_code"] == 0:
+            state["final_output"] = output
+            state["status"] = "solved"
+            # Speculative candidates that were never needed are dropped
+            state["pending_candidates"] = []
+            # print(colored("DEBUG: Docker Output:", "cyan"), state["final_output"])
+        elif result["timed_out"]:
+            print(colored(f"ERROR: Code did not finish within {config.SANDBOX_TIMEOUT_SECONDS}s and was stopped.", "red"))
+            state["status"] = "execution_failed"
+            state["repair_feedback"] = (
+                f"The program did not finish within {config.SANDBOX_TIMEOUT_SECONDS} seconds and was stopped. "
+                f"It must terminate quickly without waiting for input. Output so far:\n{output[-2000:]}"
+            )
+        elif result["limit_killed"]:
+            print(colored(f"ERROR: Code was killed for exceeding the sandbox memory limit ({config.SANDBOX_MEM_LIMIT}).", "red"))
+            state["status"] = "execution_failed"
+            state["repair_feedback"] = (
+                f"The program was killed for using more than {config.SANDBOX_MEM_LIMIT} of memory. Output so far:\n{output[-2000:]}"
+            )
+        else:
+            print(colored(f"ERROR: Error running code in container (exit code {result['exit_code']}): {output}", "red"))
+            state["status"] = "execution_failed"
+            state["repair_feedback"] = f"The program failed when run (exit code {result['exit_code']}):\n{output[-2000:]}"
+    except (SandboxError, TimeoutError) as e:
         print(colored(f"ERROR: Error running code in container: {str(e)}", "red"))
-    
-    os.remove(temp_code_filename)
+        state["status"] = "sandbox_error"
+    else:
+        if pool is None:
+            print(colored("DEBUG: Reused the cached result of an identical deterministic program.", "magenta"))
+        else:
+            print(colored(f"DEBUG: Ran in {result['runtime_seconds']}s, sandbox pool stats: {pool.stats()}", "magenta"))
+
+    debug_state("agent_execute_code_in_docker", state)
+
+    return state
 
-    print(colored("DEBUG: agent_execute_code_in_docker state", "magenta"))
-    pretty_print_state_enhanced(state)
+def conditional_should_continue_after_execution(state: AgentState):
+    # Only a program that ran and failed is worth repairing; sandbox errors are not the code's fault
+    if state["status"] == "execution_failed":
+        return retry_or_give_up(state)
+    return "done"
 
+def agent_give_up(state: AgentState):
+    print(colored(f"ERROR: Giving up after {state['attempts']} attempts. Last feedback: {state['repair_feedback']}", "red"))
+    state["status"] = "failed"
     return state
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from termcolor import colored
+
+import config
+from agents import chain_cache_stats
+from exec_cache import get_execution_cache
+from prompt_layout import prompt_cache_stats
+from utils import percentile
+from checkpoints import aprepare_retry, is_unfinished, open_async_checkpointer, prune, thread_config, thread_id_for
+from workflow_langgrapgh_dynamic_agent import build_app, get_app, initial_requests, invoke_config, make_initial_state
+
+
+# Usage:
+#   python batch_runner.py requests.txt --output results.jsonl --concurrency 8
+#   cat requests.txt | python batch_runner.py -
+#   python batch_runner.py --demo            # run the built-in initial_requests
+#
+# Input is one request per line. A line may also be a JSON object with a
+# "request" key and an optional "id".
+
+
+def read_requests(source):
+    lines = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    requests = []
+    try:
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                requests.append({"id": str(item.get("id", line_number)), "request": item["request"]})
+            else:
+                requests.append({"id": str(line_number), "request": line})
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+    return requests
+
+
+async def run_one(app, item, semaphore):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            if app.checkpointer is None:
+                result = await app.ainvoke(make_initial_state(item["request"], item["id"]), invoke_config)
+            else:
+                result = await run_checkpointed(app, item)
+            record = {
+                "status": result.get("status", ""),
+                "final_output": result.get("final_output", ""),
+                "attempts": result.get("attempts", 0),
+                "llm_calls": result.get("llm_calls", 0),
+                "preprocessor": result.get("preprocessor_source", ""),
+                "execution": result.get("execution_result") or {},
+            }
+        except Exception as e:
+            record = {"status": "error", "error": str(e)}
+        record["latency_seconds"] = round(time.perf_counter() - start, 3)
+    return {"id": item["id"], "request": item["request"], **record}
+
+
+async def run_checkpointed(app, item):
+    # Resume from the last finished node; a finished run just returns its saved state,
+    # unless it ended on a sandbox error, which is run again from the execution node
+    run_config = thread_config(thread_id_for(item["id"], item["request"]), invoke_config)
+    snapshot = await app.aget_state(run_config)
+    if snapshot.values and not is_unfinished(snapshot):
+        return snapshot.values
+    await aprepare_retry(app, run_config, snapshot)
+    state = None if snapshot.values else make_initial_state(item["request"], item["id"])
+    # "sync" writes each checkpoint before the next node starts, so a crash loses at most one node
+    return await app.ainvoke(state, run_config, durability="sync")
+
+
+async def run_batch(requests, concurrency, output, checkpoint_path=""):
+    # Sync graph nodes run on the default executor, so it needs one thread per in-flight request
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    if not checkpoint_path:
+        return await _run_all(get_app(), requests, concurrency, output)
+    async with open_async_checkpointer(checkpoint_path) as saver:
+        records, elapsed = await _run_all(build_app(checkpointer=saver), requests, concurrency, output)
+    prune(checkpoint_path)
+    return records, elapsed
+
+
+async def _run_all(app, requests, concurrency, output):
+    semaphore = asyncio.Semaphore(concurrency)
+    records = []
+    start = time.perf_counter()
+    # Records are written in completion order, so a slow request never holds back finished ones
+    for next_done in asyncio.as_completed([run_one(app, item, semaphore) for item in requests]):
+        record = await next_done
+        records.append(record)
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+    elapsed = time.perf_counter() - start
+    return records, elapsed
+
+
+def print_report(records, elapsed, concurrency):
+    latencies = [r["latency_seconds"] for r in records]
+    solved = [r for r in records if r["status"] == "solved"]
+    print(colored("Batch Report:", "magenta"), file=sys.stderr)
+    print(f"  requests:    {len(records)} ({len(solved)} solved, {len(records) - len(solved)} not solved)", file=sys.stderr)
+    print(f"  concurrency: {concurrency}", file=sys.stderr)
+    print(f"  wall time:   {elapsed:.2f}s", file=sys.stderr)
+    print(f"  throughput:  {len(records) / elapsed if elapsed else 0.0:.3f} requests/s", file=sys.stderr)
+    print(f"  latency p50: {percentile(latencies, 50):.2f}s  p95: {percentile(latencies, 95):.2f}s  "
+          f"max: {max(latencies, default=0.0):.2f}s", file=sys.stderr)
+    if solved:
+        llm_calls = sum(r["llm_calls"] for r in solved) / len(solved)
+        attempts = sum(r["attempts"] for r in solved) / len(solved)
+        print(f"  per solved:  {llm_calls:.2f} LLM calls, {attempts:.2f} generation attempts", file=sys.stderr)
+    sources = [r.get("preprocessor") for r in records if r.get("preprocessor")]
+    if sources:
+        fast = sum(source in ("exact", "near_duplicate", "bypass") for source in sources)
+        print(f"  preprocessor: {fast / len(sources):.0%} fast path ({sources.count('bypass')} bypassed, "
+              f"{sources.count('exact')} exact and {sources.count('near_duplicate')} near-duplicate hits), "
+              f"{sources.count('cache')} chain cache hits, {sources.count('llm')} LLM calls", file=sys.stderr)
+    for stage, stats in chain_cache_stats().items():
+        print(f"  {stage} cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['bypassed']} bypassed", file=sys.stderr)
+    for stage, stats in prompt_cache_stats().items():
+        if stats["measured_calls"]:
+            print(f"  {stage} prompt: {stats['prompt_eval_count'] / stats['measured_calls']:.0f} tokens evaluated per call, "
+                  f"{stats['reuse_ratio']:.0%} of prompt tokens reused, ~{stats['estimated_seconds_saved']:.1f}s saved", file=sys.stderr)
+        if stats["prefix_breaks"]:
+            print(colored(f"  {stage} prompt: {stats['prefix_breaks']} of {stats['compared_calls']} prompts did not share "
+                          "the fixed prefix with the previous prompt on their model", "yellow"), file=sys.stderr)
+    execution_stats = get_execution_cache().stats()
+    print(f"  sandbox cache: {execution_stats['hits']} hits, {execution_stats['misses']} misses, "
+          f"{execution_stats['impure']} not cacheable", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the dynamic agent workflow over a batch of requests.")
+    parser.add_argument("source", nargs="?", help="File with one request per line, or '-' for stdin.")
+    parser.add_argument("--demo", action="store_true", help="Run the built-in initial_requests list.")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file for result records.")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_CONCURRENCY)
+    parser.add_argument("--checkpoint", default=config.CHECKPOINT_PATH, metavar="SQLITE",
+                        help="Save state after every node and resume interrupted requests on the next run.")
+    args = parser.parse_args()
+
+    if args.demo:
+        requests = [{"id": str(i), "request": r} for i, r in enumerate(initial_requests, start=1)]
+    elif args.source:
+        requests = read_requests(args.source)
+    else:
+        parser.error("provide a request file, '-' for stdin, or --demo")
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        records, elapsed = asyncio.run(run_batch(requests, args.concurrency, output, args.checkpoint))
+    print_report(records, elapsed, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
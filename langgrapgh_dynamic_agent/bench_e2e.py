@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import gc
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import tracemalloc
+from collections import defaultdict
+
+# Offline end-to-end benchmark of the dynamic agent.
+#
+# `record` runs initial_requests once against the live Ollama server and Docker
+# daemon and saves every chat call and sandbox result to a cassette (see
+# cassettes.py). `run` replays the cassette, so the whole graph runs without
+# either service, and reports:
+#   per-node overhead  - node wall time minus the simulated model/sandbox latency
+#   throughput         - requests/s over --repeat passes after a warm-up pass
+#   memory             - peak RSS, and the Python heap peak and retained size of one
+#                        extra pass under tracemalloc
+# Thresholds (and/or a saved baseline) turn the report into a regression check:
+# the exit status is 1 when any of them is exceeded.
+#
+#   python bench_e2e.py record --cassette cassette.jsonl
+#   python bench_e2e.py run --repeat 3 --max-node-overhead-ms 50 --min-throughput 5
+#   python bench_e2e.py run --save-baseline bench_baseline.json
+#   python bench_e2e.py run --baseline bench_baseline.json --tolerance 0.25
+#
+# Caches, checkpoints and the cross-request review window are switched off so
+# every pass does the same work and the cassette keys match between runs.
+
+
+def configure(mode, cassette, latency_scale, trace_file):
+    # Must happen before config is imported
+    os.environ.update({
+        "CASSETTE_MODE": mode,
+        "CASSETTE_PATH": cassette,
+        "CASSETTE_LATENCY_SCALE": str(latency_scale),
+        "LLM_CACHE_PATH": "",
+        "CHECKPOINT_PATH": "",
+        "REVIEW_BATCH_WINDOW_MS": "0",
+        "TRACE_FILE": trace_file,
+    })
+
+
+def run_pass(prefix, concurrency):
+    from batch_runner import run_batch
+    from workflow_langgrapgh_dynamic_agent import initial_requests
+
+    requests = [{"id": f"{prefix}-{i}", "request": r} for i, r in enumerate(initial_requests, start=1)]
+    return asyncio.run(run_batch(requests, concurrency, io.StringIO()))
+
+
+def node_overheads(trace_file, prefixes):
+    """{node: [overhead seconds]} for the spans of the given passes."""
+    from tracing import load_spans
+
+    overheads = defaultdict(list)
+    for span in load_spans(trace_file):
+        if span["request_id"].split("-", 1)[0] in prefixes:
+            overheads[span["node"]].append(span["wall_seconds"] - span.get("replay_wait_seconds", 0.0))
+    return overheads
+
+
+def measure_heap(concurrency):
+    # A separate pass: tracemalloc slows everything down, so it is kept out of the timings
+    gc.collect()
+    tracemalloc.start()
+    run_pass("heap", concurrency)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2 ** 20, retained / 2 ** 20
+
+
+def check(results, name, value, limit, higher_is_better=False):
+    if limit is None:
+        return
+    failed = value < limit if higher_is_better else value > limit
+    results.append((name, value, limit, failed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay initial_requests offline and measure the framework's overhead.")
+    parser.add_argument("command", choices=["record", "run"])
+    parser.add_argument("--cassette", default="cassette.jsonl")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over initial_requests.")
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="Replay model and sandbox calls at this fraction of their recorded latency.")
+    parser.add_argument("--max-node-overhead-ms", type=float, help="Fail when any node's p95 overhead exceeds this.")
+    parser.add_argument("--min-throughput", type=float, help="Fail below this many requests/s.")
+    parser.add_argument("--max-rss-mb", type=float, help="Fail above this peak RSS.")
+    parser.add_argument("--max-heap-mb", type=float, help="Fail above this Python heap peak.")
+    parser.add_argument("--baseline", help="JSON file from --save-baseline to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed regression against the baseline.")
+    parser.add_argument("--save-baseline", help="Write this run's metrics as a baseline.")
+    args = parser.parse_args()
+
+    trace_file = tempfile.NamedTemporaryFile(prefix="bench_e2e_", suffix=".jsonl", delete=False).name
+    configure("record" if args.command == "record" else "replay", args.cassette, args.latency_scale, trace_file)
+    from termcolor import colored
+    from cassettes import get_cassette
+    from utils import percentile
+
+    try:
+        if args.command == "record":
+            records, elapsed = run_pass("record", args.concurrency)
+            solved = sum(r["status"] == "solved" for r in records)
+            print(f"Recorded {get_cassette().stats()['recorded']} calls for {len(records)} requests "
+                  f"({solved} solved) in {elapsed:.1f}s to {args.cassette}")
+            return
+
+        run_pass("warmup", args.concurrency)
+        records, elapsed = [], 0.0
+        for index in range(args.repeat):
+            pass_records, pass_elapsed = run_pass(f"pass{index}", args.concurrency)
+            records += pass_records
+            elapsed += pass_elapsed
+        overheads = node_overheads(trace_file, {f"pass{index}" for index in range(args.repeat)})
+        heap_peak_mb, heap_retained_mb = measure_heap(args.concurrency)
+    finally:
+        os.unlink(trace_file)
+
+    # ru_maxrss is in kilobytes on Linux
+    rss_peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    throughput = len(records) / elapsed if elapsed else 0.0
+    statuses = defaultdict(int)
+    for record in records:
+        statuses[record["status"]] += 1
+    metrics = {
+        "throughput": throughput,
+        "node_overhead_p95_ms": {node: percentile(values, 95) * 1000 for node, values in overheads.items()},
+        "rss_peak_mb": rss_peak_mb,
+        "heap_peak_mb": heap_peak_mb,
+    }
+
+    print(colored("End-to-end benchmark (replayed):", "magenta"))
+    print(f"  requests:   {len(records)} over {args.repeat} passes, concurrency {args.concurrency}, "
+          f"latency scale {args.latency_scale}")
+    print(f"  statuses:   {', '.join(f'{count} {status}' for status, count in sorted(statuses.items()))}")
+    print(f"  throughput: {throughput:.2f} requests/s ({elapsed:.2f}s)")
+    print(f"  memory:     peak RSS {rss_peak_mb:.1f} MB, Python heap peak {heap_peak_mb:.1f} MB, "
+          f"retained {heap_retained_mb:.1f} MB")
+    print(f"  cassette:   {get_cassette().stats()}")
+    errors = [record["error"] for record in records if record["status"] == "error"]
+    if errors:
+        print(colored(f"  first error: {errors[0]}", "red"))
+    print(f"  {'node':<30} {'count':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for node, values in sorted(overheads.items()):
+        print(f"  {node:<30} {len(values):>6} {sum(values) / len(values) * 1000:>9.2f} "
+              f"{percentile(values, 50) * 1000:>9.2f} {percentile(values, 95) * 1000:>9.2f}")
+
+    results = []
+    # A request that left the cassette (changed prompt, model or limits) is not a valid measurement
+    check(results, "cassette misses", get_cassette().stats()["misses"], 0)
+    check(results, "errored requests", statuses.get("error", 0), 0)
+    check(results, "throughput", throughput, args.min_throughput, higher_is_better=True)
+    check(results, "peak RSS MB", rss_peak_mb, args.max_rss_mb)
+    check(results, "heap peak MB", heap_peak_mb, args.max_heap_mb)
+    for node, value in metrics["node_overhead_p95_ms"].items():
+        check(results, f"{node} p95 ms", value, args.max_node_overhead_ms)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        slack = 1 + args.tolerance
+        check(results, "throughput vs baseline", throughput, baseline["throughput"] / slack, higher_is_better=True)
+        check(results, "peak RSS MB vs baseline", rss_peak_mb, baseline["rss_peak_mb"] * slack)
+        check(results, "heap peak MB vs baseline", heap_peak_mb, baseline["heap_peak_mb"] * slack)
+        for node, value in metrics["node_overhead_p95_ms"].items():
+            if node in baseline["node_overhead_p95_ms"]:
+                check(results, f"{node} p95 ms vs baseline", value, baseline["node_overhead_p95_ms"][node] * slack)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    failures = [result for result in results if result[3]]
+    for name, value, limit, _ in failures:
+        print(colored(f"FAIL: {name} = {value:.2f} (limit {limit:.2f})", "red"))
+    if results and not failures:
+        print(colored(f"All {len(results)} checks passed.", "green"))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
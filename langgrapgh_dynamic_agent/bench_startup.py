@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold-start benchmark for worker processes.
+#
+# Every run starts a fresh interpreter and measures, inside it:
+#   import  - importing workflow_langgrapgh_dynamic_agent
+#   app     - compiling the graph with get_app()
+#   chains  - constructing the models and chains with get_chains() (no network)
+#   request - running one request end to end (only with --request; needs Ollama and Docker)
+# plus the wall time of the whole process. `-X importtime` then lists the slowest imports.
+#
+#   python bench_startup.py --runs 5
+#   python bench_startup.py --runs 3 --request "Calculate the factorial of 10."
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import workflow_langgrapgh_dynamic_agent as workflow
+t1 = time.perf_counter()
+app = workflow.get_app()
+t2 = time.perf_counter()
+from agents import get_chains
+get_chains()
+t3 = time.perf_counter()
+timings = {"import": t1 - t0, "app": t2 - t1, "chains": t3 - t2}
+if len(sys.argv) > 1:
+    app.invoke(workflow.make_initial_state(sys.argv[1]), workflow.invoke_config)
+    timings["request"] = time.perf_counter() - t3
+print("STARTUP_TIMINGS " + json.dumps(timings))
+"""
+
+
+def run_probe(request=None):
+    start = time.perf_counter()
+    command = [sys.executable, "-c", _PROBE] + ([request] if request else [])
+    result = subprocess.run(command, cwd=HERE, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    line = next(l for l in result.stdout.splitlines() if l.startswith("STARTUP_TIMINGS "))
+    timings = json.loads(line.split(" ", 1)[1])
+    timings["process"] = wall
+    return timings
+
+
+def slowest_imports(top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import workflow_langgrapgh_dynamic_agent"],
+        cwd=HERE, capture_output=True, text=True, check=True,
+    )
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start cost of the dynamic agent.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--request", help="Also time one end-to-end request (needs Ollama and Docker).")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest imports to list.")
+    args = parser.parse_args()
+
+    runs = [run_probe(args.request) for _ in range(args.runs)]
+    print(f"cold start over {args.runs} runs (median / max, seconds)")
+    for key in ("import", "app", "chains", "request", "process"):
+        values = [run[key] for run in runs if key in run]
+        if values:
+            print(f"  {key:<8} {statistics.median(values):8.3f} {max(values):8.3f}")
+
+    print("\nslowest imports (cumulative / self, ms)")
+    for cumulative_us, self_us, name in slowest_imports(args.top):
+        print(f"  {cumulative_us / 1000:9.1f} {self_us / 1000:9.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_ollama import ChatOllama
+
+import config
+import tracing
+
+# Record/replay cassettes for offline runs.
+#
+# CASSETTE_MODE=record runs against the live Ollama server and Docker daemon and
+# writes every chat request/response and every sandbox result to CASSETTE_PATH
+# (JSON lines). CASSETTE_MODE=replay serves them back from the file without
+# contacting either, so the whole graph runs offline and deterministically.
+#
+# Chat calls are keyed on the request Ollama would receive (model, messages,
+# format, options), sandbox runs on the execution cache key (exact code, image,
+# limits). What the static check and image resolution read from the recording
+# machine (the sandbox's module set and the wheelhouse) is saved in the header
+# line, and the image each program resolved to in an "image" entry, so replay
+# takes the same branches on a machine with another or no wheelhouse. A key recorded several times is replayed in recorded order and
+# the last response repeats. Replay waits CASSETTE_LATENCY_SCALE times the
+# recorded latency (0 serves immediately, 1 reproduces the recorded timing) and
+# adds the wait to the current tracing span as replay_wait_seconds.
+
+# Roughly one token per chunk when a recorded response is streamed back
+_STREAM_PIECE = re.compile(r"\s*\S+|\s+")
+
+
+class CassetteError(Exception):
+    pass
+
+
+class Cassette:
+    """One cassette file, opened for recording (truncated) or for replay."""
+
+    def __init__(self, path, mode, latency_scale=0.0, header=None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode!r} (expected 'record' or 'replay')")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.header = header or {}
+        self._lock = threading.Lock()
+        self._entries = defaultdict(list)
+        self._served = defaultdict(int)
+        self._recorded_once = set()
+        self._stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        if mode == "record":
+            self._file = open(path, "w", encoding="utf-8", buffering=1)
+            self._file.write(json.dumps({"kind": "header", **self.header}) + "\n")
+        else:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            if entry["kind"] == "header":
+                                self.header = entry
+                            else:
+                                self._entries[(entry["kind"], entry["key"])].append(entry)
+            except FileNotFoundError:
+                raise CassetteError(f"No cassette at {path}; record one with CASSETTE_MODE=record") from None
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def record(self, kind: str, key: str, entry: dict):
+        line = json.dumps({"kind": kind, "key": key, **entry}, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._stats["recorded"] += 1
+
+    def record_once(self, kind: str, key: str, entry: dict):
+        # For facts about a key rather than calls: later records of the same key are dropped
+        with self._lock:
+            if (kind, key) in self._recorded_once:
+                return
+            self._recorded_once.add((kind, key))
+        self.record(kind, key, entry)
+
+    def replay(self, kind: str, key: str) -> dict:
+        with self._lock:
+            entries = self._entries.get((kind, key))
+            if not entries:
+                self._stats["misses"] += 1
+                raise CassetteError(f"{kind} request {key[:12]} is not on the cassette {self.path}; "
+                                    "re-record it after changing prompts, models or limits")
+            served = self._served[(kind, key)]
+            self._served[(kind, key)] += 1
+            self._stats["replayed"] += 1
+        return entries[min(served, len(entries) - 1)]
+
+    def find(self, kind: str, key: str):
+        """First recorded entry for the key, or None; does not count as a replay."""
+        with self._lock:
+            entries = self._entries.get((kind, key))
+        return entries[0] if entries else None
+
+    def wait(self, seconds):
+        # Simulated latency of a replayed call
+        delay = (seconds or 0.0) * self.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+            tracing.record("replay_wait_seconds", delay)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Cassette:
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            header = _environment() if config.CASSETTE_MODE == "record" else None
+            _cassette = Cassette(config.CASSETTE_PATH, config.CASSETTE_MODE, config.CASSETTE_LATENCY_SCALE, header)
+        return _cassette
+
+
+def _environment():
+    # The machine-specific inputs of the static check and of image resolution
+    from sandbox_images import installable_modules
+    from static_check import available_modules
+
+    return {"available_modules": sorted(available_modules()), "installable_modules": sorted(installable_modules())}
+
+
+def replayed_modules(name: str):
+    """Module set `name` from the header of the cassette being replayed, or None.
+
+    None also for cassettes recorded before the header existed, which then fall
+    back to this machine's modules.
+    """
+    if config.CASSETTE_MODE != "replay":
+        return None
+    modules = get_cassette().header.get(name)
+    return set(modules) if modules is not None else None
+
+
+def request_key(params: dict) -> str:
+    # Everything that shapes the response; stream and keep_alive don't
+    payload = {key: value for key, value in params.items() if key not in ("stream", "keep_alive")}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class CassetteChatOllama(ChatOllama):
+    """ChatOllama that records its calls to the cassette, or serves them from it.
+
+    Subclassing keeps bind(), with_structured_output() and the stop/format handling
+    of ChatOllama, so chains are built exactly as they are against the live server.
+    """
+
+    def _key(self, messages, stop, kwargs):
+        return request_key(self._chat_params(messages, stop, **dict(kwargs)))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cassette = get_cassette()
+        key = self._key(messages, stop, kwargs)
+        if cassette.replaying:
+            entry = cassette.replay("chat", key)
+            cassette.wait(entry["latency_seconds"])
+            return ChatResult(generations=[ChatGeneration(
+                message=AIMessage(content=entry["content"], response_metadata=entry["generation_info"] or {}),
+                generation_info=entry["generation_info"],
+            )])
+
+        start = time.perf_counter()
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        generation = result.generations[0]
+        cassette.record("chat", key, {
+            "model": self.model,
+            "content": generation.message.content,
+            "generation_info": generation.generation_info,
+            "latency_seconds": round(time.perf_counter() - start, 3),
+            "ttft_seconds": None,
+        })
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        cassette = get_cassette()
+        key = self._key(messages, stop, kwargs)
+        if cassette.replaying:
+            yield from self._replay_stream(cassette.replay("chat", key), run_manager)
+            return
+
+        # The reader may close the stream early (CODEGEN_EARLY_STOP); what it read is what gets recorded
+        start = time.perf_counter()
+        first_token_at = None
+        content = ""
+        generation_info = None
+        try:
+            for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                content += chunk.text
+                generation_info = chunk.generation_info or generation_info
+                yield chunk
+        finally:
+            cassette.record("chat", key, {
+                "model": self.model,
+                "content": content,
+                "generation_info": generation_info,
+                "latency_seconds": round(time.perf_counter() - start, 3),
+                "ttft_seconds": round(first_token_at - start, 3) if first_token_at else None,
+            })
+
+    def _replay_stream(self, entry, run_manager):
+        pieces = _STREAM_PIECE.findall(entry["content"]) or [""]
+        cassette = get_cassette()
+        ttft = entry["ttft_seconds"] if entry["ttft_seconds"] is not None else entry["latency_seconds"]
+        cassette.wait(ttft)
+        per_piece = max(0.0, entry["latency_seconds"] - ttft) / len(pieces)
+        for index, piece in enumerate(pieces):
+            if index:
+                cassette.wait(per_piece)
+            last = index == len(pieces) - 1
+            chunk = ChatGenerationChunk(
+                message=AIMessageChunk(content=piece),
+                generation_info=entry["generation_info"] if last else None,
+            )
+            if run_manager:
+                run_manager.on_llm_new_token(piece, verbose=self.verbose)
+            yield chunk
+
+
+class CassetteSandboxPool:
+    """Stands in for a SandboxPool: records the results of `pool`, or replays them without Docker."""
+
+    def __init__(self, image, pool=None):
+        self.image = pool.image if pool is not None else image
+        self.pool = pool
+        self._key_image = image
+
+    def run_code(self, code: str):
+        from exec_cache import execution_key
+
+        cassette = get_cassette()
+        # Exact code: a recorded traceback quotes the source it came from
+        key = execution_key(code, self._key_image, exact=True)
+        if cassette.replaying:
+            entry = cassette.replay("sandbox", key)
+            cassette.wait(entry["result"]["runtime_seconds"])
+            return dict(entry["result"])
+        result = self.pool.run_code(code)
+        cassette.record("sandbox", key, {"image": self.image, "result": result})
+        return result
+
+    def stats(self):
+        return self.pool.stats() if self.pool is not None else {"replayed": get_cassette().stats()["replayed"]}
+
+
+def cassette_image_for(code: str, image_for):
+    """Image `code` runs in: recorded from `image_for` when recording, read back when replaying."""
+    cassette = get_cassette()
+    key = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    if cassette.replaying:
+        entry = cassette.find("image", key)
+        return entry["image"] if entry else image_for(code)
+    image = image_for(code)
+    cassette.record_once("image", key, {"image": image})
+    return image
+
+
+def cassette_pool_for(code: str, pool_for):
+    """CassetteSandboxPool for `code`; `pool_for` returns the real pool when recording."""
+    from sandbox import SandboxError
+    from sandbox_images import image_for
+
+    cassette = get_cassette()
+    key = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    if cassette.replaying:
+        # Imports that could not be satisfied when recording fail the same way now
+        error = cassette.find("sandbox_error", key)
+        if error:
+            raise SandboxError(error["error"])
+        return CassetteSandboxPool(image_for(code))
+    try:
+        pool = pool_for(code)
+    except SandboxError as e:
+        cassette.record("sandbox_error", key, {"error": str(e)})
+        raise
+    # Keyed on the image the code resolves to, like the execution cache
+    return CassetteSandboxPool(image_for(code), pool)
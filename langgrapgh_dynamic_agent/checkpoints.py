@@ -0,0 +1,172 @@
+import argparse
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+
+from termcolor import colored
+
+import config
+
+# Checkpointed runs of the dynamic agent.
+#
+# With CHECKPOINT_PATH set, the graph is compiled with a SQLite checkpointer and
+# every request runs under its own thread id, so the state after each finished
+# node is on disk. Re-running an interrupted batch resumes unfinished requests at
+# their last finished node and returns finished ones without any new LLM or
+# Docker work. Runs that ended on an infrastructure failure (the Docker daemon
+# down, no sandbox container free) count as unfinished and go back to the
+# execution node. Only the latest checkpoint of each thread is kept, and at most
+# CHECKPOINT_MAX_THREADS threads.
+#
+#   python checkpoints.py list                 # unfinished runs
+#   python checkpoints.py resume [THREAD ...]  # finish them (all when none given)
+#   python checkpoints.py discard THREAD ...   # or --all
+#   python checkpoints.py prune
+
+
+# Final statuses that are not the program's fault, and the node whose routing
+# sends a reviewed program back to the sandbox
+RETRY_STATUSES = {"sandbox_error"}
+_RETRY_AS_NODE = "agent_code_review"
+
+
+def thread_id_for(request_id: str, request: str) -> str:
+    # Stable across restarts, and a changed request text never resumes an old run
+    digest = hashlib.sha256(request.encode("utf-8")).hexdigest()[:12]
+    return f"{request_id}-{digest}"
+
+
+def thread_config(thread_id: str, base_config: dict) -> dict:
+    return {**base_config, "configurable": {"thread_id": thread_id}}
+
+
+@contextmanager
+def open_checkpointer(path=None):
+    """Synchronous SQLite checkpointer, for the CLI and the interactive loop."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    conn = sqlite3.connect(path or config.CHECKPOINT_PATH, check_same_thread=False)
+    try:
+        saver = SqliteSaver(conn)
+        saver.setup()
+        yield saver
+    finally:
+        conn.close()
+
+
+def open_async_checkpointer(path=None):
+    """Async SQLite checkpointer for `ainvoke`; use as `async with`."""
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    return AsyncSqliteSaver.from_conn_string(path or config.CHECKPOINT_PATH)
+
+
+def prune(path=None, max_threads=None):
+    """Keep only the latest checkpoint of each thread and the `max_threads` most recent threads.
+
+    Returns (checkpoints deleted, threads deleted).
+    """
+    max_threads = config.CHECKPOINT_MAX_THREADS if max_threads is None else max_threads
+    conn = sqlite3.connect(path or config.CHECKPOINT_PATH)
+    try:
+        if not conn.execute("SELECT name FROM sqlite_master WHERE name = 'checkpoints'").fetchone():
+            return 0, 0
+        # Checkpoint ids are time ordered, so the largest one is the latest checkpoint
+        latest = "SELECT thread_id, checkpoint_ns, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id, checkpoint_ns"
+        deleted_checkpoints = conn.execute(
+            f"DELETE FROM checkpoints WHERE (thread_id, checkpoint_ns, checkpoint_id) NOT IN ({latest})"
+        ).rowcount
+        conn.execute(f"DELETE FROM writes WHERE (thread_id, checkpoint_ns, checkpoint_id) NOT IN ({latest})")
+
+        stale = conn.execute(
+            "SELECT thread_id FROM checkpoints GROUP BY thread_id ORDER BY MAX(checkpoint_id) DESC LIMIT -1 OFFSET ?",
+            (max_threads,),
+        ).fetchall()
+        conn.executemany("DELETE FROM checkpoints WHERE thread_id = ?", stale)
+        conn.executemany("DELETE FROM writes WHERE thread_id = ?", stale)
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return deleted_checkpoints, len(stale)
+
+
+def is_unfinished(snapshot) -> bool:
+    # Interrupted, or finished on a failure that running it again can fix
+    return bool(snapshot.next) or snapshot.values.get("status") in RETRY_STATUSES
+
+
+def prepare_retry(app, run_config, snapshot):
+    """Point a run that ended with a RETRY_STATUSES status back at the execution node."""
+    if not snapshot.next and snapshot.values.get("status") in RETRY_STATUSES:
+        app.update_state(run_config, {"status": ""}, as_node=_RETRY_AS_NODE)
+
+
+async def aprepare_retry(app, run_config, snapshot):
+    if not snapshot.next and snapshot.values.get("status") in RETRY_STATUSES:
+        await app.aupdate_state(run_config, {"status": ""}, as_node=_RETRY_AS_NODE)
+
+
+def list_runs(app):
+    """(thread_id, snapshot) for every checkpointed thread, most recent first."""
+    rows = app.checkpointer.conn.execute(
+        "SELECT thread_id FROM checkpoints GROUP BY thread_id ORDER BY MAX(checkpoint_id) DESC"
+    ).fetchall()
+    return [(thread_id, app.get_state({"configurable": {"thread_id": thread_id}})) for (thread_id,) in rows]
+
+
+def main():
+    from workflow_langgrapgh_dynamic_agent import build_app, invoke_config
+
+    parser = argparse.ArgumentParser(description="Inspect and manage checkpointed dynamic agent runs.")
+    parser.add_argument("--path", default=config.CHECKPOINT_PATH or "checkpoints.sqlite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list", help="Show unfinished runs.")
+    list_parser.add_argument("--all", action="store_true", help="Include finished runs.")
+    resume_parser = subparsers.add_parser(
+        "resume", help="Continue unfinished runs from their last finished node (sandbox errors from execution)."
+    )
+    resume_parser.add_argument("threads", nargs="*")
+    discard_parser = subparsers.add_parser("discard", help="Delete runs.")
+    discard_parser.add_argument("threads", nargs="*")
+    discard_parser.add_argument("--all", action="store_true", help="Delete every unfinished run.")
+    prune_parser = subparsers.add_parser("prune", help="Drop old checkpoints and threads.")
+    prune_parser.add_argument("--max-threads", type=int, default=config.CHECKPOINT_MAX_THREADS)
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        checkpoints, threads = prune(args.path, args.max_threads)
+        print(f"Deleted {checkpoints} old checkpoints and {threads} threads.")
+        return
+
+    with open_checkpointer(args.path) as saver:
+        app = build_app(checkpointer=saver)
+        unfinished = [(thread_id, snapshot) for thread_id, snapshot in list_runs(app) if is_unfinished(snapshot)]
+
+        if args.command == "list":
+            runs = list_runs(app) if args.all else unfinished
+            for thread_id, snapshot in runs:
+                values = snapshot.values
+                next_node = ", ".join(snapshot.next) or ("retry" if is_unfinished(snapshot) else "finished")
+                print(f"{thread_id:<24} next: {next_node:<30} attempts: {values.get('attempts', 0)}  "
+                      f"status: {values.get('status') or '-':<16} {values.get('initial_request', '')[:60]}")
+            print(f"{len(runs)} runs")
+
+        elif args.command == "resume":
+            threads = args.threads or [thread_id for thread_id, _ in unfinished]
+            for thread_id in threads:
+                print(colored(f"Resuming {thread_id}...", "cyan"))
+                run_config = thread_config(thread_id, invoke_config)
+                prepare_retry(app, run_config, app.get_state(run_config))
+                result = app.invoke(None, run_config, durability="sync")
+                print(colored(f"{thread_id}: {result.get('status')}", "green" if result.get("status") == "solved" else "red"))
+
+        elif args.command == "discard":
+            threads = [thread_id for thread_id, _ in unfinished] if args.all else args.threads
+            for thread_id in threads:
+                saver.delete_thread(thread_id)
+            print(f"Discarded {len(threads)} runs.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+
+# Runtime settings for the dynamic agent. Every value can be overridden with an
+# environment variable of the same name so deployments don't need code changes.
+
+# Docker sandbox
+SANDBOX_IMAGE = os.getenv("SANDBOX_IMAGE", "python:3.9-slim")
+SANDBOX_WORKDIR = "/usr/src/app"
+# Number of warm containers kept per process (shared by all workflow invocations)
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "2"))
+# A container is destroyed and replaced after this many executions
+SANDBOX_MAX_USES = int(os.getenv("SANDBOX_MAX_USES", "20"))
+# Seconds to wait for a free container before giving up
+SANDBOX_ACQUIRE_TIMEOUT = float(os.getenv("SANDBOX_ACQUIRE_TIMEOUT", "60"))
+# Hard limits for every program run in the sandbox
+SANDBOX_TIMEOUT_SECONDS = float(os.getenv("SANDBOX_TIMEOUT_SECONDS", "10"))
+SANDBOX_MEM_LIMIT = os.getenv("SANDBOX_MEM_LIMIT", "256m")
+SANDBOX_CPUS = float(os.getenv("SANDBOX_CPUS", "1"))
+SANDBOX_PIDS_LIMIT = int(os.getenv("SANDBOX_PIDS_LIMIT", "64"))
+# Containers have no network unless this is set
+SANDBOX_NETWORK = os.getenv("SANDBOX_NETWORK", "false").lower() == "true"
+# Programs run as this unprivileged user on a read-only root filesystem; only the
+# working directory, /tmp and /dev/shm are writable, and all three are wiped between runs
+SANDBOX_USER = os.getenv("SANDBOX_USER", "nobody")
+SANDBOX_TMPFS_SIZE = os.getenv("SANDBOX_TMPFS_SIZE", "64m")
+# Programs that import third-party packages run in images built FROM SANDBOX_IMAGE,
+# installing from this directory of wheels so builds need no network
+SANDBOX_WHEELHOUSE = os.getenv("SANDBOX_WHEELHOUSE", "wheelhouse")
+SANDBOX_IMAGE_REPOSITORY = os.getenv("SANDBOX_IMAGE_REPOSITORY", "dynamic-agent-sandbox")
+# Extra import-to-package mappings, e.g. "Crypto=pycryptodome,magic=python-magic"
+SANDBOX_PACKAGE_MAP = dict(
+    pair.strip().split("=", 1) for pair in os.getenv("SANDBOX_PACKAGE_MAP", "").split(",") if "=" in pair
+)
+
+# Batch runner
+# Maximum number of requests driven through the graph at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# LLM chain cache
+# SQLite file used to cache preprocessor/generator/reviewer responses ("" disables the cache)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Also reuse sandbox results of deterministic programs (stored as stage "sandbox")
+EXEC_CACHE_ENABLED = os.getenv("EXEC_CACHE_ENABLED", "true").lower() == "true"
+# Comma separated modules to trust as deterministic on top of exec_cache's stdlib list, e.g. "sympy"
+EXEC_CACHE_PURE_MODULES = {m.strip() for m in os.getenv("EXEC_CACHE_PURE_MODULES", "").split(",") if m.strip()}
+# Comma separated stages that skip the cache, e.g. "generator,reviewer,sandbox"
+LLM_CACHE_BYPASS = {s.strip() for s in os.getenv("LLM_CACHE_BYPASS", "").split(",") if s.strip()}
+
+# Preprocessor fast path
+# Reuse tasks refined for the same or a near-duplicate request, and skip refinement for
+# requests that already read as a specific coding instruction
+PREPROCESSOR_FAST_PATH = os.getenv("PREPROCESSOR_FAST_PATH", "true").lower() == "true"
+# Longest request (in words) that may skip refinement
+PREPROCESSOR_BYPASS_MAX_WORDS = int(os.getenv("PREPROCESSOR_BYPASS_MAX_WORDS", "25"))
+# Near-duplicates differ in at most this many of the 64 simhash bits (kept at most 3 by the band index)
+REQUEST_CACHE_MAX_DISTANCE = int(os.getenv("REQUEST_CACHE_MAX_DISTANCE", "3"))
+# Refined tasks expire like chain cache entries; beyond this many, the least recently used go
+REQUEST_CACHE_TTL_SECONDS = float(os.getenv("REQUEST_CACHE_TTL_SECONDS", str(LLM_CACHE_TTL_SECONDS)))
+REQUEST_CACHE_MAX_ROWS = int(os.getenv("REQUEST_CACHE_MAX_ROWS", "10000"))
+
+# Code generation
+# Stream the generator (records time-to-first-token per request)
+CODEGEN_STREAM = os.getenv("CODEGEN_STREAM", "true").lower() == "true"
+# Stop reading the stream as soon as the first code block is closed
+CODEGEN_EARLY_STOP = os.getenv("CODEGEN_EARLY_STOP", "true").lower() == "true"
+# Extra stop sequences sent to the backend, separated by "|". "\n```" stops right at the
+# closing fence, but only for models that open the block on their first line.
+CODEGEN_STOP_SEQUENCES = [s.encode().decode("unicode_escape") for s in os.getenv("CODEGEN_STOP_SEQUENCES", "").split("|") if s]
+# Speculative generation: sample this many candidates concurrently per attempt, review
+# them in ranked order and drop the rest once one is solved (1 disables)
+CODEGEN_CANDIDATES = int(os.getenv("CODEGEN_CANDIDATES", "1"))
+CODEGEN_CANDIDATE_CONCURRENCY = int(os.getenv("CODEGEN_CANDIDATE_CONCURRENCY", os.getenv("CODEGEN_CANDIDATES", "1")))
+# Sampling temperatures assigned to the candidates in turn (each also gets its own seed)
+CODEGEN_CANDIDATE_TEMPERATURES = [float(t) for t in os.getenv("CODEGEN_CANDIDATE_TEMPERATURES", "0.2,0.6,0.9,1.2").split(",")]
+
+# Static pre-review checks
+# Skip the LLM reviewer for code that fails local syntax/import/name checks
+STATIC_CHECK_ENABLED = os.getenv("STATIC_CHECK_ENABLED", "true").lower() == "true"
+# Top-level modules the sandbox image provides on top of the standard library
+SANDBOX_EXTRA_MODULES = {m.strip() for m in os.getenv("SANDBOX_EXTRA_MODULES", "pip,setuptools,wheel,pkg_resources").split(",") if m.strip()}
+
+# Checkpointing
+# SQLite file holding the graph state after every node so interrupted runs resume ("" disables)
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "")
+# Checkpointed runs kept after pruning (only the latest checkpoint of each is kept)
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+
+# Ollama
+# JSON file assigning model, host, options, latency budget and fallback per stage (see model_registry.py)
+MODEL_REGISTRY_PATH = os.getenv("MODEL_REGISTRY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_registry.json"))
+# Context window in tokens for stages whose registry entry sets no num_ctx. Keep it the same
+# for every call to a model: a different value reloads the model and drops its prompt cache.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "2048"))
+# How long Ollama keeps the model (and the KV cache of the shared prompt prefix) loaded
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Batched code review
+# Review pending speculative candidates together with the current program in one call
+REVIEW_BATCH_ENABLED = os.getenv("REVIEW_BATCH_ENABLED", "true").lower() == "true"
+# Also gather reviews from concurrent requests for this long before sending them (0 disables)
+REVIEW_BATCH_WINDOW_MS = float(os.getenv("REVIEW_BATCH_WINDOW_MS", "0"))
+REVIEW_BATCH_MAX = int(os.getenv("REVIEW_BATCH_MAX", "8"))
+# Tokens reserved for each verdict in the response
+REVIEW_TOKENS_PER_VERDICT = int(os.getenv("REVIEW_TOKENS_PER_VERDICT", "120"))
+
+# Repair loop
+# Generation attempts per request (first try plus repairs) before the request is given up
+MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", "3"))
+
+# Record/replay
+# "record" saves every Ollama chat call and sandbox result to CASSETTE_PATH, "replay" serves
+# them back without Ollama or Docker ("" talks to the live services)
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassette.jsonl")
+# Replayed calls wait this many times their recorded latency (0 answers immediately)
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "0"))
+
+# Observability
+# JSONL file that receives one span per executed graph node ("" disables tracing)
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# Print the full agent state after every node (debug only)
+DEBUG_STATE = os.getenv("DEBUG_STATE", "false").lower() == "true"
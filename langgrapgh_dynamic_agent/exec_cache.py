@@ -0,0 +1,174 @@
+import ast
+import hashlib
+import json
+import re
+import threading
+
+import config
+from llm_cache import get_chain_cache
+
+# Memoized sandbox runs.
+#
+# A deterministic program produces the same stdout, stderr and exit code every
+# time it runs in the same image under the same limits, so its result is stored
+# in the chain cache (stage "sandbox") under a hash of the code, the image and the
+# limits. Clean runs are keyed on the normalized code, so reformatting a program
+# still hits; failed runs and runs that wrote to stderr are keyed on the exact
+# code, because their tracebacks quote line numbers and source lines. Programs the
+# purity check cannot vouch for always run, and so do programs whose output quotes
+# an object address.
+
+# Modules known to be deterministic: a program is memoized only if everything it
+# imports is in here (or in EXEC_CACHE_PURE_MODULES). Anything else, including every
+# third-party package, may read clocks, randomness, files or the network.
+_PURE_MODULES = {
+    "__future__", "abc", "array", "base64", "binascii", "bisect", "cmath", "collections", "colorsys",
+    "contextlib", "copy", "csv", "dataclasses", "decimal", "difflib", "enum", "fractions", "functools",
+    "hashlib", "heapq", "hmac", "html", "itertools", "json", "keyword", "math", "numbers", "operator",
+    "pprint", "re", "statistics", "string", "struct", "textwrap", "types", "typing", "unicodedata", "zlib",
+}
+# Modules that a pure module can still hand out as an attribute (dataclasses.sys, csv.re ...);
+# reaching one of these through an attribute chain makes a program impure
+_IMPURE_MODULES = {
+    "random", "secrets", "uuid", "time", "datetime", "os", "sys", "builtins", "importlib", "io",
+    "pathlib", "shutil", "tempfile", "subprocess", "threading", "socket", "signal", "warnings",
+}
+# Builtins that read input, touch files, or are not stable across runs, and the names
+# that reach them indirectly (__builtins__.open, getattr(__builtins__, "open"), f.__globals__)
+_IMPURE_BUILTINS = {
+    "open", "input", "id", "hash", "__import__", "eval", "exec", "compile", "breakpoint", "__builtins__",
+    "__globals__", "__subclasses__", "globals", "vars",
+}
+# Default object reprs quote the object's address, which changes between runs
+_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def _dotted_name(node):
+    # "os.environ.get" for a chain of attributes on a name, else None
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    return ".".join([node.id, *reversed(parts)])
+
+
+def purity_check(code: str):
+    """Return (True, "") for a program whose output only depends on its source, else (False, reason)."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return True, ""  # fails the same way every time
+    pure_modules = _PURE_MODULES | config.EXEC_CACHE_PURE_MODULES
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name.split(".")[0] for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                return False, "uses a relative import"
+            modules = [node.module.split(".")[0]]
+        elif isinstance(node, ast.Name) and node.id in _IMPURE_BUILTINS:
+            return False, f"uses {node.id}"
+        elif isinstance(node, ast.Attribute):
+            if node.attr in _IMPURE_BUILTINS or node.attr in _IMPURE_MODULES:
+                return False, f"uses {_dotted_name(node) or node.attr}"
+            continue
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "getattr" \
+                and len(node.args) > 1 and isinstance(node.args[1], ast.Constant) \
+                and (node.args[1].value in _IMPURE_BUILTINS or node.args[1].value in _IMPURE_MODULES):
+            return False, f"uses getattr(..., {node.args[1].value!r})"
+        else:
+            continue
+        unknown = [m for m in modules if m not in pure_modules]
+        if unknown:
+            return False, f"imports {unknown[0]}"
+    return True, ""
+
+
+def normalize_code(code: str) -> str:
+    # Comments, blank lines and formatting don't change what a program does
+    try:
+        return ast.unparse(ast.parse(code))
+    except SyntaxError:
+        return code
+
+
+def execution_key(code: str, image: str, exact: bool = False) -> str:
+    """Key of a run of `code`; `exact` keys on the code as written instead of its normalized form."""
+    limits = [
+        config.SANDBOX_TIMEOUT_SECONDS, config.SANDBOX_MEM_LIMIT, config.SANDBOX_CPUS, config.SANDBOX_PIDS_LIMIT,
+        config.SANDBOX_NETWORK, config.SANDBOX_USER,
+    ]
+    payload = json.dumps(
+        {"code": code if exact else normalize_code(code), "exact": exact, "image": image, "limits": limits}, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def layout_independent(result: dict) -> bool:
+    # A clean run's output does not quote the program's source or line numbers
+    return result["exit_code"] == 0 and not result["stderr"]
+
+
+class ExecutionCache:
+    """Sandbox results of deterministic programs, stored in a ChainCache."""
+
+    stage = "sandbox"
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "impure": 0}
+
+    @property
+    def enabled(self):
+        return self.cache is not None and config.EXEC_CACHE_ENABLED and self.stage not in config.LLM_CACHE_BYPASS
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def lookup(self, code: str, image: str):
+        """Cached result dict for `code` in `image`, or None when it has to run."""
+        if not self.enabled:
+            return None
+        pure, _ = purity_check(code)
+        if not pure:
+            self._count("impure")
+            return None
+        cached = self.cache.get(execution_key(code, image)) or self.cache.get(execution_key(code, image, exact=True))
+        if cached is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(cached)
+
+    def store(self, code: str, image: str, result: dict):
+        # Runs stopped by a limit depend on the load of the host, and object addresses on
+        # the run, so neither is stored
+        if not self.enabled or result["limit_killed"] or not purity_check(code)[0]:
+            return
+        if _ADDRESS.search(result["stdout"]) or _ADDRESS.search(result["stderr"]):
+            return
+        key = execution_key(code, image, exact=not layout_independent(result))
+        self.cache.put(key, self.stage, json.dumps(result))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_execution_cache = None
+_execution_cache_lock = threading.Lock()
+
+
+def get_execution_cache() -> ExecutionCache:
+    global _execution_cache
+    with _execution_cache_lock:
+        if _execution_cache is None:
+            _execution_cache = ExecutionCache(get_chain_cache())
+        return _execution_cache
@@ -0,0 +1,164 @@
+import ast
+import re
+from dataclasses import dataclass
+from functools import cached_property
+
+# One precompiled alternation, scanned once from left to right. Every branch starts
+# with the same literal backtick so the regex engine can skip plain text quickly.
+# Fenced blocks are tried first at every position so their backticks are never
+# re-read as inline code; an opening fence without a closing one runs to the end.
+_LANG_TAG = r"[\w+#.-]*"
+_CODE_PATTERN = re.compile(
+    rf"`(?:(?P<fence>``+)(?:(?P<lang>{_LANG_TAG})[ \t]*\n)?(?P<body>.*?)`(?P=fence)"
+    rf"|(?P<open>``+)(?:(?P<open_lang>{_LANG_TAG})[ \t]*\n)?(?P<tail>.*)\Z"
+    r"|(?P<inline>[^`]+)`)",
+    re.DOTALL,
+)
+_LANG_TAG_LINE = re.compile(rf"{_LANG_TAG}[ \t]*")
+
+_PYTHON_LANGUAGES = {"", "python", "python3", "py"}
+
+# Higher is better when ranking candidates
+_KIND_PRIORITY = {"fenced": 3, "unterminated": 2, "inline": 1, "raw": 0}
+
+
+@dataclass
+class CodeCandidate:
+    code: str
+    kind: str  # "fenced", "unterminated", "inline" or "raw"
+    language: str = ""
+    start: int = 0
+
+    @cached_property
+    def parses(self) -> bool:
+        # Parsed lazily: ranking only needs it for the few candidates that can still win
+        try:
+            ast.parse(self.code)
+            return True
+        except (SyntaxError, ValueError):
+            return False
+
+    @property
+    def group(self):
+        return (_KIND_PRIORITY[self.kind], self.language.lower() in _PYTHON_LANGUAGES)
+
+
+def find_code_candidates(text: str) -> list:
+    """Return every fenced, unterminated or inline code span in `text`, in order."""
+    candidates = []
+    for match in _CODE_PATTERN.finditer(text):
+        if match.group("fence") is not None:
+            kind, language, code = "fenced", match.group("lang") or "", match.group("body")
+        elif match.group("open") is not None:
+            kind, language, code = "unterminated", match.group("open_lang") or "", match.group("tail")
+        else:
+            kind, language, code = "inline", "", match.group("inline")
+        code = code.strip()
+        if code:
+            candidates.append(CodeCandidate(code, kind, language, match.start()))
+    return candidates
+
+
+def extract_best_code(text: str):
+    """Pick the most plausible program in an LLM response, or None for empty text.
+
+    Fenced blocks beat unterminated and inline ones; within a kind, Python (or
+    untagged) blocks that parse win, then the larger block.
+    """
+    candidates = find_code_candidates(text)
+    if candidates:
+        top_group = max(candidate.group for candidate in candidates)
+        finalists = sorted(
+            (candidate for candidate in candidates if candidate.group == top_group),
+            key=lambda candidate: len(candidate.code),
+            reverse=True,
+        )
+        # Largest first, so the first one that parses is the best; otherwise the largest
+        return next((candidate for candidate in finalists if candidate.parses), finalists[0])
+    if text.strip():
+        return CodeCandidate(text.strip(), "raw")
+    return None
+
+
+class StreamingCodeExtractor:
+    """Incrementally finds the first complete fenced block in streamed text.
+
+    `feed()` returns the block as soon as its closing fence arrives; each chunk
+    is only scanned once (plus a few bytes of overlap for split fences).
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._scan_from = 0
+        self._fence = None  # the opening backtick run, once known
+        self._body_start = None
+        self._language = ""
+        self._fence_start = 0
+        self.result = None
+        self.end = None  # offset just past the closing fence
+
+    @property
+    def text(self):
+        return self._buffer
+
+    def feed(self, chunk: str):
+        if self.result is not None:
+            return self.result
+        self._buffer += chunk
+
+        if self._fence is None and not self._find_opening():
+            return None
+        if self._body_start is None and not self._find_body_start():
+            return None
+
+        close = self._buffer.find(self._fence, max(self._scan_from, self._body_start))
+        if close == -1:
+            # Keep enough overlap for a fence split across chunks
+            self._scan_from = max(self._body_start, len(self._buffer) - len(self._fence) + 1)
+            return None
+
+        code = self._buffer[self._body_start:close].strip()
+        self.end = close + len(self._fence)
+        self.result = CodeCandidate(code, "fenced", self._language, self._fence_start)
+        return self.result
+
+    def _find_opening(self):
+        start = self._buffer.find("```", self._scan_from)
+        if start == -1:
+            self._scan_from = max(self._scan_from, len(self._buffer) - 2)
+            return False
+        end = start
+        while end < len(self._buffer) and self._buffer[end] == "`":
+            end += 1
+        if end == len(self._buffer):
+            # The backtick run may continue in the next chunk
+            self._scan_from = start
+            return False
+        self._fence = self._buffer[start:end]
+        self._fence_start = start
+        self._scan_from = end
+        return True
+
+    def _find_body_start(self):
+        opening_end = self._fence_start + len(self._fence)
+        newline = self._buffer.find("\n", opening_end)
+        if newline == -1:
+            rest = self._buffer[opening_end:]
+            if _LANG_TAG_LINE.fullmatch(rest):
+                return False  # still reading a language tag
+            self._body_start = opening_end
+            return True
+        tag = self._buffer[opening_end:newline]
+        if _LANG_TAG_LINE.fullmatch(tag):
+            self._language = tag.strip()
+            self._body_start = newline + 1
+        else:
+            self._body_start = opening_end
+        self._scan_from = self._body_start
+        return True
+
+    def finish(self):
+        """Best candidate once the stream has ended without a closed fence."""
+        if self.result is not None:
+            return self.result
+        return extract_best_code(self._buffer)
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+import config
+from model_registry import GENERATION_OPTIONS, fallback_config
+
+
+class ChainCache:
+    """Persistent, content-addressed cache for LLM chain results.
+
+    Entries live in a SQLite file, expire after `ttl_seconds` and are evicted in
+    least-recently-used order once the stored values exceed `max_bytes`.
+    """
+
+    def __init__(self, path=config.LLM_CACHE_PATH, max_bytes=config.LLM_CACHE_MAX_BYTES,
+                 ttl_seconds=config.LLM_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chain_cache (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chain_cache_lru ON chain_cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM chain_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM chain_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE chain_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return value
+
+    def put(self, key, stage, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chain_cache (key, stage, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stage, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute("DELETE FROM chain_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM chain_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM chain_cache ORDER BY last_access").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM chain_cache WHERE key = ?", evicted)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chain_cache")
+            self._conn.commit()
+
+
+def generation_options(model) -> dict:
+    """The options of a ChatOllama that affect its output, leaving out unset ones."""
+    options = {name: getattr(model, name, None) for name in GENERATION_OPTIONS}
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def cache_key(template: str, variables: dict, model_name: str, options: dict, output_format) -> str:
+    payload = json.dumps(
+        {"template": template, "variables": variables, "model": model_name, "options": options,
+         "format": output_format},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CachedChain:
+    """Wraps a `prompt | model` chain with a ChainCache lookup.
+
+    Results are either chat messages or, for structured output chains, instances
+    of `output_model`. `refresh=True` skips the lookup but the fresh result is
+    still stored, which is what a regeneration needs. Entries are keyed on the
+    stage's primary model, so an answer from its latency fallback is not stored.
+    """
+
+    def __init__(self, stage, chain, prompt, model, output_model=None, cache=None):
+        self.stage = stage
+        self.chain = chain
+        self.output_model = output_model
+        self.cache = cache
+        self._template = prompt.template
+        self._model_name = model.model
+        # Chains with a different temperature, seed, num_predict, stop etc. must not share entries
+        self._options = generation_options(model)
+        self._output_format = output_model.model_json_schema() if output_model else model.format
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0}
+
+    @property
+    def enabled(self):
+        return self.cache is not None and self.stage not in config.LLM_CACHE_BYPASS
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def lookup(self, inputs: dict):
+        """Cached result for `inputs`, or None (counted as a miss)."""
+        if not self.enabled:
+            self._count("bypassed")
+            return None
+        cached = self.cache.get(self._key(inputs))
+        if cached is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return self._loads(cached)
+
+    def store(self, inputs: dict, result):
+        if self.enabled:
+            self.cache.put(self._key(inputs), self.stage, self._dumps(result))
+
+    def _key(self, inputs):
+        return cache_key(self._template, inputs, self._model_name, self._options, self._output_format)
+
+    def fingerprint(self) -> str:
+        """Hash of what the chain's answers depend on besides its inputs: template, model, options, format."""
+        return cache_key(self._template, {}, self._model_name, self._options, self._output_format)
+
+    def invoke(self, inputs: dict, refresh: bool = False):
+        return self.invoke_with_cache_info(inputs, refresh)[0]
+
+    def invoke_with_cache_info(self, inputs: dict, refresh: bool = False):
+        """Like invoke, but returns (result, from_cache)."""
+        if refresh:
+            self._count("misses" if self.enabled else "bypassed")
+        else:
+            cached = self.lookup(inputs)
+            if cached is not None:
+                return cached, True
+
+        return self.invoke_model(inputs)[0], False
+
+    def invoke_model(self, inputs: dict):
+        """Run the chain without a lookup; returns (result, fallback model or None).
+
+        The result is stored unless the stage's latency fallback produced it.
+        """
+        fallback_models = []
+        result = self.chain.invoke(inputs, config=fallback_config(fallback_models))
+        if not fallback_models:
+            self.store(inputs, result)
+        return result, fallback_models[0] if fallback_models else None
+
+    def stream(self, inputs: dict, refresh: bool = False, fallback_models: list = None):
+        """Yield message chunks; a cache hit is yielded as a single message.
+
+        Nothing is stored here because the caller may stop reading early; it
+        should `store()` whatever it ends up using, unless the model switched to
+        its fallback, which is appended to `fallback_models`.
+        """
+        if refresh:
+            self._count("misses" if self.enabled else "bypassed")
+        else:
+            cached = self.lookup(inputs)
+            if cached is not None:
+                yield cached
+                return
+        yield from self.chain.stream(inputs, config=fallback_config(fallback_models if fallback_models is not None else []))
+
+    def _dumps(self, result):
+        if self.output_model is not None:
+            return result.model_dump_json()
+        return json.dumps(message_to_dict(result))
+
+    def _loads(self, value):
+        if self.output_model is not None:
+            return self.output_model.model_validate_json(value)
+        return messages_from_dict([json.loads(value)])[0]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_chain_cache():
+    # One SQLite connection per process; None when caching is switched off
+    global _cache
+    if not config.LLM_CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ChainCache()
+        return _cache
@@ -0,0 +1,240 @@
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional
+
+from langchain_core.runnables import Runnable
+from termcolor import colored
+
+import config
+
+# Per-stage model registry.
+#
+# MODEL_REGISTRY_PATH points to a JSON file that assigns each stage a model, an
+# Ollama host, model options and a latency budget:
+#
+#   {
+#     "defaults": {"host": "http://localhost:11434", "model": "llama3.2", "options": {"num_ctx": 2048}},
+#     "stages": {
+#       "preprocessor": {"model": "llama3.2:1b"},
+#       "generator": {"model": "qwen2.5-coder:32b", "options": {"num_predict": 1024},
+#                     "latency_budget_seconds": 90, "fallback": {"model": "llama3.2"}}
+#     }
+#   }
+#
+# Stages are preprocessor, generator, repair (defaults to generator), reviewer and
+# reviewer_batch (defaults to reviewer). The budget is a wall-clock limit on the
+# whole call, streamed or not: a call that runs over it is abandoned and made again
+# on the fallback model (a stage without a fallback raises StageTimeoutError). Other
+# errors, such as unparseable structured output, are not retried. Without a file
+# every stage uses the defaults, which match the original single llama3.2 setup.
+
+STAGES = ("preprocessor", "generator", "repair", "reviewer", "reviewer_batch")
+# Stages that inherit another stage's entry when the file does not name them
+_STAGE_PARENTS = {"repair": "generator", "reviewer_batch": "reviewer"}
+# Ollama model options that ChatOllama accepts
+_MODEL_OPTIONS = {
+    "num_ctx", "num_predict", "num_gpu", "num_thread", "temperature", "seed", "top_k", "top_p", "tfs_z",
+    "repeat_last_n", "repeat_penalty", "mirostat", "mirostat_eta", "mirostat_tau",
+}
+# ChatOllama fields that change what the model generates (not where or how fast it runs)
+GENERATION_OPTIONS = (_MODEL_OPTIONS - {"num_gpu", "num_thread"}) | {"stop"}
+
+
+@dataclass
+class ModelSpec:
+    model: str = "llama3.2"
+    host: str = "http://localhost:11434"
+    options: dict = field(default_factory=dict)
+    keep_alive: Optional[str] = None
+    latency_budget_seconds: Optional[float] = None
+    fallback: Optional["ModelSpec"] = None
+
+    @property
+    def num_ctx(self):
+        return self.options.get("num_ctx", config.OLLAMA_NUM_CTX)
+
+    def chat_model(self, format=None, **option_overrides):
+        """ChatOllama for this spec.
+
+        The latency budget is also the client's read timeout, so a call abandoned at
+        the deadline (see LatencyBudget) does not hold its connection indefinitely.
+        """
+        if config.CASSETTE_MODE:
+            # Recorded to or replayed from CASSETTE_PATH (see cassettes.py)
+            from cassettes import CassetteChatOllama as ChatOllama
+        else:
+            from langchain_ollama import ChatOllama
+
+        options = {"num_ctx": config.OLLAMA_NUM_CTX, **self.options, **option_overrides}
+        client_kwargs = {"timeout": self.latency_budget_seconds} if self.latency_budget_seconds else {}
+        return ChatOllama(
+            base_url=self.host,
+            model=self.model,
+            format=format,
+            keep_alive=self.keep_alive or config.OLLAMA_KEEP_ALIVE,
+            client_kwargs=client_kwargs,
+            **options,
+        )
+
+
+def _spec(entry: dict, defaults: dict) -> ModelSpec:
+    merged = {**defaults, **entry, "options": {**defaults.get("options", {}), **entry.get("options", {})}}
+    # A misspelled key would otherwise quietly leave its setting at the default
+    unknown = set(merged) - set(ModelSpec.__dataclass_fields__)
+    if unknown:
+        raise ValueError(f"Unknown model registry keys: {', '.join(sorted(unknown))}")
+    unknown = set(merged["options"]) - _MODEL_OPTIONS
+    if unknown:
+        raise ValueError(f"Unknown model options: {', '.join(sorted(unknown))}")
+    fallback = merged.pop("fallback", None)
+    spec = ModelSpec(**merged)
+    if fallback:
+        # A fallback inherits the host and options of its stage unless it sets its own
+        spec.fallback = _spec(fallback, {**defaults, "host": spec.host, "options": spec.options})
+    return spec
+
+
+def load_registry(path=None) -> dict:
+    """{stage: ModelSpec} from the registry file, or the defaults when there is none."""
+    path = path if path is not None else config.MODEL_REGISTRY_PATH
+    data = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    defaults = data.get("defaults", {})
+    stages = data.get("stages", {})
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages in {path}: {', '.join(sorted(unknown))}")
+
+    registry = {}
+    for stage in STAGES:
+        entry = stages.get(stage)
+        if entry is None and stage in _STAGE_PARENTS:
+            entry = stages.get(_STAGE_PARENTS[stage])
+        registry[stage] = _spec(entry or {}, defaults)
+    return registry
+
+
+class StageTimeoutError(TimeoutError):
+    pass
+
+
+def fallback_config(fallback_models: list) -> dict:
+    """Runnable config under which LatencyBudget appends the fallback models it switches to."""
+    return {"configurable": {"fallback_models": fallback_models}}
+
+
+def _note_fallback(runnable_config, model_name):
+    fallback_models = (runnable_config or {}).get("configurable", {}).get("fallback_models")
+    if fallback_models is not None:
+        fallback_models.append(model_name)
+
+
+def _start_thread(target):
+    # The worker sees the caller's context variables (tracing spans)
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(target,), daemon=True)
+    thread.start()
+
+
+class LatencyBudget(Runnable):
+    """Runs `primary` under a wall-clock deadline and switches to `fallback` when it runs over.
+
+    invoke() waits for the primary call on a worker thread. stream() reads the
+    primary stream on a worker thread and stops reading at the deadline, which
+    closes the stream and cancels the generation; chunks already yielded stay
+    yielded, so a consumer that cares watches `fallback_config` for the switch and
+    starts over. Only running over the budget switches models.
+    """
+
+    def __init__(self, primary, seconds, fallback=None, fallback_model=None):
+        self.primary = primary
+        self.seconds = seconds
+        self.fallback = fallback
+        self.fallback_model = fallback_model
+
+    def _over_budget(self, runnable_config):
+        if self.fallback is None:
+            raise StageTimeoutError(f"No answer within the {self.seconds}s latency budget")
+        print(colored(f"DEBUG: Over the {self.seconds}s latency budget, switching to {self.fallback_model}", "yellow"))
+        _note_fallback(runnable_config, self.fallback_model)
+
+    def invoke(self, input, config=None, **kwargs):
+        future = Future()
+
+        def call():
+            try:
+                future.set_result(self.primary.invoke(input, config, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        _start_thread(call)
+        try:
+            return future.result(timeout=self.seconds)
+        except TimeoutError:
+            # The abandoned call finishes on its thread; its result is dropped
+            if future.done():
+                raise
+        self._over_budget(config)
+        return self.fallback.invoke(input, config, **kwargs)
+
+    def stream(self, input, config=None, **kwargs):
+        chunks = queue.Queue()
+        stop = threading.Event()
+
+        def produce():
+            iterator = self.primary.stream(input, config, **kwargs)
+            try:
+                for chunk in iterator:
+                    if stop.is_set():
+                        return
+                    chunks.put(("chunk", chunk))
+                chunks.put(("done", None))
+            except BaseException as e:
+                chunks.put(("error", e))
+            finally:
+                iterator.close()
+
+        deadline = time.monotonic() + self.seconds
+        _start_thread(produce)
+        try:
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if kind == "done":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            stop.set()
+        self._over_budget(config)
+        yield from self.fallback.stream(input, config, **kwargs)
+
+
+def stage_model(spec: ModelSpec, build=None, format=None, **option_overrides):
+    """(chat model, runnable) for a stage.
+
+    The runnable is `build(chat model)` (the model itself without `build`). With a
+    latency budget in the spec it runs under a LatencyBudget, which switches to the
+    fallback model when the primary runs over the budget.
+    """
+    build = build or (lambda model: model)
+    primary = spec.chat_model(format=format, **option_overrides)
+    runnable = build(primary)
+    if spec.latency_budget_seconds:
+        fallback = spec.fallback
+        runnable = LatencyBudget(
+            runnable, spec.latency_budget_seconds,
+            build(fallback.chat_model(format=format, **option_overrides)) if fallback else None,
+            fallback.model if fallback else None,
+        )
+    return primary, runnable
@@ -1,4 +1,4 @@
-from typing import TypedDict
+from typing import List, TypedDict
 from pydantic import BaseModel, Field
 
 # Define the structure of the review result using Pydantic
@@ -7,13 +7,33 @@ class CodeReviewResult(BaseModel):
     message: str = Field(..., description="Optional message returned by the review agent.")
 
 
+# One verdict of a batched review; `index` is the program number in the prompt
+class ProgramReview(CodeReviewResult):
+    index: int = Field(..., description="Number of the reviewed program, starting at 1.")
+
+
+class BatchedCodeReviewResult(BaseModel):
+    reviews: List[ProgramReview] = Field(..., description="Exactly one review per program, in order.")
+
+
 # Define the state
 class AgentState(TypedDict):
+    request_id: str
     initial_request: str
     preprocessor_agent_result: str
+    preprocessor_source: str
     generated_code_result: str
     code_extraction_status: str
     extracted_python_code: str
+    static_check_result: dict
+    static_check_status: str
     code_review_result: CodeReviewResult
     code_review_status: str
-    final_output: str
\ No newline at end of file
+    final_output: str
+    execution_result: dict
+    generation_stats: dict
+    pending_candidates: list
+    attempts: int
+    llm_calls: int
+    repair_feedback: str
+    status: str
\ No newline at end of file
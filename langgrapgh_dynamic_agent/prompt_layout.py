@@ -0,0 +1,160 @@
+import hashlib
+import os
+import string
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Prompt prefix layout and Ollama prompt-cache instrumentation.
+#
+# Every template is compiled into a fixed prefix (the instructions and few-shot
+# examples before the first variable) and a dynamic suffix. Ollama keeps the KV
+# cache of the previous prompt in a loaded model and only evaluates the tokens
+# after the longest common prefix, so a byte-stable prefix is evaluated once per
+# model load instead of once per call - as long as the model stays loaded
+# (keep_alive) and every call uses the same num_ctx (a different value reloads it).
+#
+# Each prompt sent is compared with the previous prompt sent to the same model:
+# when they share less than the stage's fixed prefix (another stage's prompt ran
+# on the model in between), the backend had to evaluate part of the prefix again.
+# Ollama's prompt_eval_count / prompt_eval_duration are collected per stage to
+# show how many prompt tokens were actually evaluated and what the reuse saved.
+
+
+def _field_text(field, format_spec, conversion):
+    return "{" + field + (f"!{conversion}" if conversion else "") + (f":{format_spec}" if format_spec else "") + "}"
+
+
+def split_template(template: str):
+    """(prefix, suffix): the text before the first variable as it renders, and the rest of the template."""
+    prefix = ""
+    suffix = None
+    for literal, field, format_spec, conversion in string.Formatter().parse(template):
+        if suffix is None:
+            prefix += literal
+        else:
+            # Braces in literal text were escaped in the template
+            suffix += literal.replace("{", "{{").replace("}", "}}")
+        if field is not None:
+            suffix = (suffix or "") + _field_text(field, format_spec, conversion)
+    return prefix, suffix or ""
+
+
+# model -> last prompt text sent to it, across all stages
+_last_prompts = {}
+_last_prompts_lock = threading.Lock()
+
+
+def shared_prefix_chars(model, text) -> int:
+    """Characters `text` shares with the previous prompt sent to `model` (-1 for the first)."""
+    with _last_prompts_lock:
+        previous = _last_prompts.get(model)
+        _last_prompts[model] = text
+    return -1 if previous is None else len(os.path.commonprefix([previous, text]))
+
+
+class CompiledPrompt:
+    """A stage's template split into prefix and suffix, plus prompt-cache statistics."""
+
+    def __init__(self, stage, template):
+        self.stage = stage
+        self.template = template
+        self.prefix, self.suffix = split_template(template.template)
+        self.prefix_hash = hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()[:12]
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            # Calls compared with an earlier prompt on the same model, and those of them
+            # that shared less than the fixed prefix with it
+            "compared_calls": 0,
+            "prefix_breaks": 0,
+            "shared_prefix_chars": 0,
+            "measured_calls": 0,
+            "prompt_chars": 0,
+            "prompt_eval_count": 0,
+            "prompt_eval_seconds": 0.0,
+            # Highest evaluated tokens per prompt character seen; a call that evaluated the
+            # whole prompt (cold cache) calibrates the size of a full prompt in tokens
+            "tokens_per_char": 0.0,
+        }
+
+    def record_prompt(self, model, text):
+        """Compare a prompt about to be sent with the previous one sent to the same model."""
+        shared = shared_prefix_chars(model, text)
+        broke = 0 <= shared < len(self.prefix)
+        with self._lock:
+            self._stats["calls"] += 1
+            if shared >= 0:
+                self._stats["compared_calls"] += 1
+                self._stats["shared_prefix_chars"] += shared
+                self._stats["prefix_breaks"] += broke
+
+    def record(self, prompt_chars, prompt_eval_count, prompt_eval_seconds):
+        with self._lock:
+            self._stats["measured_calls"] += 1
+            self._stats["prompt_chars"] += prompt_chars
+            self._stats["prompt_eval_count"] += prompt_eval_count
+            self._stats["prompt_eval_seconds"] += prompt_eval_seconds
+            if prompt_chars:
+                self._stats["tokens_per_char"] = max(self._stats["tokens_per_char"], prompt_eval_count / prompt_chars)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["prefix_chars"] = len(self.prefix)
+        stats["prefix_hash"] = self.prefix_hash
+        # Estimated size of the prompts sent, against the tokens Ollama actually evaluated
+        estimated = stats["prompt_chars"] * stats["tokens_per_char"]
+        reused = max(0.0, estimated - stats["prompt_eval_count"])
+        seconds_per_token = stats["prompt_eval_seconds"] / stats["prompt_eval_count"] if stats["prompt_eval_count"] else 0.0
+        stats["estimated_prompt_tokens"] = round(estimated)
+        stats["reused_tokens"] = round(reused)
+        stats["reuse_ratio"] = reused / estimated if estimated else 0.0
+        stats["estimated_seconds_saved"] = round(reused * seconds_per_token, 3)
+        return stats
+
+
+class PromptCacheCallback(BaseCallbackHandler):
+    """Feeds Ollama's prompt_eval_count / prompt_eval_duration of a stage into its CompiledPrompt."""
+
+    run_inline = True
+
+    def __init__(self, compiled: CompiledPrompt):
+        self.compiled = compiled
+        self._prompt_chars = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._prompt_chars[run_id] = sum(len(str(m.content)) for batch in messages for m in batch)
+        # The prompt as the model receives it
+        model = (kwargs.get("metadata") or {}).get("ls_model_name")
+        for batch in messages:
+            self.compiled.record_prompt(model, "\n".join(str(m.content) for m in batch))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_chars = self._prompt_chars.pop(run_id, 0)
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                if info.get("prompt_eval_count") is not None:
+                    self.compiled.record(prompt_chars, info["prompt_eval_count"], (info.get("prompt_eval_duration") or 0) / 1e9)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._prompt_chars.pop(run_id, None)
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_prompt(stage, template) -> CompiledPrompt:
+    # One CompiledPrompt per stage, shared by every chain of that stage
+    with _compiled_lock:
+        if stage not in _compiled:
+            _compiled[stage] = CompiledPrompt(stage, template)
+        return _compiled[stage]
+
+
+def prompt_cache_stats():
+    with _compiled_lock:
+        compiled = list(_compiled.values())
+    return {prompt.stage: prompt.stats() for prompt in compiled}
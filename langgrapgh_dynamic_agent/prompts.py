@@ -1,4 +1,4 @@
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import PromptTemplate
 
 # Preprocessor Agent Prompt
 preprocessor_prompt_template = PromptTemplate(
@@ -170,4 +170,45 @@ code_review_prompt_template = PromptTemplate(
     {initial_request}
     """,
     input_variables=["generated_code", "initial_request"],
-)
\ No newline at end of file
+)
+
+# Code Repair Agent Prompt (used when a previous attempt was rejected or failed to run)
+code_repair_prompt_template = PromptTemplate(
+    template="""
+    You are a Python code repair agent. A previous attempt to solve the task below was rejected.
+    Your goal is to return a corrected, fully executable version of the code that fixes the reported problem.
+
+    Requirements:
+    - Fix the problem described in the feedback. Keep everything that already works.
+    - The code must include all necessary imports, functions, and main logic.
+    - You must return ONLY Python code wrapped in **triple backticks (```)**.
+    - Do NOT include the word 'python' or any other text inside the triple backticks—just the code itself.
+    - The response must be ONLY the code. No explanations, comments, alternative solutions, or unnecessary newlines.
+
+    Task: {task}
+
+    Previous code:
+    {previous_code}
+
+    Feedback:
+    {feedback}
+
+    OUTPUT: 
+    """,
+    input_variables=["task", "previous_code", "feedback"],
+)
+
+# Batched Code Review Agent Prompt: the same guidelines and examples as the single review,
+# followed by several numbered programs that are reviewed in one call
+_code_review_instructions = code_review_prompt_template.template.split("Python Code to Review:")[0]
+
+code_review_batch_prompt_template = PromptTemplate(
+    template=_code_review_instructions + """Programs to Review (each with its own initial request, review each one independently):
+
+    {programs}
+
+    Return a JSON object with a "reviews" list holding exactly one review per program, in order.
+    Each review has "index" (the program number), "result" ('correct' or 'incorrect') and "message".
+    """,
+    input_variables=["programs"],
+)
@@ -0,0 +1,185 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import config
+
+# Fast path in front of the preprocessor.
+#
+# Requests are normalized (Unicode, case, whitespace, trailing punctuation) and
+# looked up in a persistent map of tasks the preprocessor refined earlier: first
+# exactly, then as near-duplicates by 64-bit simhash. Near-duplicates must also
+# carry the same literals (numbers and quoted strings), so "factorial of 10" never
+# reuses the task refined for "factorial of 12". Entries are tied to the
+# preprocessor that refined them (model, options and prompt template), so a
+# change to either stops serving old refinements. Requests that are already a
+# specific instruction to write code skip refinement altogether.
+
+_WORD = re.compile(r"\w+")
+# Filler words left out of the simhash, so "please write a program that ..." and
+# "write program that ..." hash alike while a changed content word still moves the hash
+_FILLER = {"a", "an", "the", "please", "that", "which", "to", "of", "in", "for", "and", "me", "can", "you", "some", "given"}
+_LITERAL = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+# "Write Python code to ...", "Create a function that ...", "Generate a script which ..."
+_ACTIONABLE = re.compile(
+    r"^(write|generate|create|implement|build)\b.*\b(code|function|script|program|class)\b.*\b(to|that|which|for)\b"
+)
+_VAGUE = re.compile(r"\b(something|anything|stuff|etc|help me|somehow|whatever)\b|\?")
+
+# Simhash bands: two hashes within 3 bits of each other agree on at least one of 4 bands
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+
+
+def normalize_request(request: str) -> str:
+    text = unicodedata.normalize("NFKC", request).lower()
+    text = " ".join(text.split())
+    return text.rstrip(" .!;:")
+
+
+def literal_signature(normalized: str) -> str:
+    return "\x1f".join(sorted(_LITERAL.findall(normalized)))
+
+
+def simhash(normalized: str) -> int:
+    """64-bit simhash over content word unigrams and bigrams."""
+    words = [word for word in _WORD.findall(normalized) if word not in _FILLER]
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    weights = [0] * 64
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def is_actionable(request: str) -> bool:
+    """Cheap check for requests specific enough to hand to the code generator as they are."""
+    normalized = normalize_request(request)
+    words = len(normalized.split())
+    return 6 <= words <= config.PREPROCESSOR_BYPASS_MAX_WORDS and bool(_ACTIONABLE.match(normalized)) \
+        and not _VAGUE.search(normalized)
+
+
+def _bands(value: int):
+    # SQLite integers are signed 64-bit, so the hash itself is stored as hex
+    return [value >> (band * _BAND_BITS) & ((1 << _BAND_BITS) - 1) for band in range(_BANDS)]
+
+
+class RequestCache:
+    """Persistent map from normalized requests to the task the preprocessor refined them into.
+
+    Like ChainCache, entries expire after `ttl_seconds` and are evicted in
+    least-recently-used order once there are more than `max_rows`.
+    """
+
+    def __init__(self, path=config.LLM_CACHE_PATH, max_distance=config.REQUEST_CACHE_MAX_DISTANCE,
+                 ttl_seconds=config.REQUEST_CACHE_TTL_SECONDS, max_rows=config.REQUEST_CACHE_MAX_ROWS):
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS refined_tasks (
+                normalized TEXT PRIMARY KEY,
+                literals TEXT NOT NULL,
+                simhash TEXT NOT NULL,
+                band0 INTEGER NOT NULL,
+                band1 INTEGER NOT NULL,
+                band2 INTEGER NOT NULL,
+                band3 INTEGER NOT NULL,
+                task TEXT NOT NULL,
+                refiner TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(refined_tasks)")}
+        if "last_access" not in columns:
+            # Tables written before eviction existed
+            self._conn.execute("ALTER TABLE refined_tasks ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+        if "refiner" not in columns:
+            # Rows of unknown origin never match a refiner, so they age out
+            self._conn.execute("ALTER TABLE refined_tasks ADD COLUMN refiner TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS refined_tasks_lru ON refined_tasks (last_access)")
+        for band in range(_BANDS):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS refined_tasks_band{band} ON refined_tasks (band{band})")
+        self._conn.commit()
+
+    def lookup(self, request: str, refiner: str):
+        """(task, "exact" | "near_duplicate") for a request `refiner` refined earlier, else (None, None).
+
+        `refiner` identifies the preprocessor, see CachedChain.fingerprint().
+        """
+        normalized = normalize_request(request)
+        now = time.time()
+        oldest = now - self.ttl_seconds
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task FROM refined_tasks WHERE normalized = ? AND refiner = ? AND created_at >= ?",
+                (normalized, refiner, oldest),
+            ).fetchone()
+            if row:
+                self._touch(normalized, now)
+                return row[0], "exact"
+            value = simhash(normalized)
+            bands = _bands(value)
+            rows = self._conn.execute(
+                "SELECT simhash, task, normalized FROM refined_tasks WHERE literals = ? AND refiner = ? AND "
+                "created_at >= ? AND (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)",
+                (literal_signature(normalized), refiner, oldest, *bands),
+            ).fetchall()
+            best = min(((bin(int(h, 16) ^ value).count("1"), task, key) for h, task, key in rows), default=None)
+            if best is not None and best[0] <= self.max_distance:
+                self._touch(best[2], now)
+                return best[1], "near_duplicate"
+        return None, None
+
+    def _touch(self, normalized, now):
+        # Caller holds the lock
+        self._conn.execute("UPDATE refined_tasks SET last_access = ? WHERE normalized = ?", (now, normalized))
+        self._conn.commit()
+
+    def store(self, request: str, task: str, refiner: str):
+        normalized = normalize_request(request)
+        value = simhash(normalized)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO refined_tasks "
+                "(normalized, literals, simhash, band0, band1, band2, band3, task, refiner, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (normalized, literal_signature(normalized), f"{value:016x}", *_bands(value), task, refiner, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute("DELETE FROM refined_tasks WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        rows = self._conn.execute("SELECT COUNT(*) FROM refined_tasks").fetchone()[0]
+        if rows > self.max_rows:
+            self._conn.execute(
+                "DELETE FROM refined_tasks WHERE normalized IN "
+                "(SELECT normalized FROM refined_tasks ORDER BY last_access LIMIT ?)",
+                (rows - self.max_rows,),
+            )
+
+
+_request_cache = None
+_request_cache_lock = threading.Lock()
+
+
+def get_request_cache():
+    # None when caching is switched off for the preprocessor
+    global _request_cache
+    if not config.LLM_CACHE_PATH or "preprocessor" in config.LLM_CACHE_BYPASS:
+        return None
+    with _request_cache_lock:
+        if _request_cache is None:
+            _request_cache = RequestCache()
+        return _request_cache
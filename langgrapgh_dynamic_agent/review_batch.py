@@ -0,0 +1,189 @@
+import contextvars
+import threading
+from concurrent.futures import Future
+
+from termcolor import colored
+
+import config
+from models import CodeReviewResult
+from prompts import code_review_batch_prompt_template
+
+# Batched code review.
+#
+# The review prompt is dominated by its guidelines and few-shot examples, so
+# reviewing K programs in one structured-output call pays that prompt-eval cost
+# once instead of K times. K is chosen from the context window: programs are
+# packed into a call until the estimated prompt plus the expected verdicts would
+# no longer fit in the num_ctx of the reviewer_batch model. Verdicts are mapped back by program number and
+# stored per program under the batch model and template (never in the single-review
+# cache); programs whose verdict is missing or could not be parsed are reviewed one
+# at a time.
+
+# Rough size of a llama tokenizer token; errs on the side of smaller batches
+_CHARS_PER_TOKEN = 3.5
+# Room for the "Program N / Initial Request / Code" framing of each program
+_PROGRAM_OVERHEAD_TOKENS = 20
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / _CHARS_PER_TOKEN) + 1
+
+
+def format_programs(items) -> str:
+    return "\n\n    ".join(
+        f"Program {number}:\n    Initial Request:\n    {item['initial_request']}\n    Code:\n    {item['generated_code']}"
+        for number, item in enumerate(items, start=1)
+    )
+
+
+def plan_batches(items, instructions_tokens, num_ctx=None, max_batch=None):
+    """Split `items` into consecutive groups that fit one review call each."""
+    num_ctx = num_ctx or config.OLLAMA_NUM_CTX
+    max_batch = max_batch or config.REVIEW_BATCH_MAX
+    batches, current, used = [], [], instructions_tokens
+    for item in items:
+        cost = (estimate_tokens(item["initial_request"] + item["generated_code"])
+                + _PROGRAM_OVERHEAD_TOKENS + config.REVIEW_TOKENS_PER_VERDICT)
+        if current and (used + cost > num_ctx or len(current) >= max_batch):
+            batches.append(current)
+            current, used = [], instructions_tokens
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def review_programs(chains, items):
+    """Review every {"generated_code", "initial_request"} in `items`.
+
+    Returns one (CodeReviewResult or None, llm_calls) per item, in order. A batch
+    call is counted on the first program of the batch. None means the program
+    could not be reviewed; the caller decides what to do about it.
+    """
+    reviewer, batch_reviewer, batch_verdicts = chains.reviewer, chains.batch_reviewer, chains.batch_verdicts
+    results = [None] * len(items)
+    calls = [0] * len(items)
+    todo = []
+    for position, item in enumerate(items):
+        cached = reviewer.lookup(item)
+        if cached is None:
+            cached = batch_verdicts.lookup(item)
+        if cached is not None:
+            results[position] = cached
+        else:
+            todo.append(position)
+
+    instructions_tokens = estimate_tokens(code_review_batch_prompt_template.template) + config.REVIEW_TOKENS_PER_VERDICT
+    batches = plan_batches([items[p] for p in todo], instructions_tokens, num_ctx=chains.batch_review_num_ctx)
+    offset = 0
+    for batch in batches:
+        positions = todo[offset:offset + len(batch)]
+        offset += len(batch)
+        if len(batch) > 1:
+            calls[positions[0]] += 1
+            reviews, fallback_model = _review_batch(batch_reviewer, batch)
+            for position, review in zip(positions, reviews):
+                if review is not None:
+                    results[position] = review
+                    # Not stored when the batch reviewer's latency fallback answered
+                    if fallback_model is None:
+                        batch_verdicts.store(items[position], review)
+
+        # Single programs, and anything the batch call left without a verdict
+        for position in positions:
+            if results[position] is None:
+                calls[position] += 1
+                try:
+                    # Already looked up above; stored unless the reviewer's fallback answered
+                    results[position] = reviewer.invoke_model(items[position])[0]
+                except Exception as e:
+                    print(colored(f"ERROR: Code review failed: {e}", "red"))
+    return list(zip(results, calls))
+
+
+def _review_batch(batch_reviewer, batch):
+    # (verdicts in batch order, fallback model or None); None for every program the response did not cover
+    try:
+        response, fallback_model = batch_reviewer.invoke_model({"programs": format_programs(batch)})
+    except Exception as e:
+        print(colored(f"ERROR: Batched review of {len(batch)} programs failed, reviewing them one by one: {e}", "red"))
+        return [None] * len(batch), None
+    by_index = {review.index: review for review in response.reviews}
+    if len(by_index) != len(batch):
+        print(colored(f"DEBUG: Batched review returned {len(by_index)} of {len(batch)} verdicts", "yellow"))
+    return [
+        CodeReviewResult(result=by_index[number].result, message=by_index[number].message) if number in by_index else None
+        for number in range(1, len(batch) + 1)
+    ], fallback_model
+
+
+class ReviewBatcher:
+    """Collects reviews requested by concurrent graph runs and sends them together.
+
+    The first request opens a window of `window_seconds`; everything that arrives
+    before it closes (or until `max_batch` programs are waiting) goes into one
+    review_programs() call.
+    """
+
+    def __init__(self, chains, window_seconds=None, max_batch=None):
+        self.chains = chains
+        self.window_seconds = config.REVIEW_BATCH_WINDOW_MS / 1000 if window_seconds is None else window_seconds
+        self.max_batch = max_batch or config.REVIEW_BATCH_MAX
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+
+    def review(self, item):
+        """Blocking; returns (CodeReviewResult or None, llm_calls) for one program."""
+        future = Future()
+        with self._lock:
+            self._pending.append((item, future))
+            if len(self._pending) >= self.max_batch:
+                pending = self._take()
+            else:
+                pending = None
+                if self._timer is None:
+                    # The batch call is traced on the span of the request that opened the window
+                    self._timer = threading.Timer(self.window_seconds, contextvars.copy_context().run, args=(self._flush,))
+                    self._timer.daemon = True
+                    self._timer.start()
+        if pending:
+            self._run(pending)
+        return future.result()
+
+    def _take(self):
+        # Caller holds the lock
+        pending, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return pending
+
+    def _flush(self):
+        with self._lock:
+            pending = self._take()
+        if pending:
+            self._run(pending)
+
+    def _run(self, pending):
+        try:
+            reviews = review_programs(self.chains, [item for item, _ in pending])
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        for (_, future), review in zip(pending, reviews):
+            future.set_result(review)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_review_batcher(chains) -> ReviewBatcher:
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = ReviewBatcher(chains)
+        return _batcher
@@ -0,0 +1,309 @@
+import atexit
+import io
+import queue
+import tarfile
+import threading
+import time
+from contextlib import contextmanager
+
+import docker
+import requests
+from termcolor import colored
+
+import config
+import tracing
+from sandbox_images import ensure_image, resolve_requirements
+
+
+class SandboxError(Exception):
+    # Raised when the Docker daemon or a sandbox container fails (not when the program fails)
+    pass
+
+
+# Exit codes of `timeout`: 124 when the program was stopped at the deadline, 137
+# (128 + SIGKILL) when it had to be killed - by `timeout -k` or by the OOM killer
+_EXIT_TIMEOUT = 124
+_EXIT_KILLED = 137
+
+# What the Docker SDK raises when the daemon fails or cannot be reached; the SDK lets
+# connection errors of its HTTP client through unwrapped
+_DOCKER_ERRORS = (docker.errors.DockerException, requests.exceptions.RequestException)
+
+
+class Sandbox:
+    # A long-lived container plus the number of programs it has executed
+    def __init__(self, container):
+        self.container = container
+        self.uses = 0
+
+
+class SandboxPool:
+    """Pool of pre-started sandbox containers that run code via exec.
+
+    Containers idle on `sleep infinity`; each program is copied in from memory and
+    executed with `exec_run` as SANDBOX_USER under a wall-clock timeout. The root
+    filesystem is read-only, so a program can only write to the working directory
+    (a volume of the container), /tmp and /dev/shm. Before the container goes back
+    to the pool every process of SANDBOX_USER is killed and those directories are
+    wiped. Containers run with memory, CPU and pids limits and without network.
+    After `max_uses` runs, a failure, a failed reset or a run that hit a limit, a
+    container is replaced.
+    """
+
+    def __init__(self, image=config.SANDBOX_IMAGE, size=config.SANDBOX_POOL_SIZE,
+                 max_uses=config.SANDBOX_MAX_USES, acquire_timeout=config.SANDBOX_ACQUIRE_TIMEOUT):
+        self.image = image
+        self.size = size
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self._client = docker.from_env()
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._live = 0
+        self._closed = False
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "cold_starts": 0,
+            "recycled": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def warm_up(self):
+        # Start containers until the pool is full
+        while True:
+            with self._lock:
+                if self._live >= self.size:
+                    return
+                self._live += 1
+            self._idle.put(self._start())
+
+    def _start(self):
+        try:
+            # `sleep infinity` runs as root under an init that reaps killed processes, so
+            # the reset can kill everything the sandbox user started without stopping it
+            container = self._client.containers.run(
+                image=self.image,
+                command="sleep infinity",
+                working_dir=config.SANDBOX_WORKDIR,
+                labels={"dynamic-agent-sandbox": "true"},
+                detach=True,
+                init=True,
+                read_only=True,
+                # An anonymous volume rather than a tmpfs: put_archive cannot write into a tmpfs
+                mounts=[docker.types.Mount(target=config.SANDBOX_WORKDIR, source=None, type="volume")],
+                tmpfs={path: f"rw,nosuid,nodev,size={config.SANDBOX_TMPFS_SIZE},mode=1777" for path in ("/tmp", "/dev/shm")},
+                mem_limit=config.SANDBOX_MEM_LIMIT,
+                memswap_limit=config.SANDBOX_MEM_LIMIT,  # no swap on top of the memory limit
+                nano_cpus=int(config.SANDBOX_CPUS * 1e9),
+                pids_limit=config.SANDBOX_PIDS_LIMIT,
+                network_mode=None if config.SANDBOX_NETWORK else "none",
+            )
+            container.exec_run(["chmod", "1777", config.SANDBOX_WORKDIR], user="root")
+        except Exception:
+            with self._lock:
+                self._live -= 1
+            raise
+        with self._lock:
+            self._stats["cold_starts"] += 1
+        return Sandbox(container)
+
+    def _destroy(self, sandbox):
+        with self._lock:
+            self._live -= 1
+        try:
+            sandbox.container.remove(force=True, v=True)
+        except _DOCKER_ERRORS as e:
+            print(colored(f"ERROR: Failed to remove sandbox container: {e}", "red"))
+
+    def _reset(self, sandbox):
+        # Kill whatever the previous program left running (kill -1 reaches every process
+        # the sandbox user may signal, which excludes init and the root `sleep`), then
+        # wipe everything it wrote
+        sandbox.container.exec_run(["sh", "-c", "kill -9 -1 2>/dev/null"], user=config.SANDBOX_USER)
+        exit_code, _ = sandbox.container.exec_run(
+            ["find", config.SANDBOX_WORKDIR, "/tmp", "/dev/shm", "-mindepth", "1", "-delete"], user="root"
+        )
+        if exit_code != 0:
+            return False
+        # Nothing of the sandbox user may survive into the next run
+        exit_code, _ = sandbox.container.exec_run(["sh", "-c", "kill -0 -1 2>/dev/null"], user=config.SANDBOX_USER)
+        return exit_code != 0
+
+    def acquire(self):
+        if self._closed:
+            raise RuntimeError("Sandbox pool has been shut down.")
+        start = time.perf_counter()
+        try:
+            sandbox = self._idle.get_nowait()
+            hit = True
+        except queue.Empty:
+            hit = False
+            with self._lock:
+                can_start = self._live < self.size
+                if can_start:
+                    self._live += 1
+            if can_start:
+                sandbox = self._start()
+            else:
+                try:
+                    sandbox = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No sandbox container became free within {self.acquire_timeout}s.")
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._stats["hits" if hit else "misses"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+        return sandbox
+
+    def release(self, sandbox, healthy=True):
+        sandbox.uses += 1
+        if self._closed or not healthy or sandbox.uses >= self.max_uses:
+            self._recycle(sandbox)
+            return
+        try:
+            clean = self._reset(sandbox)
+        except _DOCKER_ERRORS:
+            clean = False
+        if clean:
+            self._idle.put(sandbox)
+        else:
+            self._recycle(sandbox)
+
+    def _recycle(self, sandbox):
+        with self._lock:
+            self._stats["recycled"] += 1
+        self._destroy(sandbox)
+
+    @contextmanager
+    def sandbox(self):
+        sandbox = self.acquire()
+        healthy = False
+        try:
+            yield sandbox
+            healthy = True
+        finally:
+            self.release(sandbox, healthy=healthy)
+
+    def run_code(self, code: str, filename: str = "main.py", timeout=config.SANDBOX_TIMEOUT_SECONDS):
+        """Run `code` in a pooled container.
+
+        Returns {"exit_code", "stdout", "stderr", "output", "runtime_seconds", "timed_out",
+        "limit_killed"}, where output is stdout followed by stderr.
+        `limit_killed` is set when the timeout or the memory limit ended the run.
+        """
+        command = ["timeout", "-k", "1", str(timeout), "python", filename]
+        start = time.perf_counter()
+        try:
+            sandbox = self.acquire()
+        except (*_DOCKER_ERRORS, RuntimeError, TimeoutError) as e:
+            # Also a pool that was shut down or stayed busy past its acquire timeout
+            raise SandboxError(str(e)) from e
+
+        healthy = False
+        try:
+            sandbox.container.put_archive(config.SANDBOX_WORKDIR, _tar_single_file(filename, code))
+            run_start = time.perf_counter()
+            # A fixed hash seed keeps set and dict ordering of strings stable between runs;
+            # HOME points at /tmp because the sandbox user's home does not exist
+            exit_code, (stdout, stderr) = sandbox.container.exec_run(
+                command, workdir=config.SANDBOX_WORKDIR, user=config.SANDBOX_USER,
+                environment={"PYTHONHASHSEED": "0", "HOME": "/tmp"}, demux=True
+            )
+            runtime = time.perf_counter() - run_start
+            # A program stopped by a limit may leave processes behind, so its container is not reused
+            healthy = exit_code not in (_EXIT_TIMEOUT, _EXIT_KILLED)
+        except _DOCKER_ERRORS as e:
+            raise SandboxError(str(e)) from e
+        finally:
+            self.release(sandbox, healthy=healthy)
+            tracing.record("docker_seconds", time.perf_counter() - start)
+
+        timed_out = exit_code == _EXIT_TIMEOUT or (exit_code == _EXIT_KILLED and runtime >= timeout)
+        stdout = (stdout or b"").decode("utf-8", errors="replace")
+        stderr = (stderr or b"").decode("utf-8", errors="replace")
+        return {
+            "exit_code": exit_code,
+            "stdout": stdout,
+            "stderr": stderr,
+            "output": stdout + stderr,
+            "runtime_seconds": round(runtime, 3),
+            "timed_out": timed_out,
+            "limit_killed": timed_out or exit_code == _EXIT_KILLED,
+        }
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["live"] = self._live
+        stats["idle"] = self._idle.qsize()
+        acquires = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / acquires if acquires else 0.0
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / acquires if acquires else 0.0
+        return stats
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                sandbox = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._destroy(sandbox)
+
+
+def _tar_single_file(name: str, content: str) -> bytes:
+    data = content.encode("utf-8")
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        info = tarfile.TarInfo(name=name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_sandbox_pool(image=None) -> SandboxPool:
+    # One pool per image and process, shared by every workflow invocation. Only the
+    # base image pool is warmed up; dependency images start containers on demand.
+    image = image or config.SANDBOX_IMAGE
+    with _pools_lock:
+        if image not in _pools:
+            try:
+                pool = SandboxPool(image=image)
+                if image == config.SANDBOX_IMAGE:
+                    pool.warm_up()
+            except _DOCKER_ERRORS as e:
+                raise SandboxError(f"Could not start the sandbox pool for {image}: {e}") from e
+            _pools[image] = pool
+            atexit.register(pool.shutdown)
+        return _pools[image]
+
+
+def get_sandbox_pool_for(code: str) -> SandboxPool:
+    """Pool whose image has every package `code` imports, building the image if needed."""
+    if config.CASSETTE_MODE:
+        # Record the results of the real pool, or replay them without Docker (see cassettes.py)
+        from cassettes import cassette_pool_for
+        return cassette_pool_for(code, _pool_for)
+    return _pool_for(code)
+
+
+def _pool_for(code: str) -> SandboxPool:
+    packages, unsatisfiable = resolve_requirements(code)
+    if unsatisfiable:
+        raise SandboxError("Imports cannot be satisfied: " + ", ".join(f"{m} ({why})" for m, why in unsatisfiable.items()))
+    if not packages:
+        return get_sandbox_pool()
+    try:
+        image = ensure_image(docker.from_env(), packages)
+    except _DOCKER_ERRORS as e:
+        raise SandboxError(f"Could not build the sandbox image for {', '.join(packages)}: {e}") from e
+    return get_sandbox_pool(image)
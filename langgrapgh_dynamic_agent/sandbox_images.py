@@ -0,0 +1,294 @@
+import argparse
+import ast
+import hashlib
+import io
+import os
+import re
+import subprocess
+import sys
+import tarfile
+import threading
+import zipfile
+from collections import deque
+
+import config
+from static_check import available_modules, imported_modules
+
+# Sandbox images per requirement set.
+#
+# The imports of a program are mapped to pip packages. Programs that only use the
+# standard library run in SANDBOX_IMAGE; anything else runs in an image built
+# FROM it with the extra packages installed from the local wheelhouse, so builds
+# work offline. Images are tagged with a hash of the base image and requirement
+# set and built once per Docker host.
+#
+#   python sandbox_images.py wheelhouse                      # download wheels for every mapped package,
+#                                                            # for the Docker daemon's architecture
+#   python sandbox_images.py build beautifulsoup4 qrcode     # prebuild an image
+
+# Top-level import name -> pip package, for packages whose names differ or that
+# generated programs commonly need. Extend with SANDBOX_PACKAGE_MAP.
+IMPORT_TO_PACKAGE = {
+    "bs4": "beautifulsoup4",
+    "matplotlib": "matplotlib",
+    "numpy": "numpy",
+    "pandas": "pandas",
+    "scipy": "scipy",
+    "sympy": "sympy",
+    "requests": "requests",
+    "qrcode": "qrcode",
+    "PIL": "pillow",
+    "PyPDF2": "PyPDF2",
+    "pypdf": "pypdf",
+    "psycopg": "psycopg[binary]",
+    "psycopg2": "psycopg2-binary",
+    "yaml": "PyYAML",
+    "dateutil": "python-dateutil",
+    "docx": "python-docx",
+    "openpyxl": "openpyxl",
+    "lxml": "lxml",
+    "tabulate": "tabulate",
+    "cv2": "opencv-python-headless",
+    "sklearn": "scikit-learn",
+    "reportlab": "reportlab",
+}
+IMPORT_TO_PACKAGE.update(config.SANDBOX_PACKAGE_MAP)
+
+
+def _normalize(name):
+    # PEP 503 normalization, also used for wheel file names ("-" and "." become "_")
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def _distribution(package):
+    # "psycopg[binary]" -> "psycopg"
+    return package.split("[")[0]
+
+
+def wheelhouse_distributions(path=None) -> set:
+    """Normalized names of the distributions available in the wheelhouse."""
+    path = path or config.SANDBOX_WHEELHOUSE
+    if not path or not os.path.isdir(path):
+        return set()
+    names = set()
+    for filename in os.listdir(path):
+        if filename.endswith(".whl"):
+            names.add(_normalize(filename.split("-")[0]))
+        elif filename.endswith((".tar.gz", ".zip")):
+            names.add(_normalize(filename.rsplit("-", 1)[0]))
+    return names
+
+
+def installable_modules() -> set:
+    """Top-level modules whose package can be installed from the wheelhouse."""
+    if config.CASSETTE_MODE == "replay":
+        # The wheelhouse of the machine that recorded the cassette (see cassettes.py)
+        from cassettes import replayed_modules
+        recorded = replayed_modules("installable_modules")
+        if recorded is not None:
+            return recorded
+    available = wheelhouse_distributions()
+    return {module for module, package in IMPORT_TO_PACKAGE.items() if _normalize(_distribution(package)) in available}
+
+
+def resolve_requirements(code: str):
+    """Map the imports of `code` to packages.
+
+    Returns (packages, unsatisfiable) where packages is the sorted requirement
+    set the sandbox image needs and unsatisfiable lists imports that are neither
+    in the base image nor installable from the wheelhouse, with the reason.
+    """
+    try:
+        modules = imported_modules(ast.parse(code)) - available_modules()
+    except SyntaxError:
+        return [], {}  # let the interpreter in the sandbox report it
+    available = wheelhouse_distributions()
+    packages = set()
+    unsatisfiable = {}
+    for module in sorted(modules):
+        package = IMPORT_TO_PACKAGE.get(module)
+        if package is None:
+            unsatisfiable[module] = "no known package"
+        elif _normalize(_distribution(package)) not in available:
+            unsatisfiable[module] = f"{package} is not in the wheelhouse"
+        else:
+            packages.add(package)
+    return sorted(packages), unsatisfiable
+
+
+def image_tag(packages, base_image=None) -> str:
+    base_image = base_image or config.SANDBOX_IMAGE
+    if not packages:
+        return base_image
+    digest = hashlib.sha256("\n".join([base_image, *sorted(packages)]).encode("utf-8")).hexdigest()[:16]
+    return f"{config.SANDBOX_IMAGE_REPOSITORY}:{digest}"
+
+
+def image_for(code: str) -> str:
+    """Tag of the image `code` runs in (which may not be built yet)."""
+    if config.CASSETTE_MODE:
+        # Recorded to or replayed from the cassette, like the sandbox results (see cassettes.py)
+        from cassettes import cassette_image_for
+        return cassette_image_for(code, _image_for)
+    return _image_for(code)
+
+
+def _image_for(code: str) -> str:
+    return image_tag(resolve_requirements(code)[0])
+
+
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+
+def ensure_image(client, packages, base_image=None) -> str:
+    """Tag of an image with `packages` installed, building it on first use."""
+    base_image = base_image or config.SANDBOX_IMAGE
+    tag = image_tag(packages, base_image)
+    if tag == base_image:
+        return tag
+
+    import docker
+
+    with _build_locks_lock:
+        lock = _build_locks.setdefault(tag, threading.Lock())
+    # Concurrent requests with the same requirement set wait for a single build
+    with lock:
+        try:
+            client.images.get(tag)
+            return tag
+        except docker.errors.ImageNotFound:
+            pass
+        client.images.build(
+            fileobj=_build_context(packages, base_image),
+            custom_context=True,
+            tag=tag,
+            labels={"dynamic-agent-sandbox": "true", "dynamic-agent-requirements": " ".join(sorted(packages))},
+            network_mode="none",
+            rm=True,
+        )
+    return tag
+
+
+# Requires-Dist entry: name, optional [extras], then version specifiers and "; markers"
+_REQUIREMENT = re.compile(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[([^\]]*)\])?")
+_EXTRA_MARKER = re.compile(r"extra\s*==\s*['\"]([^'\"]+)['\"]")
+
+
+def _parse_requirement(requirement):
+    """(distribution, extras, extra the requirement is conditional on or None)."""
+    spec, _, marker = requirement.partition(";")
+    match = _REQUIREMENT.match(spec)
+    if not match:
+        return None, set(), None
+    extras = {extra.strip() for extra in (match.group(2) or "").split(",") if extra.strip()}
+    extra = _EXTRA_MARKER.search(marker)
+    return match.group(1), extras, extra.group(1) if extra else None
+
+
+def _wheel_requirements(path):
+    # Requires-Dist lines of a wheel's METADATA
+    with zipfile.ZipFile(path) as wheel:
+        name = next((n for n in wheel.namelist() if n.endswith(".dist-info/METADATA")), None)
+        if name is None:
+            return []
+        metadata = wheel.read(name).decode("utf-8", errors="replace")
+    return [line.split(":", 1)[1].strip() for line in metadata.splitlines() if line.startswith("Requires-Dist:")]
+
+
+def wheelhouse_files(packages, path=None) -> list:
+    """Wheelhouse files of `packages` and everything they depend on.
+
+    Dependencies are followed through the wheels' metadata. Other environment
+    markers are not evaluated, so a dependency that only some Python versions
+    need is included when the wheelhouse has it; pip decides at install time.
+    """
+    path = path or config.SANDBOX_WHEELHOUSE
+    files = {}
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith(".whl"):
+            files.setdefault(_normalize(filename.split("-")[0]), []).append(filename)
+        elif filename.endswith((".tar.gz", ".zip")):
+            files.setdefault(_normalize(filename.rsplit("-", 1)[0]), []).append(filename)
+
+    needed = {}
+    pending = deque()
+    for package in packages:
+        name, extras, _ = _parse_requirement(package)
+        pending.append((_normalize(name), extras))
+    while pending:
+        name, extras = pending.popleft()
+        known = needed.get(name)
+        if known is not None and extras <= known:
+            continue
+        needed[name] = (known or set()) | extras
+        for filename in files.get(name, []):
+            if not filename.endswith(".whl"):
+                continue  # an sdist's dependencies are only known once it is built
+            for requirement in _wheel_requirements(os.path.join(path, filename)):
+                dependency, dependency_extras, condition = _parse_requirement(requirement)
+                if dependency and (condition is None or condition in needed[name]):
+                    pending.append((_normalize(dependency), dependency_extras))
+    return sorted(filename for name in needed for filename in files.get(name, []))
+
+
+def _build_context(packages, base_image):
+    # Dockerfile plus the wheels the packages need, as an in-memory tar
+    requirements = " ".join(f"'{p}'" for p in sorted(packages))
+    dockerfile = (
+        f"FROM {base_image}\n"
+        "COPY wheelhouse /tmp/wheelhouse\n"
+        f"RUN pip install --no-cache-dir --no-index --find-links /tmp/wheelhouse {requirements} "
+        "&& rm -rf /tmp/wheelhouse\n"
+    )
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        data = dockerfile.encode("utf-8")
+        info = tarfile.TarInfo("Dockerfile")
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+        for filename in wheelhouse_files(packages):
+            tar.add(os.path.join(config.SANDBOX_WHEELHOUSE, filename), arcname=f"wheelhouse/{filename}")
+    buffer.seek(0)
+    return buffer
+
+
+# Docker's Arch (Go names) -> manylinux machine names
+_DOCKER_ARCHES = {"amd64": "x86_64", "arm64": "aarch64", "ppc64le": "ppc64le", "s390x": "s390x"}
+
+
+def wheel_platform(client=None) -> str:
+    """manylinux platform tag for the machine the sandbox containers run on."""
+    import docker
+
+    client = client or docker.from_env()
+    arch = client.version()["Arch"]
+    return f"manylinux2014_{_DOCKER_ARCHES.get(arch, arch)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage dependency images for the code sandbox.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    wheelhouse_parser = subparsers.add_parser("wheelhouse", help="Download wheels (needs network access).")
+    wheelhouse_parser.add_argument("packages", nargs="*", help="Defaults to every mapped package.")
+    wheelhouse_parser.add_argument("--python-version", default="3.9", help="Python version of SANDBOX_IMAGE.")
+    wheelhouse_parser.add_argument("--platform", help="Wheel platform tag; defaults to the Docker daemon's architecture.")
+    build_parser = subparsers.add_parser("build", help="Build the image for a requirement set.")
+    build_parser.add_argument("packages", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "wheelhouse":
+        packages = args.packages or sorted(set(IMPORT_TO_PACKAGE.values()))
+        subprocess.run(
+            [sys.executable, "-m", "pip", "download", "--dest", config.SANDBOX_WHEELHOUSE,
+             "--only-binary", ":all:", "--platform", args.platform or wheel_platform(),
+             "--python-version", args.python_version, *packages],
+            check=True,
+        )
+    elif args.command == "build":
+        import docker
+        print(ensure_image(docker.from_env(), args.packages))
+
+
+if __name__ == "__main__":
+    main()
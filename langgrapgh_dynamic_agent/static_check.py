@@ -0,0 +1,196 @@
+import ast
+import builtins
+import re
+import subprocess
+import sys
+import threading
+
+from termcolor import colored
+
+import config
+
+# Names that exist in every module without being bound or imported
+_MODULE_NAMES = {"__file__", "__name__", "__doc__", "__builtins__", "__spec__", "__loader__", "__package__"}
+_BUILTIN_NAMES = set(dir(builtins)) | _MODULE_NAMES
+
+# Leftovers from a markdown answer: fences, or bold bullet lines like "- **Input**:"
+_MARKDOWN_LINE = re.compile(r"^\s*(```|[-*]\s+\*\*\w[^*\n]*\*\*)", re.MULTILINE)
+
+
+# Printed by an interpreter: its built-in modules and the modules in its standard library
+# directories. Also runs on Pythons older than 3.10, which have no sys.stdlib_module_names.
+_STDLIB_PROBE = """
+import os, pkgutil, sys, sysconfig
+paths = {sysconfig.get_paths()[key] for key in ("stdlib", "platstdlib")}
+paths |= {os.path.join(path, "lib-dynload") for path in paths}
+names = set(sys.builtin_module_names) | {m.name for m in pkgutil.iter_modules(sorted(paths))}
+print(" ".join(sorted(names)))
+"""
+
+# Top-level standard library modules added and removed per Python version, used to
+# shift the host's module list to the sandbox's version when the image cannot be probed
+_STDLIB_ADDED = {
+    (3, 9): {"graphlib", "zoneinfo"},
+    (3, 11): {"tomllib"},
+}
+_STDLIB_REMOVED = {
+    (3, 10): {"formatter", "parser", "symbol"},
+    (3, 12): {"asynchat", "asyncore", "distutils", "imp", "smtpd"},
+    (3, 13): {
+        "aifc", "audioop", "cgi", "cgitb", "chunk", "crypt", "imghdr", "lib2to3", "mailcap", "msilib", "nis",
+        "nntplib", "ossaudiodev", "pipes", "sndhdr", "spwd", "sunau", "telnetlib", "uu", "xdrlib",
+    },
+}
+
+_stdlib_modules = {}
+_stdlib_modules_lock = threading.Lock()
+
+
+def _image_version(image):
+    # (3, 9) for "python:3.9-slim", None for images not tagged with a Python version
+    match = re.search(r"python:(\d+)\.(\d+)", image)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def _probe_image(image) -> set:
+    import docker
+    output = docker.from_env().containers.run(
+        image, ["python", "-c", _STDLIB_PROBE], remove=True, network_mode="none"
+    )
+    return set(output.decode("utf-8").split())
+
+
+def _shifted_host_modules(image) -> set:
+    # The host's standard library, moved to the Python version of the image
+    output = subprocess.run([sys.executable, "-c", _STDLIB_PROBE], capture_output=True, text=True, check=True).stdout
+    modules = set(output.split())
+    host, target = sys.version_info[:2], _image_version(image)
+    if target is None:
+        return modules
+    for version in sorted(set(_STDLIB_ADDED) | set(_STDLIB_REMOVED)):
+        added, removed = _STDLIB_ADDED.get(version, set()), _STDLIB_REMOVED.get(version, set())
+        if host < version <= target:
+            modules = (modules | added) - removed
+        elif target < version <= host:
+            modules = (modules - added) | removed
+    return modules
+
+
+def stdlib_modules(image=None) -> set:
+    """Top-level standard library modules of the Python in `image` (SANDBOX_IMAGE by default).
+
+    The image is probed once per process. When Docker cannot run it, the host's
+    standard library is shifted to the Python version in the image's tag.
+    """
+    image = image or config.SANDBOX_IMAGE
+    with _stdlib_modules_lock:
+        if image not in _stdlib_modules:
+            try:
+                _stdlib_modules[image] = _probe_image(image)
+            except Exception as e:
+                print(colored(f"DEBUG: Could not probe {image} for its standard library ({e}), "
+                              f"using the host's", "yellow"))
+                _stdlib_modules[image] = _shifted_host_modules(image)
+        return _stdlib_modules[image]
+
+
+def available_modules():
+    # Top-level modules the sandbox image can import: its standard library plus
+    # whatever the image adds on top (SANDBOX_EXTRA_MODULES)
+    if config.CASSETTE_MODE == "replay":
+        # The modules of the sandbox the cassette was recorded against (see cassettes.py)
+        from cassettes import replayed_modules
+        recorded = replayed_modules("available_modules")
+        if recorded is not None:
+            return recorded
+    return stdlib_modules() | config.SANDBOX_EXTRA_MODULES
+
+
+def check_code(code: str, modules=None) -> dict:
+    """Cheap local checks run before the LLM review.
+
+    Returns {"status": "pass" | "fail", "reason": ..., "detail": ...} where reason
+    is one of "markdown_leftovers", "syntax_error", "unavailable_imports" or
+    "undefined_names" for a failure, and None for a pass.
+    """
+    markdown = _MARKDOWN_LINE.search(code)
+    if markdown:
+        line = code.count("\n", 0, markdown.start()) + 1
+        return _fail("markdown_leftovers", f"Markdown formatting found on line {line}: {markdown.group(0).strip()!r}")
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return _fail("syntax_error", f"{e.msg} (line {e.lineno})")
+
+    missing = sorted(imported_modules(tree) - (modules if modules is not None else available_modules()))
+    if missing:
+        return _fail("unavailable_imports", f"Modules not available in the sandbox: {', '.join(missing)}")
+
+    undefined = undefined_names(tree)
+    if undefined:
+        return _fail("undefined_names", f"Names used but never defined or imported: {', '.join(undefined)}")
+
+    return {"status": "pass", "reason": None, "detail": ""}
+
+
+def _fail(reason, detail):
+    return {"status": "fail", "reason": reason, "detail": detail}
+
+
+def imported_modules(tree) -> set:
+    """Top-level modules imported unconditionally (imports guarded by `except ImportError` are skipped)."""
+    guarded = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Try) and any(_catches_import_error(h) for h in node.handlers):
+            guarded.update(id(child) for stmt in node.body for child in ast.walk(stmt))
+
+    modules = set()
+    for node in ast.walk(tree):
+        if id(node) in guarded:
+            continue
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules.add(node.module.split(".")[0])
+    return modules
+
+
+def _catches_import_error(handler):
+    if handler.type is None:
+        return True
+    names = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+    return any(isinstance(n, ast.Name) and n.id in ("ImportError", "ModuleNotFoundError", "Exception") for n in names)
+
+
+def undefined_names(tree) -> list:
+    """Names that are loaded but never bound anywhere in the module.
+
+    Deliberately scope-insensitive: a name bound in any scope counts as defined,
+    so this only reports names that cannot possibly resolve at runtime.
+    """
+    bound = set()
+    loaded = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+            return []  # star imports make the check meaningless
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loaded.setdefault(node.id, node.lineno)
+            else:
+                bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+    return sorted(name for name in loaded if name not in bound and name not in _BUILTIN_NAMES)
@@ -0,0 +1,156 @@
+import argparse
+import contextvars
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import config
+from utils import percentile
+
+# Per-node tracing for the dynamic agent workflow.
+#
+# With TRACE_FILE set, every graph node is wrapped in a span that records its wall
+# time, the LLM token counts and Ollama durations of the calls made inside it,
+# time spent in the Docker sandbox and the current attempt number. Spans are
+# appended to TRACE_FILE as JSON lines. Without TRACE_FILE nothing is wrapped.
+#
+#   python tracing.py report traces.jsonl     # per-node p50/p95/p99 latency
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Ollama reports these in nanoseconds
+_OLLAMA_DURATIONS = ("load_duration", "prompt_eval_duration", "eval_duration", "total_duration")
+
+
+def tracing_enabled():
+    return bool(config.TRACE_FILE)
+
+
+# Worker threads of a node (candidate generation, batched reviews) add to its span too
+_record_lock = threading.Lock()
+
+
+def record(key: str, value: float):
+    """Add `value` to `key` on the span of the node currently running, if any."""
+    span = _current_span.get()
+    if span is not None:
+        with _record_lock:
+            span[key] = span.get(key, 0) + value
+
+
+class _SpanWriter:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def write(self, span):
+        line = json.dumps(span)
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _SpanWriter(config.TRACE_FILE)
+        return _writer
+
+
+def trace_node(node_name: str, node_fn):
+    """Wrap a graph node so each execution writes one span."""
+    if not tracing_enabled():
+        return node_fn
+
+    @functools.wraps(node_fn)
+    def traced(state):
+        span = {
+            "request_id": state.get("request_id", ""),
+            "node": node_name,
+            "start": time.time(),
+            "status": "ok",
+        }
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            return node_fn(state)
+        except Exception as e:
+            span["status"] = "error"
+            span["error"] = str(e)
+            raise
+        finally:
+            span["wall_seconds"] = round(time.perf_counter() - start, 6)
+            span["attempt"] = state.get("attempts", 0)
+            _current_span.reset(token)
+            _get_writer().write(span)
+
+    return traced
+
+
+class LLMSpanCallback(BaseCallbackHandler):
+    """Copies token counts and Ollama timings of finished LLM calls onto the current span."""
+
+    run_inline = True
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                record("llm_calls", 1)
+                info = generation.generation_info or {}
+                record("prompt_tokens", info.get("prompt_eval_count") or 0)
+                record("completion_tokens", info.get("eval_count") or 0)
+                for key in _OLLAMA_DURATIONS:
+                    if info.get(key):
+                        record(key.replace("duration", "seconds"), info[key] / 1e9)
+
+
+def llm_callbacks():
+    # Callbacks to attach to every chain; empty when tracing is off
+    return [LLMSpanCallback()] if tracing_enabled() else []
+
+
+def load_spans(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def report(spans):
+    by_node = defaultdict(list)
+    for span in spans:
+        by_node[span["node"]].append(span)
+
+    header = f"{'node':<30} {'count':>6} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'llm s':>8} {'tokens':>8} {'docker s':>9}"
+    print(header)
+    print("-" * len(header))
+    for node, node_spans in sorted(by_node.items()):
+        wall = [s["wall_seconds"] for s in node_spans]
+        count = len(node_spans)
+        llm = sum(s.get("eval_seconds", 0) + s.get("prompt_eval_seconds", 0) for s in node_spans) / count
+        tokens = sum(s.get("prompt_tokens", 0) + s.get("completion_tokens", 0) for s in node_spans) / count
+        docker_time = sum(s.get("docker_seconds", 0) for s in node_spans) / count
+        print(f"{node:<30} {count:>6} {percentile(wall, 50):>8.3f} {percentile(wall, 95):>8.3f} "
+              f"{percentile(wall, 99):>8.3f} {llm:>8.3f} {tokens:>8.0f} {docker_time:>9.3f}")
+    print("(llm s, tokens and docker s are per-span means)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize dynamic agent trace spans.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Per-node latency percentiles.")
+    report_parser.add_argument("trace_file", nargs="?", default=config.TRACE_FILE or "traces.jsonl")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report(load_spans(args.trace_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from termcolor import colored
 from models import AgentState, CodeReviewResult
+import config
 
 def pretty_print_state_enhanced(agent_state: AgentState):
     print('-' * 50)
@@ -25,3 +26,21 @@ def pretty_print_state_enhanced(agent_state: AgentState):
             print(colored(f'{key}:', 'cyan') + colored(f' {value}', 'yellow'))
 
     print('-' * 50)
+
+
+def debug_state(node_name: str, agent_state: AgentState):
+    # Opt-in debug sink: printing the full state (code strings included) after every
+    # node is only done when DEBUG_STATE is set
+    if not config.DEBUG_STATE:
+        return
+    print(colored(f"DEBUG: {node_name} state", "magenta"))
+    pretty_print_state_enhanced(agent_state)
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile of a list of numbers (0.0 for an empty list)
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
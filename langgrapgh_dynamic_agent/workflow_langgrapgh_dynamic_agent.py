@@ -1,61 +1,111 @@
-from langgraph.graph import StateGraph, END
+import argparse
+import threading
+import uuid
 from termcolor import colored
 
-from agents import AgentState
-from agents import agent_preprocessor, agent_code_generation, agent_extract_code, agent_code_review, agent_execute_code_in_docker 
-from agents import conditional_should_continue_after_extraction, conditional_should_continue_after_code_review
-
-
-# Create a StateGraph to model the workflow
-workflow = StateGraph(AgentState)
-
-# Add nodes for each step
-workflow.add_node("agent_preprocessor", agent_preprocessor)
-workflow.add_node("agent_code_generation", agent_code_generation)
-workflow.add_node("agent_extract_code", agent_extract_code)
-workflow.add_node("agent_code_review", agent_code_review)
-workflow.add_node("agent_execute_code_in_docker", agent_execute_code_in_docker)
-
-# Set entry point
-workflow.set_entry_point("agent_preprocessor")
-
-# Add edges between nodes
-workflow.add_edge("agent_preprocessor", "agent_code_generation")
-workflow.add_edge("agent_code_generation", "agent_extract_code")
-
-# Add conditional edges 
-workflow.add_conditional_edges(
-    "agent_extract_code",
-    conditional_should_continue_after_extraction,
-    {
-        "continue": "agent_code_review",
-        "regenerate": "agent_code_generation"
-    }
-)
-
-workflow.add_conditional_edges(
-    "agent_code_review",
-    conditional_should_continue_after_code_review,
-    {
-        "continue": "agent_execute_code_in_docker",
-        "regenerate": "agent_code_generation"
-    }
-)
-
-workflow.add_edge("agent_execute_code_in_docker", END)
+import config
+from tracing import trace_node
 
-# Compile and run the workflow with debug messages
-app = workflow.compile()
-
-#helper method to visualize graph
+from agents import AgentState
+from agents import agent_preprocessor, agent_code_generation, agent_extract_code, agent_static_check, agent_code_review, agent_execute_code_in_docker 
+from agents import conditional_should_continue_after_extraction, conditional_should_continue_after_static_check, conditional_should_continue_after_code_review
+from agents import conditional_should_continue_after_execution, agent_give_up
+
+
+def build_workflow():
+    # langgraph is only imported when the graph is actually built
+    from langgraph.graph import StateGraph, END
+
+    # Create a StateGraph to model the workflow
+    workflow = StateGraph(AgentState)
+
+    # Add nodes for each step (wrapped in tracing spans when TRACE_FILE is set)
+    workflow.add_node("agent_preprocessor", trace_node("agent_preprocessor", agent_preprocessor))
+    workflow.add_node("agent_code_generation", trace_node("agent_code_generation", agent_code_generation))
+    workflow.add_node("agent_extract_code", trace_node("agent_extract_code", agent_extract_code))
+    workflow.add_node("agent_static_check", trace_node("agent_static_check", agent_static_check))
+    workflow.add_node("agent_code_review", trace_node("agent_code_review", agent_code_review))
+    workflow.add_node("agent_execute_code_in_docker", trace_node("agent_execute_code_in_docker", agent_execute_code_in_docker))
+    workflow.add_node("agent_give_up", trace_node("agent_give_up", agent_give_up))
+
+    # Set entry point
+    workflow.set_entry_point("agent_preprocessor")
+
+    # Add edges between nodes
+    workflow.add_edge("agent_preprocessor", "agent_code_generation")
+    workflow.add_edge("agent_code_generation", "agent_extract_code")
+
+    # Add conditional edges 
+    workflow.add_conditional_edges(
+        "agent_extract_code",
+        conditional_should_continue_after_extraction,
+        {
+            "continue": "agent_static_check",
+            "regenerate": "agent_code_generation",
+            "give_up": "agent_give_up"
+        }
+    )
+
+    workflow.add_conditional_edges(
+        "agent_static_check",
+        conditional_should_continue_after_static_check,
+        {
+            "continue": "agent_code_review",
+            "regenerate": "agent_code_generation",
+            "give_up": "agent_give_up"
+        }
+    )
+
+    workflow.add_conditional_edges(
+        "agent_code_review",
+        conditional_should_continue_after_code_review,
+        {
+            "continue": "agent_execute_code_in_docker",
+            "regenerate": "agent_code_generation",
+            "give_up": "agent_give_up"
+        }
+    )
+
+    # Programs that fail at runtime go back for repair with the error output
+    workflow.add_conditional_edges(
+        "agent_execute_code_in_docker",
+        conditional_should_continue_after_execution,
+        {
+            "done": END,
+            "regenerate": "agent_code_generation",
+            "give_up": "agent_give_up"
+        }
+    )
+
+    workflow.add_edge("agent_give_up", END)
+
+    return workflow
+
+
+_app = None
+_app_lock = threading.Lock()
+
+def build_app(checkpointer=None):
+    # With a checkpointer the state after every node is saved under the thread id of the run
+    return build_workflow().compile(checkpointer=checkpointer)
+
+def get_app():
+    # Compile the workflow once per process, on first use
+    global _app
+    with _app_lock:
+        if _app is None:
+            _app = build_app()
+        return _app
+
+# Each attempt (or speculative candidate) walks at most five nodes, so size the recursion limit to the budget
+invoke_config = {"recursion_limit": 5 * config.MAX_ATTEMPTS * max(1, config.CODEGEN_CANDIDATES) + 5}
+
+#helper method to visualize graph (draw_mermaid_png calls a remote renderer)
 def save_graph_to_file(runnable_graph, output_file_path):
     png_bytes = runnable_graph.get_graph().draw_mermaid_png()
     with open(output_file_path, 'wb') as file:
         file.write(png_bytes)
 
-save_graph_to_file(app, "output.png")
-
-
 # List of initial requests
 initial_requests = [
     "Calculate the factorial of 10.",
@@ -93,28 +143,49 @@ initial_requests = [
     "Generate Python code to list all the installed packages in the current environment using pip."
 ]
 
-# Iterate over each request
-for request in initial_requests:
-    initial_state = {
+# Build the empty agent state for a single request
+def make_initial_state(request: str, request_id: str = None):
+    return {
+        "request_id": request_id or uuid.uuid4().hex,
         "initial_request": request,
         "preprocessor_agent_result": "",
+        "preprocessor_source": "",
         "generated_code_result": "",
         "extracted_python_code": "",
         "code_review_result": "",
-        "final_output": ""
+        "final_output": "",
+        "execution_result": {},
+        "pending_candidates": [],
+        "attempts": 0,
+        "llm_calls": 0,
+        "repair_feedback": "",
+        "status": ""
     }
 
-    try:
-        # Run the workflow and observe the debug outputs
-        result = app.invoke(initial_state)
-        print(colored("", "white"))  # Adding a newline with white color for separation
-        print(colored("FINAL Result:", "magenta"), colored(result["final_output"], "light_yellow"))
-    
-    except Exception as e:
-        # Catch and log the error, then continue with the next request
-        print(colored(f"ERROR: Failed to process request: '{request}'", "red"))
-        print(colored(f"ERROR DETAILS: {str(e)}", "red"))
-    
-    # Pause for user input before moving to the next request
-    input(colored("\nPress Enter to continue to the next request...\n", "yellow"))
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the dynamic agent over the demo requests, one at a time.")
+    parser.add_argument("--render-graph", metavar="PNG", help="Also save a picture of the graph (needs network access).")
+    args = parser.parse_args()
+
+    app = get_app()
+    if args.render_graph:
+        save_graph_to_file(app, args.render_graph)
+
+    # Iterate over each request
+    for request in initial_requests:
+        initial_state = make_initial_state(request)
+
+        try:
+            # Run the workflow and observe the debug outputs
+            result = app.invoke(initial_state, invoke_config)
+            print(colored("", "white"))  # Adding a newline with white color for separation
+            print(colored("FINAL Result:", "magenta"), colored(result["final_output"], "light_yellow"))
+
+        except Exception as e:
+            # Catch and log the error, then continue with the next request
+            print(colored(f"ERROR: Failed to process request: '{request}'", "red"))
+            print(colored(f"ERROR DETAILS: {str(e)}", "red"))
+
+        # Pause for user input before moving to the next request
+        input(colored("\nPress Enter to continue to the next request...\n", "yellow"))
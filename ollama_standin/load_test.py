@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import BaseModel
+from termcolor import colored
+
+from server import StandinConfig, serve
+
+# Load test for the ollama_native agents against the stand-in server (or any Ollama host).
+#
+#   python load_test.py --serve --agent tools --requests 500 --concurrency 32
+#   python load_test.py --host http://127.0.0.1:11434 --agent structured
+#   python load_test.py --serve --async --concurrency 500 --max-concurrency 64
+#
+# --serve starts the stand-in in this process with the given timing and fault
+# options; without it, point --host at a stand-in started with server.py.
+# --async drives every request from one event loop through arun() instead of a
+# thread per in-flight request.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tutorials", "ollama_native"))
+from base_agent import BaseLLMAgent, StructuredResponseAgent, ToolCallingAgent, aclose_shared_transports  # noqa: E402
+
+
+class Weather(BaseModel):
+    city: str
+    temperature: float
+    conditions: str
+
+
+class ChatAgent(BaseLLMAgent):
+    def run(self, messages):
+        return self.generate_response([{"role": "system", "content": self.system_prompt}, *messages]).content
+
+    async def arun(self, messages):
+        return (await self.agenerate_response([{"role": "system", "content": self.system_prompt}, *messages])).content
+
+
+class WeatherReportAgent(StructuredResponseAgent):
+    def get_pydantic_model(self):
+        return Weather
+
+
+def make_agent(kind, host, model):
+    if kind == "chat":
+        return ChatAgent("You are a helpful assistant.", model, api_url=host)
+    if kind == "structured":
+        return WeatherReportAgent("Report the weather as JSON.", model, api_url=host)
+    agent = ToolCallingAgent("Use the tools when they help.", model, api_url=host)
+
+    def get_current_weather(location: str) -> str:
+        """Get the current weather for a location."""
+        return f"Sunny in {location}"
+
+    def get_system_time(location: str) -> str:
+        """Get the current time for a location."""
+        return f"12:00 in {location}"
+
+    agent.register_tool(get_current_weather)
+    agent.register_tool(get_system_time)
+    return agent
+
+
+def timed_run(agent, prompt):
+    start = time.perf_counter()
+    try:
+        agent.run([{"role": "user", "content": prompt}])
+        return time.perf_counter() - start, None
+    except Exception as e:
+        return time.perf_counter() - start, type(e).__name__
+
+
+async def atimed_run(agent, prompt):
+    start = time.perf_counter()
+    try:
+        await agent.arun([{"role": "user", "content": prompt}])
+        return time.perf_counter() - start, None
+    except Exception as e:
+        return time.perf_counter() - start, type(e).__name__
+
+
+async def run_async(agent, prompts, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(prompt):
+        async with semaphore:
+            return await atimed_run(agent, prompt)
+
+    try:
+        return await asyncio.gather(*(limited(prompt) for prompt in prompts))
+    finally:
+        await aclose_shared_transports()
+
+
+def main():
+    defaults = StandinConfig()
+    parser = argparse.ArgumentParser(description="Stress-test the ollama_native agents.")
+    parser.add_argument("--host", default="http://127.0.0.1:11434")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--agent", choices=["chat", "structured", "tools"], default="chat")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--serve", action="store_true", help="Start the stand-in server in this process.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Use arun() on one event loop.")
+    parser.add_argument("--latency", default=defaults.latency)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--disconnect-rate", type=float, default=defaults.disconnect_rate)
+    parser.add_argument("--max-concurrency", type=int, default=defaults.max_concurrency)
+    parser.add_argument("--max-queue", type=int, default=defaults.max_queue)
+    args = parser.parse_args()
+
+    server = None
+    if args.serve:
+        config = StandinConfig(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                               error_rate=args.error_rate, disconnect_rate=args.disconnect_rate,
+                               max_concurrency=args.max_concurrency, max_queue=args.max_queue)
+        server = serve("127.0.0.1", 0, config)
+        args.host = f"http://127.0.0.1:{server.server_address[1]}"
+
+    prompts = [f"What is the weather in city number {i}?" for i in range(args.requests)]
+    start = time.perf_counter()
+    if args.use_async:
+        results = asyncio.run(run_async(make_agent(args.agent, args.host, args.model), prompts, args.concurrency))
+    else:
+        # One agent per worker thread, as the tutorials create them; they share the host's connection pool
+        agents = [make_agent(args.agent, args.host, args.model) for _ in range(args.concurrency)]
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(lambda i: timed_run(agents[i % len(agents)], prompts[i]), range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, error in results if error is None)
+    errors = Counter(error for _, error in results if error is not None)
+    mode = "async" if args.use_async else "threads"
+    print(colored(f"Load test: {args.agent} agent ({mode}), {args.requests} requests, concurrency {args.concurrency}", "magenta"))
+    print(f"  throughput: {len(results) / elapsed:.1f} requests/s ({elapsed:.2f}s)")
+    if latencies:
+        quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+        print(f"  latency:    p50 {quantiles[49]:.3f}s  p95 {quantiles[94]:.3f}s  p99 {quantiles[98]:.3f}s  "
+              f"max {latencies[-1]:.3f}s")
+    print(f"  ok:         {len(latencies)}, errors: {dict(errors) or 0}")
+    if server is not None:
+        print(f"  server:     {server.stats}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from termcolor import colored
+
+# Ollama-compatible stand-in server for load testing.
+#
+# Answers /api/chat (streaming and not, `format` "json" or a JSON schema, `tools`
+# -> `tool_calls`) and the OpenAI-compatible /v1/chat/completions with synthetic
+# responses, so clients can be stress-tested without a GPU. Timing follows the
+# configured distributions: a request waits its time-to-first-token (plus the
+# prompt at --prompt-tokens-per-second), then streams its tokens at
+# --tokens-per-second. Errors and dropped streams are injected at the given rates,
+# and at most --max-concurrency requests are served at once; up to --max-queue more
+# wait for a slot and the rest get 503 "server busy", like Ollama with
+# OLLAMA_NUM_PARALLEL / OLLAMA_MAX_QUEUE.
+#
+#   python server.py --port 11434 --latency lognormal:-1.5,0.5 --tokens-per-second 40
+#   python server.py --error-rate 0.05 --disconnect-rate 0.02 --max-concurrency 4
+#
+# GET /standin/stats returns request counters.
+
+_WORD = re.compile(r"\S+\s*")
+_FILLER = ("The stand-in server answers every request with synthetic text so that clients can be measured "
+           "without a model. ").split(" ")
+# Type names BaseLLMAgent.custom_tool writes into tool definitions
+_PYTHON_TYPES = {"str": "string", "int": "integer", "float": "number", "bool": "boolean", "list": "array", "dict": "object"}
+
+
+@dataclass
+class StandinConfig:
+    latency: str = "const:0.05"
+    tokens_per_second: float = 50.0
+    prompt_tokens_per_second: float = 0.0
+    response_tokens: str = "uniform:20,80"
+    error_rate: float = 0.0
+    error_status: int = 500
+    disconnect_rate: float = 0.0
+    tool_call_rate: float = 1.0
+    max_concurrency: int = 4
+    max_queue: int = 64
+    seed: Optional[int] = None
+
+
+def sample(spec: str, rng: random.Random) -> float:
+    """Draw from "const:x", "uniform:a,b", "normal:mu,sigma", "lognormal:mu,sigma" or "exp:mean" (never negative)."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",")] if args else []
+    if kind == "const":
+        value = values[0]
+    elif kind == "uniform":
+        value = rng.uniform(*values)
+    elif kind == "normal":
+        value = rng.gauss(*values)
+    elif kind == "lognormal":
+        value = rng.lognormvariate(*values)
+    elif kind == "exp":
+        value = rng.expovariate(1 / values[0])
+    else:
+        raise ValueError(f"Unknown distribution: {spec}")
+    return max(0.0, value)
+
+
+def estimate_tokens(messages) -> int:
+    return sum(len(_WORD.findall(str(m.get("content") or ""))) for m in messages)
+
+
+def sample_from_schema(schema: dict, rng: random.Random, defs=None, name: str = "value"):
+    """A value that validates against a JSON schema (the subset pydantic emits)."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return sample_from_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], rng, defs, name)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return sample_from_schema(options[0], rng, defs, name)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if "default" in schema:
+        return schema["default"]
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    kind = _PYTHON_TYPES.get(kind, kind)
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+    if kind == "object":
+        return {key: sample_from_schema(sub, rng, defs, key) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample_from_schema(schema.get("items", {}), rng, defs, name) for _ in range(schema.get("minItems", 1))]
+    if kind == "integer":
+        return rng.randint(schema.get("minimum", 0), schema.get("maximum", 100))
+    if kind == "number":
+        return round(rng.uniform(schema.get("minimum", 0), schema.get("maximum", 100)), 2)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return f"standin {name}"
+
+
+def pick_tool(tools, messages):
+    # The tool whose name shares the most words with the last user message
+    text = next((str(m.get("content") or "") for m in reversed(messages) if m.get("role") == "user"), "").lower()
+    words = set(re.findall(r"[a-z]+", text))
+    return max(tools, key=lambda tool: len(words & set(tool["function"]["name"].lower().split("_"))))
+
+
+class Completion:
+    """What one request answers: text content or tool calls, plus token counts."""
+
+    def __init__(self, body, config, rng, json_format=None):
+        messages = body.get("messages") or []
+        tools = body.get("tools") or []
+        self.prompt_tokens = estimate_tokens(messages)
+        self.tool_calls = []
+        answered_tool = bool(messages) and messages[-1].get("role") == "tool"
+        if tools and not answered_tool and rng.random() < config.tool_call_rate:
+            tool = pick_tool(tools, messages)["function"]
+            self.tool_calls = [{"function": {"name": tool["name"], "arguments": sample_from_schema(tool.get("parameters", {}), rng)}}]
+            self.content = ""
+        elif json_format == "json":
+            self.content = json.dumps({"response": self._text(config, rng)})
+        elif isinstance(json_format, dict):
+            self.content = json.dumps(sample_from_schema(json_format, rng))
+        elif answered_tool:
+            self.content = f"Based on the tool result: {messages[-1].get('content')}"
+        else:
+            self.content = self._text(config, rng)
+        self.pieces = _WORD.findall(self.content) or [self.content]
+        self.completion_tokens = len(self.pieces)
+
+    @staticmethod
+    def _text(config, rng):
+        count = max(1, int(sample(config.response_tokens, rng)))
+        return " ".join(_FILLER[i % len(_FILLER)] for i in range(count)).strip()
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops connection bursts from async clients
+    request_queue_size = 1024
+
+    def __init__(self, address, config: StandinConfig):
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self._rng_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(config.max_concurrency)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.stats = {"requests": 0, "completed": 0, "errors_injected": 0, "disconnects_injected": 0,
+                      "rejected_busy": 0, "in_flight": 0, "max_in_flight": 0, "max_waiting": 0}
+
+    def random(self) -> random.Random:
+        # A per-request generator seeded from the shared one keeps --seed runs reproducible per request order
+        with self._rng_lock:
+            return random.Random(self.rng.random())
+
+    def count(self, key, delta=1):
+        with self._lock:
+            self.stats[key] += delta
+            if key == "in_flight":
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def acquire_slot(self) -> bool:
+        """Wait for a free slot; False when the queue is full."""
+        if self.slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self.waiting >= self.config.max_queue:
+                self.stats["rejected_busy"] += 1
+                return False
+            self.waiting += 1
+            self.stats["max_waiting"] = max(self.stats["max_waiting"], self.waiting)
+        self.slots.acquire()
+        with self._lock:
+            self.waiting -= 1
+        return True
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StandinServer
+
+    def log_message(self, format, *args):
+        pass
+
+    # Responses
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # Routing
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self.send_json(200, {"version": "0.0.0-standin"})
+        elif self.path == "/api/tags":
+            self.send_json(200, {"models": []})
+        elif self.path == "/standin/stats":
+            with self.server._lock:
+                self.send_json(200, dict(self.server.stats, waiting=self.server.waiting))
+        else:
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except json.JSONDecodeError as e:
+            self.send_json(400, {"error": f"invalid JSON body: {e}"})
+            return
+        if self.path not in ("/api/chat", "/v1/chat/completions"):
+            self.send_json(404, {"error": f"unknown path {self.path}"})
+            return
+
+        server = self.server
+        server.count("requests")
+        if not server.acquire_slot():
+            self.send_json(503, {"error": "server busy, please try again. maximum pending requests exceeded"})
+            return
+        server.count("in_flight")
+        self.dropped = False
+        try:
+            rng = server.random()
+            if rng.random() < server.config.error_rate:
+                server.count("errors_injected")
+                self.send_json(server.config.error_status, {"error": "stand-in injected error"})
+                return
+            if self.path == "/api/chat":
+                self.ollama_chat(body, rng)
+            else:
+                self.openai_chat(body, rng)
+            if not self.dropped:
+                server.count("completed")
+        finally:
+            server.count("in_flight", -1)
+            server.slots.release()
+
+    # Timing
+
+    def timed_pieces(self, completion, rng, stream):
+        """Sleep through the request's timing, yielding each content piece when it is due."""
+        config = self.server.config
+        wait = sample(config.latency, rng)
+        if config.prompt_tokens_per_second:
+            wait += completion.prompt_tokens / config.prompt_tokens_per_second
+        self.prompt_eval_seconds = wait
+        time.sleep(wait)
+        per_token = 1 / config.tokens_per_second if config.tokens_per_second else 0.0
+        disconnect_at = rng.randrange(len(completion.pieces)) if stream and rng.random() < config.disconnect_rate else None
+        for index, piece in enumerate(completion.pieces):
+            if index == disconnect_at:
+                self.server.count("disconnects_injected")
+                self.dropped = True
+                raise ConnectionAbortedError
+            if index and per_token:
+                time.sleep(per_token)
+            yield piece
+        if not stream and per_token:
+            time.sleep(per_token)
+
+    # /api/chat
+
+    def ollama_chat(self, body, rng):
+        completion = Completion(body, self.server.config, rng, json_format=body.get("format"))
+        model = body.get("model", "standin")
+        stream = body.get("stream", True)
+        start = time.perf_counter()
+        if not stream:
+            for _ in self.timed_pieces(completion, rng, stream=False):
+                pass
+            self.send_json(200, self.ollama_message(model, completion, completion.content, completion.tool_calls,
+                                                    done=True, start=start))
+            return
+
+        self.start_stream("application/x-ndjson")
+        try:
+            if completion.tool_calls:
+                # Ollama sends tool calls in one message ahead of the final chunk
+                for _ in self.timed_pieces(completion, rng, stream=True):
+                    pass
+                self.write_chunk(self.ndjson(self.ollama_message(model, completion, "", completion.tool_calls)))
+            else:
+                for piece in self.timed_pieces(completion, rng, stream=True):
+                    self.write_chunk(self.ndjson(self.ollama_message(model, completion, piece)))
+            self.write_chunk(self.ndjson(self.ollama_message(model, completion, "", done=True, start=start)))
+            self.end_stream()
+        except ConnectionAbortedError:
+            self.close_connection = True
+
+    def ollama_message(self, model, completion, content, tool_calls=None, done=False, start=None):
+        message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        payload = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "message": message, "done": done}
+        if done:
+            total = time.perf_counter() - start
+            prompt_seconds = self.prompt_eval_seconds
+            payload.update({
+                "done_reason": "stop",
+                "total_duration": int(total * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": completion.prompt_tokens,
+                "prompt_eval_duration": int(prompt_seconds * 1e9),
+                "eval_count": completion.completion_tokens,
+                "eval_duration": int(max(0.0, total - prompt_seconds) * 1e9),
+            })
+        return payload
+
+    @staticmethod
+    def ndjson(payload) -> bytes:
+        return json.dumps(payload).encode("utf-8") + b"\n"
+
+    # /v1/chat/completions
+
+    def openai_chat(self, body, rng):
+        response_format = body.get("response_format") or {}
+        json_format = None
+        if response_format.get("type") == "json_object":
+            json_format = "json"
+        elif response_format.get("type") == "json_schema":
+            json_format = response_format.get("json_schema", {}).get("schema", {})
+        completion = Completion(body, self.server.config, rng, json_format=json_format)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = body.get("model", "standin")
+        tool_calls = [
+            {"id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+             "function": {"name": call["function"]["name"], "arguments": json.dumps(call["function"]["arguments"])}}
+            for call in completion.tool_calls
+        ]
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        usage = {"prompt_tokens": completion.prompt_tokens, "completion_tokens": completion.completion_tokens,
+                 "total_tokens": completion.prompt_tokens + completion.completion_tokens}
+        base = {"id": completion_id, "created": int(time.time()), "model": model}
+
+        if not body.get("stream"):
+            for _ in self.timed_pieces(completion, rng, stream=False):
+                pass
+            message = {"role": "assistant", "content": completion.content or None}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            self.send_json(200, {**base, "object": "chat.completion", "usage": usage,
+                                 "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}]})
+            return
+
+        def event(delta, finish=None):
+            payload = {**base, "object": "chat.completion.chunk",
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            return b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n"
+
+        self.start_stream("text/event-stream")
+        try:
+            self.write_chunk(event({"role": "assistant", "content": ""}))
+            if tool_calls:
+                for _ in self.timed_pieces(completion, rng, stream=True):
+                    pass
+                self.write_chunk(event({"tool_calls": [dict(call, index=i) for i, call in enumerate(tool_calls)]}))
+            else:
+                for piece in self.timed_pieces(completion, rng, stream=True):
+                    self.write_chunk(event({"content": piece}))
+            self.write_chunk(event({}, finish_reason))
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.end_stream()
+        except ConnectionAbortedError:
+            self.close_connection = True
+
+
+def serve(host="127.0.0.1", port=11434, config=None):
+    """Start the server on a background thread; returns it (call shutdown() to stop)."""
+    server = StandinServer((host, port), config or StandinConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    defaults = StandinConfig()
+    parser = argparse.ArgumentParser(description="Ollama-compatible stand-in server for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", default=defaults.latency, help="Time-to-first-token distribution in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second, help="0 streams instantly.")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=defaults.prompt_tokens_per_second,
+                        help="Adds prompt evaluation to the first-token wait (0 disables).")
+    parser.add_argument("--response-tokens", default=defaults.response_tokens, help="Length distribution of text answers.")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-status", type=int, default=defaults.error_status)
+    parser.add_argument("--disconnect-rate", type=float, default=defaults.disconnect_rate,
+                        help="Share of streams dropped part way through.")
+    parser.add_argument("--tool-call-rate", type=float, default=defaults.tool_call_rate,
+                        help="Share of requests with tools that answer with a tool call.")
+    parser.add_argument("--max-concurrency", type=int, default=defaults.max_concurrency)
+    parser.add_argument("--max-queue", type=int, default=defaults.max_queue)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = StandinConfig(**{key: value for key, value in vars(args).items() if key not in ("host", "port")})
+    sample(config.latency, random.Random())  # fail fast on a bad distribution
+    sample(config.response_tokens, random.Random())
+    server = StandinServer((args.host, args.port), config)
+    print(colored(f"Ollama stand-in listening on http://{args.host}:{args.port} ({config})", "green"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -58,9 +58,18 @@ if __name__ == "__main__":
     
     # Test the WeatherCallingAgent
     response = weather_agent.run(
-        messages=[{"role": "user", "content": "What's the weather like in London?"}]
+        messages=[{"role": "user", "content": "What's the weather like in London and in Paris?"}]
     )
     print(response)
+    # Tool calls run concurrently; latency per tool across the run
+    print(weather_agent.tool_latency_report())
+
+    # Loop mode: tool results go back to the model until it answers in its own words
+    answer = weather_agent.run_loop(
+        messages=[{"role": "user", "content": "Is it warmer in London or in Paris right now?"}],
+        max_steps=3,
+    )
+    print(answer)
 
     # Enable debug mode for the EvaluatorAgent
     evaluator_agent = EvaluatorAgent(debug=True)
@@ -72,3 +81,12 @@ if __name__ == "__main__":
         generated_steps="Implement a function that uses the sorted() function with custom key parameters."
     )
     print(evaluation)
+
+    # Stream the evaluation: the score is available (and validated) before the feedback is written
+    shown = set()
+    for update in evaluator_agent.run_stream([{"role": "user", "content": "Evaluate: sort a list with sorted()."}]):
+        for name in update.fields.keys() - shown:
+            print(f"{name}: {update.fields[name]}")
+            shown.add(name)
+        if update.result is not None:
+            print(update.result)
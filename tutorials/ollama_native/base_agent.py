@@ -1,18 +1,326 @@
 from abc import ABC, abstractmethod
-from ollama import Client
+from ollama import AsyncClient, Client
+import asyncio
+import functools
+import httpx
+import importlib
 import json
 import inspect
-from pydantic import BaseModel
+import os
+import threading
+import time
+import warnings
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Annotated, Optional
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from termcolor import colored
 
+# Connection pool limits of the transports shared by all agents that talk to the same host
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("OLLAMA_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "20")),
+    keepalive_expiry=float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "30")),
+)
+
+_transports_lock = threading.Lock()
+# host -> transport; httpx sync transports are thread-safe
+_sync_transports = {}
+# event loop -> {host: (transport, slots)}; async connections belong to the loop that opened them
+_async_transports = weakref.WeakKeyDictionary()
+
+def set_connection_limits(max_connections: int = None, max_keepalive_connections: int = None, keepalive_expiry: float = None):
+    """Change the pool limits of transports created from now on."""
+    global HTTP_LIMITS
+    HTTP_LIMITS = httpx.Limits(
+        max_connections=max_connections if max_connections is not None else HTTP_LIMITS.max_connections,
+        max_keepalive_connections=max_keepalive_connections if max_keepalive_connections is not None else HTTP_LIMITS.max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry if keepalive_expiry is not None else HTTP_LIMITS.keepalive_expiry,
+    )
+
+def shared_transport(host: str) -> httpx.HTTPTransport:
+    """The process-wide keep-alive connection pool for `host`."""
+    with _transports_lock:
+        if host not in _sync_transports:
+            _sync_transports[host] = httpx.HTTPTransport(limits=HTTP_LIMITS)
+        return _sync_transports[host]
+
+def shared_async_transport(host: str):
+    """(transport, slots): the keep-alive connection pool for `host` on the running event loop.
+
+    `slots` is a semaphore sized to the pool. Requests beyond the pool size wait on it
+    instead of in httpx's own queue, which gets slow with hundreds of waiters.
+    """
+    loop = asyncio.get_running_loop()
+    with _transports_lock:
+        transports = _async_transports.setdefault(loop, {})
+        if host not in transports:
+            transports[host] = (
+                httpx.AsyncHTTPTransport(limits=HTTP_LIMITS),
+                asyncio.Semaphore(HTTP_LIMITS.max_connections or 100),
+            )
+        return transports[host]
+
+async def aclose_shared_transports():
+    """Close the pooled connections of the running event loop (call before the loop ends)."""
+    with _transports_lock:
+        transports = _async_transports.pop(asyncio.get_running_loop(), {})
+    for transport, _ in transports.values():
+        await transport.aclose()
+
+class StreamValidationError(ValueError):
+    """A streamed structured response that can no longer match its schema."""
+
+class IncrementalJSONObject:
+    """Parses a streamed JSON object and reports each top-level member once it is complete."""
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> dict:
+        """Add a chunk of the response; returns the members it completed."""
+        start = len(self.text)
+        self.text += chunk
+        completed = {}
+        for position in range(start, len(self.text)):
+            char = self.text[position]
+            if self.closed or self._depth == 0:
+                if not char.isspace() and (self.closed or char != "{"):
+                    raise StreamValidationError(f"Expected a JSON object, got {self.text[:position + 1][-40:]!r}")
+                if char == "{":
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+            # A top-level member ends at the comma after it or at the closing brace
+            if not self._in_string and ((char == "," and self._depth == 1) or self._depth == 0):
+                completed.update(self._members(self.text[:position]))
+                self.closed = self._depth == 0
+        return completed
+
+    def _members(self, prefix: str) -> dict:
+        try:
+            members = json.loads(prefix.rstrip().rstrip(",") + "}")
+        except json.JSONDecodeError as e:
+            raise StreamValidationError(f"Response is not valid JSON: {e}") from None
+        new = {key: value for key, value in members.items() if key not in self.fields}
+        self.fields.update(new)
+        return new
+
+@dataclass
+class StreamUpdate:
+    """One streamed token of a structured response and the fields validated so far."""
+    token: str
+    fields: dict = field(default_factory=dict)
+    result: Optional[BaseModel] = None
+
+@dataclass
+class ToolResult:
+    """The outcome of one tool call; `index` is its position in the model's tool_calls."""
+    index: int
+    name: str
+    arguments: dict
+    output: object = None
+    error: Optional[str] = None
+    timed_out: bool = False
+    latency_seconds: float = 0.0
+
+class ToolResults(list):
+    """ToolResult objects in call order.
+
+    execute_tool_calls used to return {function name: output}; the dict methods and
+    lookups by name are kept for existing callers but are deprecated, because a
+    tool called twice in one response only shows its last output there.
+    """
+
+    def _by_name(self) -> dict:
+        warnings.warn("Reading tool results by name is deprecated; iterate the ToolResult objects instead",
+                      DeprecationWarning, stacklevel=3)
+        return {result.name: result.output for result in self}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._by_name()[key]
+        return super().__getitem__(key)
+
+    def keys(self):
+        return self._by_name().keys()
+
+    def values(self):
+        return self._by_name().values()
+
+    def items(self):
+        return self._by_name().items()
+
+def _call_by_reference(module_name: str, qualname: str, arguments: dict):
+    # Runs in a tool worker process: the tool is looked up by name there instead of being
+    # pickled, so a function whose module attribute is its register_tool wrapper works too
+    target = importlib.import_module(module_name)
+    for part in qualname.split("."):
+        target = getattr(target, part)
+    return target(**arguments)
+
+# Workers for tool calls, shared by every ToolCallingAgent in the process
+TOOL_THREADS = int(os.getenv("OLLAMA_TOOL_THREADS", "16"))
+TOOL_PROCESSES = int(os.getenv("OLLAMA_TOOL_PROCESSES", str(os.cpu_count() or 1)))
+_tool_pools = {}
+_tool_pools_lock = threading.Lock()
+
+def tool_thread_pool() -> ThreadPoolExecutor:
+    with _tool_pools_lock:
+        if "threads" not in _tool_pools:
+            _tool_pools["threads"] = ThreadPoolExecutor(max_workers=TOOL_THREADS, thread_name_prefix="tool")
+        return _tool_pools["threads"]
+
+def tool_process_pool() -> ProcessPoolExecutor:
+    with _tool_pools_lock:
+        if "processes" not in _tool_pools:
+            _tool_pools["processes"] = ProcessPoolExecutor(max_workers=TOOL_PROCESSES)
+        return _tool_pools["processes"]
+
+# Tool loop history budget (run_loop). Ollama does not expose its tokenizer, so
+# tokens are estimated from characters.
+CHARS_PER_TOKEN = 4
+HISTORY_TOKEN_BUDGET = int(os.getenv("OLLAMA_HISTORY_TOKENS", "3000"))
+# Trimming goes down to this share of the budget, so the following steps only
+# append and the prompt prefix the server has cached stays valid for a while
+HISTORY_LOW_WATER = 0.6
+SUMMARY_HEADER = "Summary of earlier steps (their messages were dropped to save context):"
+SUMMARY_LINE_CHARS = 160
+# Shares of the budget: the summary of dropped turns, and any single tool result
+SUMMARY_SHARE = 0.15
+TOOL_RESULT_SHARE = 0.25
+
+def estimate_tokens(value) -> int:
+    """Approximate token count of a message, a list of messages or tool definitions."""
+    if isinstance(value, str):
+        return len(value) // CHARS_PER_TOKEN + 1
+    return len(json.dumps(value, default=str)) // CHARS_PER_TOKEN + 1
+
+def _clip(text, limit: int = SUMMARY_LINE_CHARS) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+# Compiled specs: what the agents derive from response models and tool functions,
+# built once and reused on every call. The cached dicts are shared; don't mutate them.
+_specs_lock = threading.Lock()
+# response model -> ResponseSpec
+_response_specs = weakref.WeakKeyDictionary()
+# agent class -> ResponseSpec of its get_pydantic_model()
+_agent_response_specs = weakref.WeakKeyDictionary()
+# tool function -> ToolSpec
+_tool_specs = weakref.WeakKeyDictionary()
+
+@dataclass(frozen=True)
+class ResponseSpec:
+    """A response model with its JSON schema, validator and per-field validators."""
+    model: type[BaseModel]
+    json_schema: dict
+    validator: TypeAdapter
+    field_validators: dict
+    forbid_extra: bool
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """A tool function with its tool definition."""
+    name: str
+    func: object
+    definition: dict
+    is_coroutine: bool
+
+def field_validators(model: type[BaseModel]) -> dict:
+    """Validators for the fields of `model` one at a time, constraints included."""
+    return compile_response_spec(model).field_validators
+
+def compile_response_spec(model: type[BaseModel]) -> ResponseSpec:
+    spec = _response_specs.get(model)
+    if spec is None:
+        spec = ResponseSpec(
+            model=model,
+            json_schema=model.model_json_schema(),
+            validator=TypeAdapter(model),
+            field_validators={
+                name: TypeAdapter(Annotated[info.annotation, info])
+                for name, info in model.model_fields.items()
+            },
+            forbid_extra=model.model_config.get("extra") == "forbid",
+        )
+        with _specs_lock:
+            spec = _response_specs.setdefault(model, spec)
+    return spec
+
+def compile_tool_spec(func) -> ToolSpec:
+    spec = _tool_specs.get(func)
+    if spec is None:
+        # Extract function signature and docstring
+        sig = inspect.signature(func)
+        docstring = func.__doc__.strip() if func.__doc__ else "No description provided."
+
+        # Extract parameter details
+        parameters = {}
+        for param_name, param in sig.parameters.items():
+            param_type = param.annotation.__name__ if param.annotation != inspect.Parameter.empty else "unknown"
+            parameters[param_name] = {
+                'type': param_type,
+                'description': f'The {param_name} parameter',
+            }
+
+        # Create the tool definition
+        definition = {
+            'type': 'function',
+            'function': {
+                'name': func.__name__,
+                'description': docstring,
+                'parameters': {
+                    'type': 'object',
+                    'properties': parameters,
+                    'required': list(sig.parameters.keys()),
+                },
+            },
+        }
+        spec = ToolSpec(func.__name__, func, definition, inspect.iscoroutinefunction(inspect.unwrap(func)))
+        with _specs_lock:
+            spec = _tool_specs.setdefault(func, spec)
+    return spec
+
 class BaseLLMAgent(ABC):
     def __init__(self, system_prompt: str, model_name: str, api_url: str = "http://dual-ai:11434", debug: bool = False):
         """Initialize the BaseLLMAgent with common attributes."""
         self.system_prompt = system_prompt
         self.model_name = model_name
-        self.client = Client(host=api_url)
+        self.api_url = api_url
+        # Agents for the same host share one connection pool instead of opening their own
+        self.client = Client(host=api_url, transport=shared_transport(api_url))
+        self._async_clients = weakref.WeakKeyDictionary()
         self.debug = debug
 
+    def _async_client(self):
+        """(AsyncClient, slots) on the shared transport of the running event loop."""
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None:
+            transport, slots = shared_async_transport(self.api_url)
+            entry = (AsyncClient(host=self.api_url, transport=transport), slots)
+            self._async_clients[loop] = entry
+        return entry
+
     def debug_message(self, message: str, color: str = "cyan"):
         """Print debug messages if debug mode is enabled."""
         if self.debug:
@@ -34,23 +342,88 @@ class BaseLLMAgent(ABC):
             print(colored(error_message, "red"))
             raise
 
+    async def agenerate_response(self, messages: list[dict], **kwargs) -> dict:
+        """Async generate_response; many calls can share one event loop."""
+        try:
+            self.debug_message(f"Sending messages: {messages}")
+            client, slots = self._async_client()
+            async with slots:
+                response = await client.chat(
+                    messages=messages,
+                    model=self.model_name,
+                    **kwargs
+                )
+            self.debug_message(f"Received response: {response}")
+            return response.message
+        except Exception as e:
+            error_message = f"Error generating response: {e}"
+            print(colored(error_message, "red"))
+            raise
+
+    def stream_response(self, messages: list[dict], **kwargs):
+        """Yield response chunks as they arrive. Closing the generator cancels the generation."""
+        self.debug_message(f"Streaming messages: {messages}")
+        try:
+            stream = self.client.chat(messages=messages, model=self.model_name, stream=True, **kwargs)
+            try:
+                yield from stream
+            finally:
+                stream.close()
+        except Exception as e:
+            print(colored(f"Error generating response: {e}", "red"))
+            raise
+
+    async def astream_response(self, messages: list[dict], **kwargs):
+        """Async stream_response."""
+        self.debug_message(f"Streaming messages: {messages}")
+        client, slots = self._async_client()
+        try:
+            async with slots:
+                stream = await client.chat(messages=messages, model=self.model_name, stream=True, **kwargs)
+                try:
+                    async for chunk in stream:
+                        yield chunk
+                finally:
+                    await stream.aclose()
+        except Exception as e:
+            print(colored(f"Error generating response: {e}", "red"))
+            raise
+
     @abstractmethod
     def run(self, messages: list[dict]):
         """Run the agent with the provided messages."""
         pass
 
+    async def arun(self, messages: list[dict]):
+        """Async run. Agents without their own arun run `run` on a worker thread."""
+        return await asyncio.to_thread(self.run, messages)
+
 class StructuredResponseAgent(BaseLLMAgent):
     @abstractmethod
     def get_pydantic_model(self) -> type[BaseModel]:
         """Return the Pydantic model for structured responses."""
         pass
 
+    def response_spec(self) -> ResponseSpec:
+        """The compiled spec of get_pydantic_model(), built once per agent class.
+
+        get_pydantic_model() is only called the first time, so it may define its model
+        inline. Agents whose model differs between instances override this method and
+        return compile_response_spec(their model).
+        """
+        agent_class = type(self)
+        spec = _agent_response_specs.get(agent_class)
+        if spec is None:
+            spec = compile_response_spec(self.get_pydantic_model())
+            with _specs_lock:
+                spec = _agent_response_specs.setdefault(agent_class, spec)
+        return spec
+
     def parse_response(self, response_text: str) -> BaseModel:
         """Parse the LLM response into a Pydantic model instance."""
         try:
             self.debug_message(f"Parsing response text: {response_text}")
-            pydantic_model = self.get_pydantic_model()
-            return pydantic_model.model_validate_json(response_text)
+            return self.response_spec().validator.validate_json(response_text)
         except json.JSONDecodeError as e:
             error_message = f"Failed to parse JSON response: {e}"
             print(colored(error_message, "red"))
@@ -66,79 +439,335 @@ class StructuredResponseAgent(BaseLLMAgent):
             {"role": "system", "content": self.system_prompt},
             *messages
         ]
-        pydantic_model = self.get_pydantic_model()
-        response_text = self.generate_response(full_messages, format=pydantic_model.model_json_schema()).content
+        response_text = self.generate_response(full_messages, format=self.response_spec().json_schema).content
         return self.parse_response(response_text)
 
+    async def arun(self, messages: list[dict]) -> BaseModel:
+        """Async run."""
+        full_messages = [
+            {"role": "system", "content": self.system_prompt},
+            *messages
+        ]
+        response = await self.agenerate_response(full_messages, format=self.response_spec().json_schema)
+        return self.parse_response(response.content)
+
+    def check_fields(self, spec: ResponseSpec, fields: dict):
+        """Validate newly completed fields; raise StreamValidationError on the first that cannot match."""
+        validators = spec.field_validators
+        for name, value in fields.items():
+            if name not in validators:
+                if spec.forbid_extra:
+                    raise StreamValidationError(f"Unexpected field '{name}'")
+                continue
+            try:
+                validators[name].validate_python(value)
+            except ValidationError as e:
+                raise StreamValidationError(f"Field '{name}' does not match the schema: {e}") from None
+
+    def _stream_update(self, spec, parser, token) -> StreamUpdate:
+        completed = parser.feed(token)
+        if completed:
+            self.check_fields(spec, completed)
+            self.debug_message(f"Validated fields: {list(completed)}")
+        return StreamUpdate(token=token, fields=dict(parser.fields))
+
+    def run_stream(self, messages: list[dict]):
+        """Yield a StreamUpdate per token; the last update carries the validated result.
+
+        Fields are validated as soon as they are complete, and the generation is
+        cancelled as soon as the response can no longer match the schema.
+        """
+        full_messages = [
+            {"role": "system", "content": self.system_prompt},
+            *messages
+        ]
+        spec = self.response_spec()
+        parser = IncrementalJSONObject()
+        stream = self.stream_response(full_messages, format=spec.json_schema)
+        try:
+            for chunk in stream:
+                yield self._stream_update(spec, parser, chunk.message.content or "")
+        except StreamValidationError as e:
+            print(colored(f"Aborted structured response: {e}", "red"))
+            raise
+        finally:
+            stream.close()
+        yield StreamUpdate(token="", fields=dict(parser.fields), result=self.parse_response(parser.text))
+
+    async def arun_stream(self, messages: list[dict]):
+        """Async run_stream."""
+        full_messages = [
+            {"role": "system", "content": self.system_prompt},
+            *messages
+        ]
+        spec = self.response_spec()
+        parser = IncrementalJSONObject()
+        stream = self.astream_response(full_messages, format=spec.json_schema)
+        try:
+            async for chunk in stream:
+                yield self._stream_update(spec, parser, chunk.message.content or "")
+        except StreamValidationError as e:
+            print(colored(f"Aborted structured response: {e}", "red"))
+            raise
+        finally:
+            await stream.aclose()
+        yield StreamUpdate(token="", fields=dict(parser.fields), result=self.parse_response(parser.text))
+
 class ToolCallingAgent(BaseLLMAgent):
-    def __init__(self, system_prompt: str, model_name: str, api_url: str = "http://dual-ai:11434", debug: bool = False):
+    def __init__(self, system_prompt: str, model_name: str, api_url: str = "http://dual-ai:11434", debug: bool = False,
+                 tool_timeout: float = 30.0, max_steps: int = 5, history_token_budget: int = HISTORY_TOKEN_BUDGET):
         super().__init__(system_prompt, model_name, api_url, debug)
         self.tools = []
         self.tool_functions = {}
+        # Per-tool options from register_tool: {"timeout": seconds, "isolate": run in a process}
+        self.tool_options = {}
+        self.tool_timeout = tool_timeout
+        # run_loop: model calls per run, and the token budget of the history sent with each
+        self.max_steps = max_steps
+        self.history_token_budget = history_token_budget
+        self._tool_stats = {}
+        self._tool_stats_lock = threading.Lock()
 
     def custom_tool(self, func):
         """Decorator to define tool definitions for functions."""
+        spec = compile_tool_spec(func)
+
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
             return func(*args, **kwargs)
 
-        # Extract function signature and docstring
-        sig = inspect.signature(func)
-        docstring = func.__doc__.strip() if func.__doc__ else "No description provided."
-
-        # Extract parameter details
-        parameters = {}
-        for param_name, param in sig.parameters.items():
-            param_type = param.annotation.__name__ if param.annotation != inspect.Parameter.empty else "unknown"
-            parameters[param_name] = {
-                'type': param_type,
-                'description': f'The {param_name} parameter',
-            }
-
-        # Create the tool definition
-        tool_definition = {
-            'type': 'function',
-            'function': {
-                'name': func.__name__,
-                'description': docstring,
-                'parameters': {
-                    'type': 'object',
-                    'properties': parameters,
-                    'required': list(sig.parameters.keys()),
-                },
-            },
-        }
-
-        wrapper.tool_definition = tool_definition
+        wrapper.tool_definition = spec.definition
+        wrapper.tool_spec = spec
         return wrapper
 
-    def register_tool(self, func):
-        """Register a tool function with the agent."""
+    def register_tool(self, func, timeout: float = None, isolate: bool = False):
+        """Register a tool function with the agent.
+
+        `timeout` overrides the agent's tool_timeout for this tool. `isolate` runs it in a
+        worker process (for CPU-heavy tools): the function must be defined at the top level
+        of a module or class so the worker can import it, and its arguments must be picklable.
+        """
+        if isolate and ("<locals>" in func.__qualname__ or "<lambda>" in func.__qualname__):
+            raise ValueError(f"Tool '{func.__name__}' cannot be isolated: the worker process can only "
+                             "run functions defined at the top level of a module or class")
         wrapped_func = self.custom_tool(func)
         self.tools.append(wrapped_func.tool_definition)
         self.tool_functions[func.__name__] = wrapped_func
+        self.tool_options[func.__name__] = {"timeout": timeout, "isolate": isolate}
         return wrapped_func
 
-    def execute_tool_calls(self, tool_calls: list) -> dict:
-        """Execute the tool calls included in the LLM's response."""
-        results = {}
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            arguments = tool_call.function.arguments
-            tool_function = self.tool_functions.get(function_name)
-            if tool_function:
-                try:
-                    self.debug_message(f"Executing tool '{function_name}' with arguments: {arguments}")
-                    result = tool_function(**arguments)
-                    results[function_name] = result
-                except Exception as e:
-                    error_message = f"Error executing tool '{function_name}': {e}"
-                    print(colored(error_message, "red"))
-                    results[function_name] = str(e)
+    def execute_tool_calls(self, tool_calls: list) -> ToolResults:
+        """Execute the tool calls included in the LLM's response concurrently; results keep the call order.
+
+        Async code should await aexecute_tool_calls instead: called from inside a running
+        event loop, this blocks that loop until the tools are done.
+        """
+        coroutine = self.aexecute_tool_calls(tool_calls)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        # Inside an event loop (e.g. a notebook): run the calls on a loop of their own, on a
+        # thread of their own, so they never wait for a worker of the pool they use themselves
+        outcome = {}
+
+        def run_loop():
+            try:
+                outcome["results"] = asyncio.run(coroutine)
+            except BaseException as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=run_loop, name="tool-calls")
+        thread.start()
+        thread.join()
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["results"]
+
+    async def aexecute_tool_calls(self, tool_calls: list) -> ToolResults:
+        """Async execute_tool_calls: sync tools on the tool thread pool, async tools on the loop."""
+        return ToolResults(await asyncio.gather(*(
+            self._execute_tool_call(index, tool_call) for index, tool_call in enumerate(tool_calls)
+        )))
+
+    async def _execute_tool_call(self, index: int, tool_call) -> ToolResult:
+        function_name = tool_call.function.name
+        arguments = dict(tool_call.function.arguments or {})
+        result = ToolResult(index=index, name=function_name, arguments=arguments)
+        tool_function = self.tool_functions.get(function_name)
+        if tool_function is None:
+            warning_message = f"Tool '{function_name}' not found."
+            print(colored(warning_message, "yellow"))
+            result.output = result.error = "Tool not found."
+            return result
+
+        options = self.tool_options.get(function_name, {})
+        timeout = options.get("timeout") or self.tool_timeout
+        spec = tool_function.tool_spec
+        func = spec.func
+        self.debug_message(f"Executing tool '{function_name}' with arguments: {arguments}")
+        start = time.perf_counter()
+        try:
+            if spec.is_coroutine:
+                call = func(**arguments)
             else:
-                warning_message = f"Tool '{function_name}' not found."
-                print(colored(warning_message, "yellow"))
-                results[function_name] = "Tool not found."
-        return results
+                loop = asyncio.get_running_loop()
+                if options.get("isolate"):
+                    call = loop.run_in_executor(
+                        tool_process_pool(), _call_by_reference, func.__module__, func.__qualname__, arguments
+                    )
+                else:
+                    call = loop.run_in_executor(tool_thread_pool(), functools.partial(func, **arguments))
+            result.output = await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError:
+            # A thread or process cannot be stopped; its result is dropped when it finishes
+            result.timed_out = True
+            result.output = result.error = f"Timed out after {timeout}s"
+            print(colored(f"Tool '{function_name}' timed out after {timeout}s", "red"))
+        except Exception as e:
+            error_message = f"Error executing tool '{function_name}': {e}"
+            print(colored(error_message, "red"))
+            result.output = result.error = str(e)
+        result.latency_seconds = time.perf_counter() - start
+        self._record_tool_latency(result)
+        self.debug_message(f"Tool '{function_name}' #{index} finished in {result.latency_seconds:.3f}s")
+        return result
+
+    def _record_tool_latency(self, result: ToolResult):
+        with self._tool_stats_lock:
+            stats = self._tool_stats.setdefault(
+                result.name, {"calls": 0, "errors": 0, "timeouts": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            stats["calls"] += 1
+            stats["errors"] += result.error is not None
+            stats["timeouts"] += result.timed_out
+            stats["total_seconds"] += result.latency_seconds
+            stats["max_seconds"] = max(stats["max_seconds"], result.latency_seconds)
+
+    def tool_latency_report(self) -> dict:
+        """Per-tool call count, errors, timeouts and mean/max latency in seconds."""
+        with self._tool_stats_lock:
+            return {
+                name: {**stats, "mean_seconds": stats["total_seconds"] / stats["calls"]}
+                for name, stats in self._tool_stats.items()
+            }
+
+    def assistant_message(self, message) -> dict:
+        """The assistant turn as it goes back into the history; the same reply always gives the same dict."""
+        entry = {"role": "assistant", "content": message.content or ""}
+        if message.tool_calls:
+            entry["tool_calls"] = [
+                {"function": {"name": call.function.name, "arguments": dict(call.function.arguments or {})}}
+                for call in message.tool_calls
+            ]
+        return entry
+
+    def tool_messages(self, results: list[ToolResult]) -> list[dict]:
+        """One tool-role message per result, in call order; oversized results are cut."""
+        limit = int(self.history_token_budget * TOOL_RESULT_SHARE) * CHARS_PER_TOKEN
+        messages = []
+        for result in results:
+            content = f"Error: {result.error}" if result.error is not None else str(result.output)
+            if len(content) > limit:
+                content = content[:limit] + " [truncated]"
+            messages.append({"role": "tool", "tool_name": result.name, "content": content})
+        return messages
+
+    def fit_history(self, history: list[dict], pinned: int) -> list[dict]:
+        """Keep the history within history_token_budget.
+
+        The first `pinned` messages (system prompt and the caller's messages) are always
+        kept. When the budget is exceeded, the oldest assistant turns and their tool
+        results are dropped, down to HISTORY_LOW_WATER of the budget, and replaced by a
+        one-line-per-call summary after the pinned messages. The latest turn is never
+        dropped. A history within budget is returned as it is, so the prefix is unchanged.
+        """
+        budget = self.history_token_budget - estimate_tokens(self.tools)
+        sizes = [estimate_tokens(message) for message in history]
+        if sum(sizes) <= budget:
+            return history
+
+        head = history[:pinned]
+        rest = history[pinned:]
+        summary_lines = []
+        if rest and rest[0]["role"] == "user" and rest[0]["content"].startswith(SUMMARY_HEADER):
+            summary_lines = rest[0]["content"].split("\n")[1:]
+            rest = rest[1:]
+            sizes = sizes[:pinned] + sizes[pinned + 1:]
+
+        # An assistant message and the tool results that answer it go together
+        turns = []
+        for message, size in zip(rest, sizes[pinned:]):
+            if message["role"] == "assistant" or not turns:
+                turns.append(([], 0))
+            turn_messages, turn_size = turns[-1]
+            turns[-1] = (turn_messages + [message], turn_size + size)
+
+        target = budget * HISTORY_LOW_WATER
+        total = sum(sizes[:pinned]) + sum(size for _, size in turns) + estimate_tokens("\n".join(summary_lines))
+        dropped = 0
+        while len(turns) > 1 and total > target:
+            turn_messages, turn_size = turns.pop(0)
+            lines = self._summarize_turn(turn_messages)
+            summary_lines += lines
+            total += estimate_tokens("\n".join(lines)) - turn_size
+            dropped += len(turn_messages)
+        # Oldest summary lines go first when the summary outgrows its share
+        while len(summary_lines) > 1 and estimate_tokens("\n".join(summary_lines)) > budget * SUMMARY_SHARE:
+            summary_lines.pop(0)
+        self.debug_message(f"History over budget: dropped {dropped} messages, ~{total} tokens left", "yellow")
+
+        summary = [{"role": "user", "content": "\n".join([SUMMARY_HEADER, *summary_lines])}] if summary_lines else []
+        return head + summary + [message for turn_messages, _ in turns for message in turn_messages]
+
+    def _summarize_turn(self, turn_messages: list[dict]) -> list[str]:
+        lines = []
+        calls = iter(turn_messages[0].get("tool_calls") or []) if turn_messages[0]["role"] == "assistant" else iter(())
+        for message in turn_messages:
+            if message["role"] == "assistant" and message["content"]:
+                lines.append(f"- assistant: {_clip(message['content'])}")
+            elif message["role"] == "tool":
+                call = next(calls, None)
+                arguments = call["function"]["arguments"] if call else {}
+                lines.append(_clip(f"- {message.get('tool_name')}({arguments}) -> {message['content']}"))
+        return lines
+
+    def run_loop(self, messages: list[dict], max_steps: int = None) -> str:
+        """Call the model, run its tool calls and feed the results back as tool messages,
+        until it answers without calling a tool or max_steps model calls have been made.
+
+        At the step limit the model is asked once more, without tools, to answer from
+        what it has.
+        """
+        history = [{"role": "system", "content": self.system_prompt}, *messages]
+        pinned = len(history)
+        for step in range(max_steps or self.max_steps):
+            history = self.fit_history(history, pinned)
+            message = self.generate_response(history, tools=self.tools)
+            history.append(self.assistant_message(message))
+            if not message.tool_calls:
+                return message.content
+            self.debug_message(f"Step {step + 1}: tool calls {message.tool_calls}")
+            history += self.tool_messages(self.execute_tool_calls(message.tool_calls))
+
+        self.debug_message("Step limit reached; asking for a final answer", "yellow")
+        return self.generate_response(self.fit_history(history, pinned)).content
+
+    async def arun_loop(self, messages: list[dict], max_steps: int = None) -> str:
+        """Async run_loop."""
+        history = [{"role": "system", "content": self.system_prompt}, *messages]
+        pinned = len(history)
+        for step in range(max_steps or self.max_steps):
+            history = self.fit_history(history, pinned)
+            message = await self.agenerate_response(history, tools=self.tools)
+            history.append(self.assistant_message(message))
+            if not message.tool_calls:
+                return message.content
+            self.debug_message(f"Step {step + 1}: tool calls {message.tool_calls}")
+            history += self.tool_messages(await self.aexecute_tool_calls(message.tool_calls))
+
+        self.debug_message("Step limit reached; asking for a final answer", "yellow")
+        return (await self.agenerate_response(self.fit_history(history, pinned))).content
 
     def run(self, messages: list[dict]) -> str:
         """Run the agent by generating a response and executing any tool calls."""
@@ -150,8 +779,56 @@ class ToolCallingAgent(BaseLLMAgent):
 
         if message.tool_calls:
             self.debug_message(f"Tool calls found in response: {message.tool_calls}")
-            tool_results = self.execute_tool_calls(message.tool_calls)
-            for fn_name, result in tool_results.items():
-                message.content += f"\nTool Result ({fn_name}): {result}"
+            for result in self.execute_tool_calls(message.tool_calls):
+                message.content += f"\nTool Result ({result.name}): {result.output}"
+
+        return message.content
+
+    async def arun(self, messages: list[dict]) -> str:
+        """Async run."""
+        full_messages = [
+            {"role": "system", "content": self.system_prompt},
+            *messages
+        ]
+        message = await self.agenerate_response(full_messages, tools=self.tools)
+
+        if message.tool_calls:
+            self.debug_message(f"Tool calls found in response: {message.tool_calls}")
+            for result in await self.aexecute_tool_calls(message.tool_calls):
+                message.content += f"\nTool Result ({result.name}): {result.output}"
 
         return message.content
+
+    def run_stream(self, messages: list[dict]):
+        """Yield the response text as it arrives, then the tool results, as run() would return them."""
+        full_messages = [
+            {"role": "system", "content": self.system_prompt},
+            *messages
+        ]
+        tool_calls = []
+        for chunk in self.stream_response(full_messages, tools=self.tools):
+            tool_calls += chunk.message.tool_calls or []
+            if chunk.message.content:
+                yield chunk.message.content
+
+        if tool_calls:
+            self.debug_message(f"Tool calls found in response: {tool_calls}")
+            for result in self.execute_tool_calls(tool_calls):
+                yield f"\nTool Result ({result.name}): {result.output}"
+
+    async def arun_stream(self, messages: list[dict]):
+        """Async run_stream."""
+        full_messages = [
+            {"role": "system", "content": self.system_prompt},
+            *messages
+        ]
+        tool_calls = []
+        async for chunk in self.astream_response(full_messages, tools=self.tools):
+            tool_calls += chunk.message.tool_calls or []
+            if chunk.message.content:
+                yield chunk.message.content
+
+        if tool_calls:
+            self.debug_message(f"Tool calls found in response: {tool_calls}")
+            for result in await self.aexecute_tool_calls(tool_calls):
+                yield f"\nTool Result ({result.name}): {result.output}"
@@ -0,0 +1,86 @@
+import argparse
+import importlib.util
+import json
+import os
+import time
+
+from ollama import ChatResponse, Message
+from termcolor import colored
+
+from base_agent import StructuredResponseAgent
+from tool_decorator import custom_tool as uncompiled_custom_tool
+
+# Micro-benchmark of the Python overhead of an agent call, without the model.
+#
+# The client is replaced by one that answers instantly with a canned response, so
+# what is left is the work the agent does around the call: building the response
+# model, its JSON schema and validator, and parsing the reply. "before" repeats
+# that work on every call as the agents used to; "after" uses the compiled specs.
+#
+#   python bench_agent_specs.py --calls 2000
+
+CANNED = json.dumps({"score": 0.8, "feedback": "The steps are relevant, clear and in order."})
+
+
+class CannedClient:
+    """Stands in for ollama.Client: every chat call returns the same response."""
+
+    def chat(self, model, messages, **kwargs):
+        return ChatResponse(model=model, message=Message(role="assistant", content=CANNED))
+
+
+def load_samples():
+    # base-agent-samples.py is not importable by name
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "base-agent-samples.py")
+    spec = importlib.util.spec_from_file_location("base_agent_samples", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def uncompiled_run(agent, messages):
+    # StructuredResponseAgent.run before compiled specs
+    full_messages = [{"role": "system", "content": agent.system_prompt}, *messages]
+    pydantic_model = agent.get_pydantic_model()
+    response_text = agent.generate_response(full_messages, format=pydantic_model.model_json_schema()).content
+    return agent.get_pydantic_model().model_validate_json(response_text)
+
+
+def per_call_us(func, calls):
+    func()  # the first call compiles
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call Python overhead of the agents, before and after compiled specs.")
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    samples = load_samples()
+    evaluator = samples.EvaluatorAgent()
+    evaluator.client = CannedClient()
+    weather = samples.WeatherCallingAgent()
+    messages = [{"role": "user", "content": "Evaluate: 1. Read the list. 2. Sort it. 3. Return it."}]
+    assert isinstance(evaluator, StructuredResponseAgent)
+    assert uncompiled_run(evaluator, messages).score == evaluator.run(messages).score
+
+    rows = [
+        ("EvaluatorAgent.run",
+         per_call_us(lambda: uncompiled_run(evaluator, messages), args.calls),
+         per_call_us(lambda: evaluator.run(messages), args.calls)),
+        ("custom_tool(get_current_weather)",
+         per_call_us(lambda: uncompiled_custom_tool(samples.get_current_weather), args.calls),
+         per_call_us(lambda: weather.custom_tool(samples.get_current_weather), args.calls)),
+    ]
+
+    print(colored(f"Per-call overhead over {args.calls} calls (canned model response):", "magenta"))
+    print(f"  {'call':<34} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    for name, before, after in rows:
+        print(f"  {name:<34} {before:>10.1f} {after:>10.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()